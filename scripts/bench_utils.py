@@ -0,0 +1,41 @@
+"""
+Shared harness of the benchmark scripts.
+
+Every case runs in a fresh interpreter (the script itself, with a hidden
+flag naming the case) so peak RSS and imports are not shared between cases;
+the child prints its result as JSON on its last line of output.
+"""
+
+import os
+import sys
+import json
+import resource
+import subprocess
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def forward_args(args, keys):
+    """
+    Command line options reproducing the given attributes of args.
+    """
+    return [arg for key in keys for arg in (f"--{key}", str(getattr(args, key)))]
+
+
+def run_isolated(script, flag, name, forwarded):
+    """
+    Run `script flag name *forwarded` in a fresh interpreter.
+    Returns the JSON result it prints last, None (and prints the error) if it fails.
+    """
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(script), flag, name, *forwarded],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines() or [f"exit code {result.returncode}"]
+        print(f"[ERROR] {name} failed: {lines[-1]}")
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
@@ -0,0 +1,388 @@
+"""
+Benchmark the SfM post-processing and export paths on a synthetic scene.
+
+Every case runs in a fresh process on the same synthetic Fast3R output (see
+src.utils.synthetic), with the ground truth poses so no model or PnP is
+needed. Reports the best wall time of the repeats, throughput, the peak of
+allocations traced during one extra run and the peak RSS of the process.
+Results can be saved as a baseline and later runs compared against it;
+scripts/benchmark_baseline.json is the baseline of the default settings.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_utils import forward_args, peak_rss_mb, run_isolated
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+CONFIG_KEYS = ("views", "height", "width", "confidence", "conf_thr", "voxel_size", "seed")
+
+
+class Context:
+    """
+    Synthetic scene and the Fast3RSfM stages cases need, built on demand
+    and outside of the timed runs.
+    """
+
+    def __init__(self, args, dir):
+        from src.utils.synthetic import synthetic_scene
+
+        self.args = args
+        self.dir = dir
+        self.scene = synthetic_scene(
+            num_views=args.views,
+            height=args.height,
+            width=args.width,
+            confidence=args.confidence,
+            seed=args.seed,
+        )
+        self.num_pixels = args.views * args.height * args.width
+        self._sfm = None
+        self._model = None
+
+    def new_sfm(self):
+        from src.pipeline.sfm.fast3r import Fast3RSfM
+
+        return Fast3RSfM(
+            self.scene.output_dict, self.scene.camera_poses, self.scene.focals
+        )
+
+    @property
+    def sfm(self):
+        """
+        Fast3RSfM run once with the benchmark settings.
+        """
+        if self._sfm is None:
+            self._sfm = self.new_sfm()
+            self._sfm(
+                conf_thr=self.args.conf_thr,
+                downsample=self.args.voxel_size > 0,
+                voxel_size=self.args.voxel_size,
+            )
+        return self._sfm
+
+    @property
+    def num_points(self):
+        return len(self.sfm.pcd.points)
+
+    @property
+    def model(self):
+        """
+        COLMAP model of the reconstruction, as read by read_model.
+        """
+        if self._model is None:
+            from src.utils.io import (
+                read_model,
+                write_cameras_txt,
+                write_images_txt,
+                write_points3D_txt,
+            )
+
+            model = os.path.join(self.dir, "model")
+            write_cameras_txt(self.sfm.cameras, model)
+            write_images_txt(self.sfm.views, model, save_images=False)
+            write_points3D_txt(self.sfm.pcd, model)
+            self._model = read_model(model, ext=".txt")
+        return self._model
+
+
+# Every case takes the context and returns the function to time and the
+# number of items it processes; both are set up outside of the timing.
+
+
+def case_save_views(ctx):
+    sfm = ctx.new_sfm()
+    return sfm.build_views, ctx.args.views
+
+
+def case_inference_to_pcds(ctx):
+    sfm = ctx.new_sfm()
+    return lambda: sfm._inference_to_pcds(ctx.args.conf_thr), ctx.num_pixels
+
+
+def case_downsampling(ctx):
+    sfm = ctx.new_sfm()
+    voxel_size = ctx.args.voxel_size or 0.01
+    return (
+        lambda: sfm._inference_to_pcds(ctx.args.conf_thr, voxel_size),
+        ctx.num_pixels,
+    )
+
+
+def case_rank_points(ctx):
+    sfm = ctx.new_sfm()
+    return sfm.rank_points, ctx.num_pixels
+
+
+def case_sfm(ctx):
+    sfm = ctx.new_sfm()
+    return (
+        lambda: sfm(
+            conf_thr=ctx.args.conf_thr,
+            downsample=ctx.args.voxel_size > 0,
+            voxel_size=ctx.args.voxel_size,
+        ),
+        ctx.num_pixels,
+    )
+
+
+def case_view_qvec_tvec(ctx):
+    views = ctx.sfm.views
+
+    def run():
+        for view in views:
+            view.qvec()
+            view.tvec()
+
+    return run, len(views)
+
+
+def case_poses_qvecs_tvecs(ctx):
+    from src.view.poses import Poses
+
+    views = ctx.sfm.views
+
+    def run():
+        poses = Poses.from_views(views)
+        poses.qvecs()
+        poses.tvecs()
+
+    return run, len(views)
+
+
+def _writer(name):
+    def case(ctx):
+        from src.utils import io
+
+        sfm, dir = ctx.sfm, os.path.join(ctx.dir, name)
+        os.makedirs(dir, exist_ok=True)
+        calls = {
+            "write_cameras_txt": (lambda: io.write_cameras_txt(sfm.cameras, dir), 1),
+            "write_cameras_binary": (
+                lambda: io.write_cameras_binary(sfm.cameras, dir),
+                1,
+            ),
+            "write_images_txt": (
+                lambda: io.write_images_txt(sfm.views, dir, save_images=False),
+                len(sfm.views),
+            ),
+            "write_images_binary": (
+                lambda: io.write_images_binary(sfm.views, dir),
+                len(sfm.views),
+            ),
+            "export_view_images": (
+                lambda: io.export_view_images(sfm.views, dir),
+                len(sfm.views),
+            ),
+            "write_points3D_txt": (
+                lambda: io.write_points3D_txt(sfm.pcd, dir),
+                ctx.num_points,
+            ),
+            "write_points3D_binary": (
+                lambda: io.write_points3D_binary(sfm.pcd, dir),
+                ctx.num_points,
+            ),
+            "write_points3D_ply": (
+                lambda: io.write_points3D_ply(sfm.pcd, dir, confidence=sfm.confidence),
+                ctx.num_points,
+            ),
+            "write_model_txt": (
+                lambda: io.write_model(*ctx.model, dir, ext=".txt"),
+                ctx.num_points,
+            ),
+            "write_model_binary": (
+                lambda: io.write_model(*ctx.model, dir, ext=".bin"),
+                ctx.num_points,
+            ),
+        }
+        return calls[name]
+
+    return case
+
+
+CASES = {
+    "sfm.save_views": (case_save_views, "views"),
+    "sfm.inference_to_pcds": (case_inference_to_pcds, "pixels"),
+    "sfm.downsampling": (case_downsampling, "pixels"),
+    "sfm.rank_points": (case_rank_points, "pixels"),
+    "sfm.total": (case_sfm, "pixels"),
+    "view.qvec_tvec": (case_view_qvec_tvec, "views"),
+    "poses.qvecs_tvecs": (case_poses_qvecs_tvecs, "views"),
+}
+for _name, _unit in [
+    ("write_cameras_txt", "cameras"),
+    ("write_cameras_binary", "cameras"),
+    ("write_images_txt", "views"),
+    ("write_images_binary", "views"),
+    ("export_view_images", "views"),
+    ("write_points3D_txt", "points"),
+    ("write_points3D_binary", "points"),
+    ("write_points3D_ply", "points"),
+    ("write_model_txt", "points"),
+    ("write_model_binary", "points"),
+]:
+    CASES[f"io.{_name}"] = (_writer(_name), _unit)
+
+
+def run(name, args):
+    case, unit = CASES[name]
+    with tempfile.TemporaryDirectory() as dir:
+        ctx = Context(args, dir)
+        seconds = []
+        for _ in range(args.repeat):
+            fn, items = case(ctx)
+            start = time.perf_counter()
+            fn()
+            seconds.append(time.perf_counter() - start)
+
+        # tracing slows Python down, so allocations are traced in a run of their own
+        fn, items = case(ctx)
+        tracemalloc.start()
+        fn()
+        peak_alloc = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    best = min(seconds)
+    return {
+        "case": name,
+        "items": items,
+        "unit": unit,
+        "seconds": best,
+        "items_per_second": items / best if best > 0 else float("inf"),
+        "peak_alloc_mb": peak_alloc / 1024**2,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def config(args):
+    return {key: getattr(args, key) for key in CONFIG_KEYS}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the change of every case against the baseline; returns the names
+    of the cases that got slower or allocate more than tolerance allows.
+    """
+    if baseline["config"] != results["config"]:
+        print(
+            f"[WARNING] Baseline was run with {baseline['config']}, "
+            f"not {results['config']}"
+        )
+    if baseline.get("machine") != results["machine"]:
+        print(f"[WARNING] Baseline was run on {baseline.get('machine')}, not {results['machine']}")
+    regressed = []
+    for name, r in results["cases"].items():
+        b = baseline["cases"].get(name)
+        if b is None:
+            print(f"[INFO] {name:>26}: not in baseline")
+            continue
+        time_ratio = r["seconds"] / b["seconds"] if b["seconds"] > 0 else 1.0
+        memory_ratio = (
+            r["peak_alloc_mb"] / b["peak_alloc_mb"] if b["peak_alloc_mb"] > 0 else 1.0
+        )
+        worse = time_ratio > 1 + tolerance or memory_ratio > 1 + tolerance
+        if worse:
+            regressed.append(name)
+        print(
+            f"[{'ERROR' if worse else 'INFO'}] {name:>26}: "
+            f"{time_ratio:.2f}x time, {memory_ratio:.2f}x peak allocations"
+        )
+    if regressed:
+        print(f"[ERROR] {len(regressed)} regressions over {tolerance:.0%}: {', '.join(regressed)}")
+    else:
+        print(f"[INFO] No regressions over {tolerance:.0%}")
+    return regressed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark Fast3RSfM stages, pose conversion and writers on a synthetic scene."
+    )
+    parser.add_argument("--views", type=int, default=16)
+    parser.add_argument("--height", type=int, default=384)
+    parser.add_argument("--width", type=int, default=512)
+    parser.add_argument(
+        "--confidence",
+        default="exponential",
+        choices=["exponential", "uniform", "lognormal"],
+        help="Distribution of the synthetic confidences.",
+    )
+    parser.add_argument("--conf_thr", type=float, default=0.5)
+    parser.add_argument(
+        "--voxel_size",
+        type=float,
+        default=0.01,
+        help="Voxel size of the reconstruction the writers save, 0 to keep every point.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--cases",
+        nargs="*",
+        default=list(CASES),
+        choices=list(CASES),
+    )
+    parser.add_argument(
+        "--save-baseline",
+        nargs="?",
+        const=BASELINE,
+        help="Save the results to this JSON file, scripts/benchmark_baseline.json if none is given.",
+    )
+    parser.add_argument(
+        "--compare",
+        "--baseline",
+        nargs="?",
+        const=BASELINE,
+        help="Report regressions against this JSON file, scripts/benchmark_baseline.json if none is given.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Relative slowdown or allocation growth over the baseline that fails the run.",
+    )
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run(args.case, args)))
+        sys.exit(0)
+
+    forwarded = forward_args(args, CONFIG_KEYS + ("repeat",))
+    # timings only compare on the same machine
+    machine = {"host": socket.gethostname(), "cpu_count": os.cpu_count()}
+    results = {"config": config(args), "machine": machine, "cases": {}}
+    failed = False
+    # every case runs in a fresh process so peak RSS is not shared
+    for name in args.cases:
+        r = run_isolated(__file__, "--case", name, forwarded)
+        if r is None:
+            failed = True
+            continue
+        results["cases"][name] = r
+        print(
+            f"[INFO] {name:>26}: {r['seconds'] * 1e3:9.2f} ms, "
+            f"{r['items_per_second']:12.0f} {r['unit']}/s, "
+            f"{r['peak_alloc_mb']:8.1f} MB peak allocations, "
+            f"{r['peak_rss_mb']:6.0f} MB peak RSS"
+        )
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"[INFO] Baseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        failed |= bool(compare(results, baseline, args.tolerance))
+
+    sys.exit(1 if failed else 0)
@@ -1,33 +1,219 @@
+"""
+Downscaled image pyramids for 3DGS trainers.
+
+Writes images_2, images_4, ... next to an images folder (originals are kept).
+Every image is decoded once (JPEGs at the smallest scale the largest level
+needs) and all of its levels are written from it, on a process pool.
+A manifest of source sizes and modification times (or content hashes)
+lets reruns skip images whose outputs are up to date.
+"""
+
 from PIL import Image
+import io
 import os
+import json
+import time
+import hashlib
 import argparse
 
+from concurrent.futures import ProcessPoolExecutor
+
 supported_formats = (".png", ".jpg", ".jpeg")
+MANIFEST = ".pyramid.json"
+
+
+def level_dirs(folder, factors, max_size=None, output=None):
+    """
+    Output folder of every level: {output}/{name}_{factor} for every factor,
+    and {output}/{name}_max{max_size} if max_size is set. output defaults to
+    the parent of folder.
+    """
+    folder = os.path.normpath(folder)
+    output = output or os.path.dirname(folder)
+    name = os.path.basename(folder)
+    levels = [(os.path.join(output, f"{name}_{factor}"), factor, None) for factor in factors]
+    if max_size:
+        levels.append((os.path.join(output, f"{name}_max{max_size}"), None, max_size))
+    return levels
+
+
+def level_size(w, h, factor=None, max_size=None):
+    if max_size:
+        scale = min(1.0, max_size / max(w, h))
+        return max(1, int(w * scale)), max(1, int(h * scale))
+    return max(1, round(w / factor)), max(1, round(h / factor))
+
+
+def source_stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def resize_image(path, levels, quality=95, with_hash=False):
+    """
+    Decode the image at path once and write every level of it.
+    Returns the source stat, its SHA-256 (if with_hash) and the level sizes.
+    """
+    stat = source_stat(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest() if with_hash else None
+
+    filename = os.path.basename(path)
+    with Image.open(io.BytesIO(data)) as img:
+        w, h = img.size
+        sizes = [level_size(w, h, factor, max_size) for _, factor, max_size in levels]
+        # JPEGs decode directly at a reduced scale, still at least the largest level
+        img.draft(None, (max(s[0] for s in sizes), max(s[1] for s in sizes)))
+        img.load()
+        for (dir, _, _), size in zip(levels, sizes):
+            resized = img.resize(size, Image.LANCZOS, reducing_gap=3.0)
+            # rename into place, an interrupted run never leaves a partial image
+            root, ext = os.path.splitext(filename)
+            tmp = os.path.join(dir, f".{root}.tmp{ext}")
+            resized.save(tmp, quality=quality)
+            os.replace(tmp, os.path.join(dir, filename))
+    return stat, digest, sizes
+
+
+def _load_manifest(path, config):
+    try:
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # other levels or quality, every image is stale
+    if manifest.get("config") != config:
+        return {}
+    return manifest.get("images", {})
+
+
+def _save_manifest(path, config, images):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"config": config, "images": images}, f, indent=1)
+    os.replace(tmp, path)
+
+
+def _file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
 
+def build_pyramid(
+    folder,
+    factors=(2, 4, 8),
+    max_size=None,
+    output=None,
+    workers=None,
+    quality=95,
+    use_hash=False,
+    force=False,
+):
+    """
+    Write every level of every image in folder, see level_dirs.
+    An image is skipped if its size and modification time match the
+    manifest (or, with use_hash, its content does) and all its levels exist.
+    Returns the number of resized and skipped images.
+    """
+    levels = level_dirs(folder, factors, max_size, output)
+    for dir, _, _ in levels:
+        os.makedirs(dir, exist_ok=True)
+    manifest_path = os.path.join(output or os.path.dirname(os.path.normpath(folder)), MANIFEST)
+    config = {
+        "folder": os.path.abspath(folder),
+        "levels": [[os.path.abspath(dir), factor, max_size] for dir, factor, max_size in levels],
+        "quality": quality,
+    }
+    images = {} if force else _load_manifest(manifest_path, config)
 
-def resize_images(folder, max_size):
-    for filename in os.listdir(folder):
-        if filename.lower().endswith(supported_formats):
-            filepath = os.path.join(folder, filename)
+    todo, skipped = [], 0
+    for filename in sorted(os.listdir(folder)):
+        if not filename.lower().endswith(supported_formats):
+            continue
+        path = os.path.join(folder, filename)
+        entry = images.get(filename)
+        up_to_date = entry is not None and all(
+            os.path.exists(os.path.join(dir, filename)) for dir, _, _ in levels
+        )
+        if up_to_date and entry["stat"] != source_stat(path):
+            # touched or copied, but possibly the same content
+            up_to_date = use_hash and entry.get("sha256") == _file_hash(path)
+            if up_to_date:
+                entry["stat"] = source_stat(path)
+        if up_to_date:
+            skipped += 1
+        else:
+            todo.append(filename)
 
-            with Image.open(filepath) as img:
-                w, h = img.size
-                scale = max_size / max(w, h)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        results = pool.map(
+            resize_image,
+            [os.path.join(folder, filename) for filename in todo],
+            [levels] * len(todo),
+            [quality] * len(todo),
+            [use_hash] * len(todo),
+            chunksize=max(1, len(todo) // (4 * (workers or os.cpu_count() or 1))),
+        )
+        for filename, (stat, digest, sizes) in zip(todo, results):
+            images[filename] = {"stat": stat, "sha256": digest, "sizes": sizes}
 
-                if scale < 1.0:
-                    new_w = int(w * scale)
-                    new_h = int(h * scale)
-                    resized_img = img.resize((new_w, new_h), Image.LANCZOS)
-                    resized_img.save(filepath)
-                    print(f"Resized {filename} to {new_w}x{new_h}")
-                else:
-                    print(f"Skipped {filename}, size {w}x{h}")
+    # images removed from the folder are forgotten
+    names = set(os.listdir(folder))
+    images = {filename: entry for filename, entry in images.items() if filename in names}
+    _save_manifest(manifest_path, config, images)
+    return len(todo), skipped
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Resize images to max size.")
+    parser = argparse.ArgumentParser(
+        description="Write downscaled copies of images (images_2, images_4, ...) in parallel."
+    )
     parser.add_argument("folder", type=str)
-    parser.add_argument("--max_size", type=int, default=1000)
+    parser.add_argument(
+        "--factors",
+        type=int,
+        nargs="*",
+        default=[2, 4, 8],
+        help="Downscaling factors, one {folder}_{factor} folder each.",
+    )
+    parser.add_argument(
+        "--max_size",
+        type=int,
+        default=None,
+        help="Also write {folder}_max{max_size} with the longer side capped at max_size.",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Folder of the levels, the parent of folder by default.",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Processes, all cores by default.")
+    parser.add_argument("--quality", type=int, default=95, help="JPEG quality of the levels.")
+    parser.add_argument(
+        "--hash",
+        action="store_true",
+        help="Compare content hashes of images whose size or modification time changed.",
+    )
+    parser.add_argument("--force", action="store_true", help="Rewrite every image.")
     args = parser.parse_args()
 
-    resize_images(args.folder, args.max_size)
+    start = time.perf_counter()
+    resized, skipped = build_pyramid(
+        args.folder,
+        args.factors,
+        args.max_size,
+        args.output,
+        args.workers,
+        args.quality,
+        args.hash,
+        args.force,
+    )
+    print(
+        f"[INFO] Resized {resized} images, skipped {skipped} up to date, "
+        f"in {time.perf_counter() - start:.2f} seconds"
+    )
@@ -1,17 +1,22 @@
 import open3d as o3d
 import numpy as np
 
+import os
+import sys
 import argparse
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 
 def estimate_scale(A, B):
-    A_mean = A.mean(0)
-    B_mean = B.mean(0)
-    A_centered = A - A_mean
-    B_centered = B - B_mean
+    """
+    Ratio of the spreads of (..., N, 3) B and A, batched over leading axes.
+    """
+    A_centered = A - A.mean(-2, keepdims=True)
+    B_centered = B - B.mean(-2, keepdims=True)
 
-    norm_A = np.linalg.norm(A_centered)
-    norm_B = np.linalg.norm(B_centered)
+    norm_A = np.linalg.norm(A_centered, axis=(-2, -1))
+    norm_B = np.linalg.norm(B_centered, axis=(-2, -1))
 
     return norm_B / norm_A
 
@@ -40,6 +45,12 @@ if __name__ == "__main__":
         default=1000,
         help="Number of experiments to run for scale estimation.",
     )
+    parser.add_argument(
+        "--icp",
+        action="store_true",
+        help="Also estimate a similarity transform by nearest neighbour alignment.",
+        default=False,
+    )
     args = parser.parse_args()
 
     ply1_init = o3d.t.io.read_point_cloud(args.pointcloud1, format="ply")
@@ -60,15 +71,19 @@ if __name__ == "__main__":
     cl, ind = ply2.remove_statistical_outlier(nb_neighbors=20, std_ratio=2.0)
     ply2 = ply2.select_by_index(ind)
 
-    scales = []
+    A = np.asarray(ply1.points)
+    B = np.asarray(ply2.points)
 
-    for i in range(args.n_experiments):
-        A = np.asarray(ply1.points)
-        B = np.asarray(ply2.points)
+    # all experiments in one batch, 1000 points of both clouds each
+    rng = np.random.default_rng()
+    A = A[rng.integers(0, len(A), size=(args.n_experiments, 1000))]
+    B = B[rng.integers(0, len(B), size=(args.n_experiments, 1000))]
 
-        A = A[np.random.choice(len(A), 1000, replace=False)]
-        B = B[np.random.choice(len(B), 1000, replace=False)]
-
-        scales.append(estimate_scale(A, B))
-    scale = np.mean(scales)
+    scale = np.mean(estimate_scale(A, B))
     print(f"Estimated scale from sparse to dense: {scale}")
+
+    if args.icp:
+        from src.utils.alignment import icp_sim3
+
+        sim3, error = icp_sim3(np.asarray(ply1.points), np.asarray(ply2.points))
+        print(f"ICP scale from sparse to dense: {sim3.scale} (mean distance {error})")
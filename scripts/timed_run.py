@@ -1,10 +1,40 @@
+"""
+Benchmark a command on data directories.
+
+Every run records wall time (monotonic clock), CPU time and peak RSS of the
+command and its waited-for children (wait4), and its exit status. Warmup
+runs are not recorded. Data directories can run concurrently, each pinned
+to its own CPUs. Results are saved as JSON (runs and summary) and CSV (runs),
+and can be compared against the JSON of a previous run.
+"""
+
+import os
+import csv
+import json
 import time
+import queue
+import socket
+import contextlib
 import argparse
+import tempfile
 import subprocess
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from tqdm import tqdm
 
+RUN_FIELDS = [
+    "data_dir",
+    "run",
+    "returncode",
+    "wall_seconds",
+    "user_seconds",
+    "system_seconds",
+    "cpu_seconds",
+    "max_rss_mb",
+    "cpus",
+]
+
 
 def mean(lst):
     return sum(lst) / len(lst) if lst else 0
@@ -17,14 +47,124 @@ def std(lst):
     return (sum((x - mean_value) ** 2 for x in lst) / (len(lst) - 1)) ** 0.5
 
 
-def execute(command):
-    result = subprocess.run([command], capture_output=True, text=True, shell=True)
-    # if result.stderr:
-    #     print("[INFO] Error occured during command execution")
-    #     print(result.stderr)
-    #     print("[INFO] Command that failed:")
-    #     print(command)
-    # return not bool(result.stderr)
+def median(lst):
+    if not lst:
+        return 0
+    s = sorted(lst)
+    mid = len(s) // 2
+    return s[mid] if len(s) % 2 else (s[mid - 1] + s[mid]) / 2
+
+
+def execute(command, cpus=None, log=None):
+    """
+    Run command in a shell, pinned to cpus if given, and wait for it.
+    Output goes to the log file if given; the end of stderr is printed if
+    the command fails.
+    Returns the exit code (negative for a signal), wall, user and system
+    seconds and peak RSS in MB of the command and its children.
+    """
+    args = ["/bin/sh", "-c", command]
+    if cpus:
+        # taskset pins before exec'ing the shell, so every child inherits the CPUs;
+        # unlike preexec_fn, it is safe while other threads run
+        args = ["taskset", "-c", ",".join(map(str, sorted(cpus))), *args]
+    with tempfile.TemporaryFile() as stderr, (
+        open(log, "wb") if log else contextlib.nullcontext(subprocess.DEVNULL)
+    ) as out:
+        start = time.perf_counter()
+        process = subprocess.Popen(args, stdout=out, stderr=out if log else stderr)
+        # wait4 reports the resources of the shell and everything it waited for
+        _, status, rusage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+        if process.returncode != 0:
+            stderr.seek(0)
+            tail = stderr.read().decode(errors="replace").strip().splitlines()[-5:]
+            print(f"[WARNING] {command} exited with {process.returncode}")
+            for line in tail:
+                print(f"[WARNING]   {line}")
+
+    return {
+        "returncode": process.returncode,
+        "wall_seconds": wall,
+        "user_seconds": rusage.ru_utime,
+        "system_seconds": rusage.ru_stime,
+        "cpu_seconds": rusage.ru_utime + rusage.ru_stime,
+        # kilobytes on Linux
+        "max_rss_mb": rusage.ru_maxrss / 1024,
+    }
+
+
+def benchmark(command, data_dir, times, warmup, cpus=None, log_dir=None):
+    """
+    Run command on data_dir warmup times unrecorded, then times recorded.
+    """
+    for _ in range(warmup):
+        execute(f"{command} {data_dir}", cpus)
+    runs = []
+    for i in range(times):
+        log = None
+        if log_dir:
+            log = os.path.join(log_dir, f"{os.path.basename(os.path.normpath(data_dir))}_{i}.log")
+        run = execute(f"{command} {data_dir}", cpus, log)
+        runs.append({"data_dir": data_dir, "run": i, **run, "cpus": sorted(cpus) if cpus else None})
+    return runs
+
+
+def cpu_groups(jobs):
+    """
+    Split the CPUs this process may use into jobs disjoint groups.
+    """
+    cpus = sorted(os.sched_getaffinity(0))
+    if jobs > len(cpus):
+        raise ValueError(f"Cannot pin {jobs} jobs to {len(cpus)} CPUs")
+    return [set(cpus[i::jobs]) for i in range(jobs)]
+
+
+def summarize(runs):
+    """
+    Per data directory statistics over the successful runs.
+    """
+    by_dir = defaultdict(list)
+    for run in runs:
+        by_dir[run["data_dir"]].append(run)
+    summary = {}
+    for data_dir, dir_runs in by_dir.items():
+        ok = [r for r in dir_runs if r["returncode"] == 0]
+        walls = [r["wall_seconds"] for r in ok]
+        summary[data_dir] = {
+            "runs": len(dir_runs),
+            "failures": len(dir_runs) - len(ok),
+            "wall_mean": mean(walls),
+            "wall_std": std(walls),
+            "wall_median": median(walls),
+            "wall_min": min(walls) if walls else 0,
+            "cpu_mean": mean([r["cpu_seconds"] for r in ok]),
+            "max_rss_mb": max((r["max_rss_mb"] for r in ok), default=0),
+        }
+    return summary
+
+
+def compare(summary, baseline):
+    """
+    Print median wall and CPU time and peak RSS against the baseline summary.
+    A difference within two standard deviations of either run is noise.
+    """
+    for data_dir, s in summary.items():
+        b = baseline.get(data_dir)
+        if b is None or not b["wall_median"] or not s["wall_median"]:
+            print(f"[INFO] {data_dir}: no baseline")
+            continue
+        diff = s["wall_median"] - b["wall_median"]
+        noise = 2 * max(s["wall_std"], b["wall_std"])
+        verdict = "within noise" if abs(diff) <= noise else ("slower" if diff > 0 else "faster")
+        print(
+            f"[INFO] {data_dir}: wall {s['wall_median']:.2f} s vs {b['wall_median']:.2f} s "
+            f"({s['wall_median'] / b['wall_median']:.2f}x, {verdict}), "
+            f"CPU {s['cpu_mean']:.2f} s vs {b['cpu_mean']:.2f} s, "
+            f"peak RSS {s['max_rss_mb']:.0f} MB vs {b['max_rss_mb']:.0f} MB"
+        )
 
 
 if __name__ == "__main__":
@@ -36,31 +176,85 @@ if __name__ == "__main__":
     parser.add_argument(
         "--times", type=int, default=1, help="Number of times to run the command."
     )
+    parser.add_argument(
+        "--warmup", type=int, default=0, help="Unrecorded runs before the timed ones."
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=1, help="Data directories to run concurrently."
+    )
+    parser.add_argument(
+        "--pin",
+        action="store_true",
+        help="Pin every concurrent job to its own share of the CPUs.",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="timed_run_results",
+        help="Results are saved to {output}.json and {output}.csv.",
+    )
+    parser.add_argument("--log-dir", type=str, default=None, help="Save the output of every run.")
+    parser.add_argument("--compare", type=str, default=None, help="JSON results to compare against.")
     args = parser.parse_args()
 
-    results = defaultdict(list)
-    for data_dir in tqdm(args.data_dirs):
-        for i in range(args.times):
-            start_time = time.time()
-            command = f"{args.command} {data_dir}"
-            # print(f"Running command: {command} (Run {i + 1}/{args.times})")
-            execute(command)
-            end_time = time.time()
-            elapsed_time = end_time - start_time
-            results[data_dir].append(elapsed_time)
-            # print(f"[INFO] Elapsed time for run {i + 1}: {elapsed_time:.2f} seconds")
-        print("[INFO] All commands executed successfully for {data_dir}.")
-        print(results[data_dir])
-
-    res = ""
-    for data_dir, times in results.items():
-        tmp = ""
-        tmp += f"[INFO] Summary for {data_dir}:\n"
-        tmp += f"[INFO]   Mean elapsed time: {mean(times):.2f} seconds\n"
-        tmp += f"[INFO]   Standard deviation: {std(times):.2f} seconds\n"
-        tmp += f"[INFO]   All elapsed times: {', '.join(f'{t:.2f}' for t in times)}\n"
-        res += tmp
-        res += "\n"
-        print(tmp)
-    with open("timed_run_results.txt", "w") as f:
-        f.write(res)
+    if args.log_dir:
+        os.makedirs(args.log_dir, exist_ok=True)
+    groups = queue.Queue()
+    for group in cpu_groups(args.jobs) if args.pin else [None] * args.jobs:
+        groups.put(group)
+
+    def job(data_dir):
+        cpus = groups.get()
+        try:
+            return benchmark(args.command, data_dir, args.times, args.warmup, cpus, args.log_dir)
+        finally:
+            groups.put(cpus)
+
+    started = time.strftime("%Y-%m-%dT%H:%M:%S")
+    runs = []
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(job, data_dir): data_dir for data_dir in args.data_dirs}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            dir_runs = future.result()
+            runs.extend(dir_runs)
+            failures = sum(r["returncode"] != 0 for r in dir_runs)
+            if failures:
+                print(f"[WARNING] {failures}/{len(dir_runs)} runs failed for {futures[future]}.")
+            else:
+                print(f"[INFO] All commands executed successfully for {futures[future]}.")
+    runs.sort(key=lambda r: (args.data_dirs.index(r["data_dir"]), r["run"]))
+
+    summary = summarize(runs)
+    for data_dir, s in summary.items():
+        print(f"[INFO] Summary for {data_dir}:")
+        print(f"[INFO]   Successful runs: {s['runs'] - s['failures']}/{s['runs']}")
+        print(f"[INFO]   Median elapsed time: {s['wall_median']:.2f} seconds")
+        print(f"[INFO]   Mean elapsed time: {s['wall_mean']:.2f} seconds")
+        print(f"[INFO]   Standard deviation: {s['wall_std']:.2f} seconds")
+        print(f"[INFO]   Mean CPU time: {s['cpu_mean']:.2f} seconds")
+        print(f"[INFO]   Peak RSS: {s['max_rss_mb']:.0f} MB")
+
+    results = {
+        "command": args.command,
+        "times": args.times,
+        "warmup": args.warmup,
+        "jobs": args.jobs,
+        "pin": args.pin,
+        "host": socket.gethostname(),
+        "cpu_count": os.cpu_count(),
+        "started": started,
+        "runs": runs,
+        "summary": summary,
+    }
+    with open(f"{args.output}.json", "w") as f:
+        json.dump(results, f, indent=1)
+    with open(f"{args.output}.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=RUN_FIELDS)
+        writer.writeheader()
+        for run in runs:
+            writer.writerow({**run, "cpus": " ".join(map(str, run["cpus"] or []))})
+    print(f"[INFO] Results saved to {args.output}.json and {args.output}.csv")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(summary, json.load(f)["summary"])
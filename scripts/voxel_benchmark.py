@@ -0,0 +1,94 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_utils import forward_args, peak_rss_mb, run_isolated
+
+METHODS = ["numpy", "numpy-incremental", "open3d"]
+
+
+def make_points(n_points, seed=0):
+    """
+    Clustered points, roughly like a Fast3R point map.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(-1, 1, size=(64, 3))
+    points = centers[rng.integers(0, len(centers), n_points)]
+    points += rng.normal(scale=0.1, size=(n_points, 3))
+    colors = rng.integers(0, 256, size=(n_points, 3)).astype(np.uint8)
+    confidence = 1 + rng.exponential(size=n_points)
+    return points, colors, confidence
+
+
+def run(method, n_points, voxel_size, batches):
+    points, colors, confidence = make_points(n_points)
+    base_rss = peak_rss_mb()
+
+    start = time.perf_counter()
+    if method == "numpy":
+        from src.utils.pointcloud import voxel_downsample
+
+        out = voxel_downsample(points, colors, voxel_size, confidence)[0]
+    elif method == "numpy-incremental":
+        from src.utils.pointcloud import VoxelGrid
+
+        grid = VoxelGrid(voxel_size)
+        for idx in np.array_split(np.arange(n_points), batches):
+            grid.add(points[idx], colors[idx], confidence[idx])
+        out = grid.result()[0]
+    elif method == "open3d":
+        import open3d as o3d
+
+        pcd = o3d.geometry.PointCloud()
+        pcd.points = o3d.utility.Vector3dVector(points)
+        pcd.colors = o3d.utility.Vector3dVector(colors / 255.0)
+        out = pcd.voxel_down_sample(voxel_size=voxel_size).points
+    elapsed = time.perf_counter() - start
+
+    return {
+        "method": method,
+        "points": n_points,
+        "voxels": len(out),
+        "seconds": elapsed,
+        "mpoints_per_second": n_points / elapsed / 1e6,
+        "peak_rss_mb": peak_rss_mb() - base_rss,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare voxel downsampling throughput and peak memory."
+    )
+    parser.add_argument("--points", type=int, default=10_000_000)
+    parser.add_argument("--voxel_size", type=float, default=0.01)
+    parser.add_argument(
+        "--batches",
+        type=int,
+        default=32,
+        help="Number of batches for the incremental mode.",
+    )
+    parser.add_argument("--methods", nargs="*", default=METHODS, choices=METHODS)
+    parser.add_argument("--method", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.method:
+        print(json.dumps(run(args.method, args.points, args.voxel_size, args.batches)))
+        sys.exit(0)
+
+    # every method runs in a fresh process so peak RSS is not shared
+    forwarded = forward_args(args, ("points", "voxel_size", "batches"))
+    for method in args.methods:
+        r = run_isolated(__file__, "--method", method, forwarded)
+        if r is None:
+            continue
+        print(
+            f"[INFO] {method:>18}: {r['seconds']:.2f} s, "
+            f"{r['mpoints_per_second']:.2f} Mpts/s, "
+            f"+{r['peak_rss_mb']:.0f} MB peak RSS, {r['voxels']} voxels"
+        )
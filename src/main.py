@@ -1,70 +1,498 @@
+"""
+Command line entry point
+
+    python -m src.main reconstruct -i data -o output
+    python -m src.main export --artifact artifact -o output
+    python -m src.main convert output output_bin --to bin
+    python -m src.main inspect output
+
+Every command imports only the heavy modules it needs: convert and inspect
+never load torch, open3d, cv2 or fast3r, export does not load fast3r.
+"""
+
 import argparse
+import json
+import os
+import sys
+
+COMMANDS = ("reconstruct", "export", "convert", "inspect")
+# src.pipeline.precision.PRECISIONS, not imported to keep startup light
+PRECISIONS = ("fp32", "bf16", "int8")
+
+
+def _add_export_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--output",
+        "-o",
+        type=str,
+        help="Path to the output directory to save results.",
+        default="output",
+    )
+    parser.add_argument(
+        "--confidence",
+        type=float,
+        help="Fraction of the least confident points of every view to drop.",
+        default=0.1,
+    )
+    parser.add_argument(
+        "--voxel-size",
+        type=float,
+        help="Voxel size of the point cloud downsampling, 0 disables downsampling.",
+        default=0.01,
+    )
+    parser.add_argument(
+        "--image-format",
+        type=str,
+        help="Extension of the exported images, e.g. .png or .jpg.",
+        default=None,
+    )
+    parser.add_argument(
+        "--image-quality",
+        type=int,
+        help="JPEG/WebP quality or PNG compression level of the exported images.",
+        default=None,
+    )
+    parser.add_argument(
+        "--ply",
+        action="store_true",
+        help="Also save the point cloud as binary points3D.ply.",
+        default=False,
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Also save the point cloud in the compact quantized format.",
+        default=False,
+    )
+    parser.add_argument(
+        "--sweep-confidence",
+        type=float,
+        nargs="+",
+        help="Export one model per confidence threshold (and voxel size).",
+        default=None,
+    )
+    parser.add_argument(
+        "--sweep-voxel-size",
+        type=float,
+        nargs="+",
+        help="Export one model per voxel size (and confidence threshold), 0 disables downsampling.",
+        default=None,
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        help="Directory to save a Chrome trace and a summary of every stage to.",
+        default=None,
+    )
+    parser.add_argument(
+        "--pnp-workers",
+        type=int,
+        help="Threads solving per-view PnP, all cores by default.",
+        default=None,
+    )
+    parser.add_argument(
+        "--pnp-early-stop",
+        action="store_true",
+        help="Cap the RANSAC iterations of every view by its confidence map.",
+        default=False,
+    )
+    parser.add_argument(
+        "--reference",
+        type=str,
+        help="COLMAP model to align the result to (by image names) instead of the fixed scale.",
+        default=None,
+    )
+    parser.add_argument(
+        "--outliers",
+        type=str,
+        choices=["statistical", "radius"],
+        help="Remove outlier points after downsampling.",
+        default=None,
+    )
+    parser.add_argument(
+        "--outlier-neighbors",
+        type=int,
+        help="Neighbours of the statistical outlier removal.",
+        default=20,
+    )
+    parser.add_argument(
+        "--outlier-std-ratio",
+        type=float,
+        help="Standard deviations of the mean neighbour distance a point may exceed.",
+        default=2.0,
+    )
+    parser.add_argument(
+        "--outlier-radius",
+        type=float,
+        help="Radius of the radius outlier removal, in the units of --voxel-size.",
+        default=0.05,
+    )
+    parser.add_argument(
+        "--outlier-min-neighbors",
+        type=int,
+        help="Points a point needs within --outlier-radius to be kept.",
+        default=8,
+    )
 
-import torch
-import open3d as o3d
 
-from fast3r.dust3r.utils.image import load_images
-from fast3r.dust3r.inference_multiview import inference
-from fast3r.models.fast3r import Fast3R
-from fast3r.models.multiview_dust3r_module import MultiViewDUSt3RLitModule
+def _finish(tracer, args: argparse.Namespace) -> None:
+    for stage, seconds in tracer.timings().items():
+        print(f"[INFO] {stage}: {seconds:.2f} seconds")
+    if args.trace:
+        tracer.save(args.trace)
+        print(f"[INFO] Trace saved to {args.trace}")
 
-from src.pipeline.sfm.fast3r import Fast3RSfM
-from src.utils.io import write_cameras_txt, write_images_txt, write_points3D_txt
 
+def _outliers(args: argparse.Namespace):
+    from src.utils.pointcloud import OutlierRemoval
 
-if __name__ == "__main__":
+    if args.outliers is None:
+        return None
+    return OutlierRemoval(
+        method=args.outliers,
+        nb_neighbors=args.outlier_neighbors,
+        std_ratio=args.outlier_std_ratio,
+        radius=args.outlier_radius,
+        min_neighbors=args.outlier_min_neighbors,
+    )
+
+
+def _sweep(sfm, args: argparse.Namespace) -> None:
+    from src.pipeline.sweep import sweep
+
+    with sfm.tracer.stage("sweep"):
+        sweep(
+            sfm,
+            args.output,
+            args.sweep_confidence or [args.confidence],
+            args.sweep_voxel_size or [args.voxel_size],
+            image_format=args.image_format,
+            image_quality=args.image_quality,
+            ply=args.ply,
+            outliers=_outliers(args),
+            compact=args.compact,
+        )
+
+
+def run_reconstruct(args: argparse.Namespace) -> None:
+    from src.pipeline.reconstruct import (
+        check_precision,
+        load_model,
+        reconstruct,
+        run_inference,
+    )
+    from src.pipeline.sfm.fast3r import Fast3RSfM
+    from src.utils.image_cache import ImageCache
+    from src.utils.tracing import Tracer
+
+    tracer = Tracer()
+
+    cache = None
+    if args.cache_dir:
+        cache = ImageCache(
+            args.cache_dir,
+            max_bytes=(
+                int(args.cache_size * (1 << 30)) if args.cache_size is not None else None
+            ),
+        )
+
+    if args.check_precision:
+        model, lit_module, device = load_model()
+        report = check_precision(
+            model,
+            lit_module,
+            device,
+            args.input,
+            args.precision,
+            confidence=args.confidence,
+            cache=cache,
+        )
+        for name, value in report.items():
+            print(f"[INFO] {name}: {value:.6g}")
+        return
+
+    with tracer.stage("load_model"):
+        model, lit_module, device = load_model(precision=args.precision)
+    if args.sweep_confidence or args.sweep_voxel_size:
+        output_dict = run_inference(
+            model,
+            lit_module,
+            device,
+            args.input,
+            confidence=args.confidence,
+            window=args.window,
+            overlap=args.overlap,
+            memory_budget=args.memory_budget,
+            cache=cache,
+            precision=args.precision,
+            tracer=tracer,
+        )
+        _sweep(
+            Fast3RSfM(
+                output_dict,
+                pnp_workers=args.pnp_workers,
+                pnp_early_stop=args.pnp_early_stop,
+                tracer=tracer,
+                reference=args.reference,
+            ),
+            args,
+        )
+        _finish(tracer, args)
+        return
+
+    reconstruct(
+        model,
+        lit_module,
+        device,
+        args.input,
+        args.output,
+        confidence=args.confidence,
+        voxel_size=args.voxel_size,
+        window=args.window,
+        overlap=args.overlap,
+        memory_budget=args.memory_budget,
+        cache=cache,
+        image_format=args.image_format,
+        image_quality=args.image_quality,
+        ply=args.ply,
+        compact=args.compact,
+        artifact=args.save_artifact,
+        precision=args.precision,
+        pnp_workers=args.pnp_workers,
+        pnp_early_stop=args.pnp_early_stop,
+        tracer=tracer,
+        reference=args.reference,
+        outliers=_outliers(args),
+    )
+    _finish(tracer, args)
+
+
+def run_export(args: argparse.Namespace) -> None:
+    from src.utils.tracing import Tracer
+
+    tracer = Tracer()
+    if args.sweep_confidence or args.sweep_voxel_size:
+        from src.pipeline.artifact import load_inference
+        from src.pipeline.sfm.fast3r import Fast3RSfM
+
+        with tracer.stage("load_artifact"):
+            output_dict, camera_poses, focals = load_inference(args.artifact)
+        _sweep(
+            Fast3RSfM(
+                output_dict,
+                camera_poses,
+                focals,
+                pnp_workers=args.pnp_workers,
+                pnp_early_stop=args.pnp_early_stop,
+                tracer=tracer,
+                reference=args.reference,
+            ),
+            args,
+        )
+    else:
+        from src.pipeline.reconstruct import reconstruct_from_artifact
+
+        reconstruct_from_artifact(
+            args.artifact,
+            args.output,
+            confidence=args.confidence,
+            voxel_size=args.voxel_size,
+            image_format=args.image_format,
+            image_quality=args.image_quality,
+            ply=args.ply,
+            compact=args.compact,
+            pnp_workers=args.pnp_workers,
+            pnp_early_stop=args.pnp_early_stop,
+            tracer=tracer,
+            reference=args.reference,
+            outliers=_outliers(args),
+        )
+    _finish(tracer, args)
+
+
+def run_convert(args: argparse.Namespace) -> None:
+    from src.utils.io import read_model, write_model, write_vertices_ply
+
+    cameras, images, points3D = read_model(args.input)
+    if args.to == "ply":
+        os.makedirs(args.output, exist_ok=True)
+        write_vertices_ply(f"{args.output}/points3D.ply", points3D.xyz, points3D.rgb)
+    else:
+        write_model(cameras, images, points3D, args.output, ext=f".{args.to}")
+    print(f"[INFO] Saved {len(points3D.ids)} points to {args.output} as {args.to}")
+
+
+def _describe_points(xyz) -> None:
+    if len(xyz):
+        print(f"[INFO] bounds: {xyz.min(axis=0).tolist()} - {xyz.max(axis=0).tolist()}")
+
+
+def run_inspect(args: argparse.Namespace) -> None:
+    import numpy as np
+
+    path = args.path
+    if os.path.isfile(os.path.join(path, "manifest.json")):
+        with open(os.path.join(path, "manifest.json"), "r") as f:
+            manifest = json.load(f)
+        print(f"[INFO] inference artifact, {manifest['num_views']} views")
+        print(f"[INFO] poses: {'saved' if manifest['poses'] else 'not saved'}")
+        for prefix in ("preds", "views"):
+            for key, entry in manifest[prefix].items():
+                if entry["kind"] == "stacked":
+                    array = np.load(
+                        os.path.join(path, f"{prefix}.{key}.npy"), mmap_mode="r"
+                    )
+                    print(f"[INFO] {prefix}.{key}: {array.dtype} {array.shape}")
+                else:
+                    print(f"[INFO] {prefix}.{key}: {entry['kind']}")
+    elif os.path.isdir(path):
+        from src.utils.io import read_model
+
+        cameras, images, points3D = read_model(path)
+        for id, model, width, height, params in zip(
+            cameras.ids, cameras.models, cameras.widths, cameras.heights, cameras.params
+        ):
+            print(f"[INFO] camera {id}: {model} {width}x{height} {params.tolist()}")
+        print(
+            f"[INFO] images: {len(images.ids)}, "
+            f"{images.points2D_offsets[-1]} 2D points"
+        )
+        track_lengths = np.diff(points3D.track_offsets)
+        print(
+            f"[INFO] points: {len(points3D.ids)}, mean track length "
+            f"{track_lengths.mean() if len(track_lengths) else 0:.2f}"
+        )
+        _describe_points(points3D.xyz)
+    elif path.endswith(".ply"):
+        from src.utils.io import read_ply
+
+        vertices = read_ply(path)
+        print(f"[INFO] vertices: {len(vertices)}, properties: {vertices.dtype.names}")
+        if {"x", "y", "z"} <= set(vertices.dtype.names):
+            _describe_points(np.stack([vertices[axis] for axis in "xyz"], axis=1))
+    elif path.endswith(".gspc"):
+        from src.utils.compact import CompactPointCloud
+
+        pcd = CompactPointCloud.load(path)
+        print(
+            f"[INFO] points: {len(pcd)}, chunks: {pcd.num_chunks}, "
+            f"{pcd.nbytes / len(pcd) if len(pcd) else 0:.1f} bytes per point, "
+            f"confidence: {pcd.confidence is not None}"
+        )
+        if pcd.num_chunks:
+            print(
+                f"[INFO] bounds: {pcd.chunk_min.min(axis=0).tolist()} - "
+                f"{pcd.chunk_max.max(axis=0).tolist()}"
+            )
+    else:
+        raise ValueError(f"Cannot inspect {path}")
+
+
+def main(argv=None) -> None:
     parser = argparse.ArgumentParser(
         description="Inference and save results from Fast3R model."
     )
-    parser.add_argument(
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    reconstruct_parser = subparsers.add_parser(
+        "reconstruct", help="Run Fast3R on images and export a COLMAP model."
+    )
+    reconstruct_parser.add_argument(
         "--input",
         "-i",
         type=str,
         help="Path to the input directory containing images.",
         default="data",
     )
-    parser.add_argument(
-        "--output",
-        "-o",
+    _add_export_args(reconstruct_parser)
+    reconstruct_parser.add_argument(
+        "--window",
+        type=int,
+        help="Run inference on overlapping windows of this many images.",
+        default=None,
+    )
+    reconstruct_parser.add_argument(
+        "--overlap",
+        type=int,
+        help="Number of images shared by consecutive windows.",
+        default=4,
+    )
+    reconstruct_parser.add_argument(
+        "--memory-budget",
+        type=float,
+        help="Inference memory budget in GB, picks the window size if --window is not set.",
+        default=None,
+    )
+    reconstruct_parser.add_argument(
+        "--cache-dir",
         type=str,
-        help="Path to the output directory to save results.",
-        default="output",
+        help="Directory caching decoded and resized input images between runs.",
+        default=None,
     )
-    args = parser.parse_args()
-
-    try:
-        model = Fast3R.from_pretrained("models/fast3r")
-    except:
-        model = Fast3R.from_pretrained("jedyang97/Fast3R_ViT_Large_512")
-
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model = model.to(device)
-    lit_module = MultiViewDUSt3RLitModule.load_for_inference(model)
-    model.eval()
-    lit_module.eval()
+    reconstruct_parser.add_argument(
+        "--cache-size",
+        type=float,
+        help="Size limit of the image cache in GB, least recently used images are evicted.",
+        default=None,
+    )
+    reconstruct_parser.add_argument(
+        "--save-artifact",
+        type=str,
+        help="Directory to save the inference results to, for the export command.",
+        default=None,
+    )
+    reconstruct_parser.add_argument(
+        "--precision",
+        type=str,
+        choices=PRECISIONS,
+        help="Inference precision: bf16 autocast or int8 dynamic quantization (CPU only).",
+        default="fp32",
+    )
+    reconstruct_parser.add_argument(
+        "--check-precision",
+        action="store_true",
+        help="Compare poses and points at --precision against fp32 on the input, without exporting.",
+        default=False,
+    )
+    reconstruct_parser.set_defaults(func=run_reconstruct)
 
-    images = load_images(args.input, size=512)
+    export_parser = subparsers.add_parser(
+        "export", help="Export a COLMAP model from saved inference results."
+    )
+    export_parser.add_argument(
+        "--artifact",
+        "-a",
+        type=str,
+        required=True,
+        help="Directory saved with reconstruct --save-artifact.",
+    )
+    _add_export_args(export_parser)
+    export_parser.set_defaults(func=run_export)
 
-    output_dict, profiling_info = inference(
-        images,
-        model,
-        device,
-        dtype=torch.float32,
-        verbose=True,
-        profiling=True,
+    convert_parser = subparsers.add_parser(
+        "convert", help="Convert a COLMAP model between text, binary and PLY."
     )
+    convert_parser.add_argument("input", type=str, help="COLMAP model directory.")
+    convert_parser.add_argument("output", type=str, help="Output directory.")
+    convert_parser.add_argument(
+        "--to", type=str, choices=("bin", "txt", "ply"), default="bin"
+    )
+    convert_parser.set_defaults(func=run_convert)
 
-    confidence = 0.1
-    lit_module.align_local_pts3d_to_global(
-        preds=output_dict["preds"],
-        views=output_dict["views"],
-        min_conf_thr_percentile=confidence,
+    inspect_parser = subparsers.add_parser(
+        "inspect",
+        help="Summarize a COLMAP model, inference artifact, .ply or .gspc file.",
     )
+    inspect_parser.add_argument("path", type=str)
+    inspect_parser.set_defaults(func=run_inspect)
+
+    args = parser.parse_args(argv)
+    args.func(args)
 
-    sfm = Fast3RSfM(output_dict)
 
-    sfm(conf_thr=confidence, downsample=True, voxel_size=0.01)
-    write_cameras_txt(sfm.cameras, args.output)
-    write_images_txt(sfm.views, args.output, conf_threshold=confidence)
-    write_points3D_txt(sfm.pcd, args.output)
-    # o3d.visualization.draw_geometries([sfm.pcd], window_name="Fast3R Point Cloud", width=800, height=600)
+if __name__ == "__main__":
+    argv = sys.argv[1:]
+    # the flags of the former single command still run a reconstruction
+    if not argv or (argv[0].startswith("-") and argv[0] not in ("-h", "--help")):
+        argv = ["reconstruct"] + argv
+    main(argv)
@@ -0,0 +1,129 @@
+"""
+On-disk inference artifacts
+
+An artifact directory holds the aligned Fast3R predictions and input views
+as memory-mappable .npy files (one per key, views stacked along the first
+axis) plus the estimated poses and focals, so post-processing can rerun
+without the model.
+"""
+
+import json
+import os
+
+import numpy as np
+import torch
+
+from typing import List, Optional, Tuple
+
+MANIFEST = "manifest.json"
+VERSION = 1
+
+
+def _to_numpy(value) -> Optional[np.ndarray]:
+    if torch.is_tensor(value):
+        value = value.detach().cpu()
+        # NumPy has no bfloat16
+        if value.dtype == torch.bfloat16:
+            value = value.float()
+        return value.numpy()
+    if isinstance(value, np.ndarray):
+        return value
+    return None
+
+
+def _save_dicts(dicts: List[dict], dir: str, prefix: str) -> dict:
+    """
+    Save array entries of per-view dicts as stacked .npy files.
+    Returns the manifest section describing every key.
+    """
+    section = {}
+    for key in dicts[0]:
+        values = [d[key] for d in dicts]
+        arrays = [_to_numpy(v) for v in values]
+        if all(a is not None for a in arrays):
+            if len({a.shape for a in arrays}) == 1:
+                np.save(os.path.join(dir, f"{prefix}.{key}.npy"), np.concatenate(arrays))
+                section[key] = {"kind": "stacked", "tensor": torch.is_tensor(values[0])}
+            else:
+                for i, a in enumerate(arrays):
+                    np.save(os.path.join(dir, f"{prefix}.{key}.{i}.npy"), a)
+                section[key] = {"kind": "per_view", "tensor": torch.is_tensor(values[0])}
+        else:
+            try:
+                section[key] = {"kind": "json", "values": json.loads(json.dumps(values))}
+            except TypeError:
+                print(f"[WARNING] Skipping {prefix} entry {key}, it is not serializable.")
+    return section
+
+
+def _load_dicts(section: dict, dir: str, prefix: str, num_views: int) -> List[dict]:
+    dicts = [{} for _ in range(num_views)]
+    for key, entry in section.items():
+        if entry["kind"] == "json":
+            for d, value in zip(dicts, entry["values"]):
+                d[key] = value
+            continue
+        if entry["kind"] == "stacked":
+            # copy-on-write mapping, writable for torch without reading it
+            stacked = np.load(os.path.join(dir, f"{prefix}.{key}.npy"), mmap_mode="c")
+            arrays = [stacked[i : i + 1] for i in range(num_views)]
+        else:
+            arrays = [
+                np.load(os.path.join(dir, f"{prefix}.{key}.{i}.npy"), mmap_mode="c")
+                for i in range(num_views)
+            ]
+        for d, a in zip(dicts, arrays):
+            d[key] = torch.from_numpy(a) if entry["tensor"] else a
+    return dicts
+
+
+def save_inference(
+    output_dict: dict,
+    dir: str,
+    camera_poses: Optional[list] = None,
+    focals: Optional[list] = None,
+) -> None:
+    """
+    Save aligned predictions and views, and optionally the estimated
+    camera-to-world poses and focals.
+    """
+    os.makedirs(dir, exist_ok=True)
+    manifest = {
+        "version": VERSION,
+        "num_views": len(output_dict["preds"]),
+        "preds": _save_dicts(output_dict["preds"], dir, "preds"),
+        "views": _save_dicts(output_dict["views"], dir, "views"),
+        "poses": camera_poses is not None,
+    }
+    if camera_poses is not None:
+        np.save(
+            os.path.join(dir, "poses.npy"),
+            np.stack([np.asarray(pose) for pose in camera_poses]),
+        )
+        np.save(os.path.join(dir, "focals.npy"), np.asarray(focals, dtype=np.float64))
+    # manifest last, an artifact without one is incomplete
+    with open(os.path.join(dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=1)
+
+
+def load_inference(dir: str) -> Tuple[dict, Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    Load an artifact saved by save_inference; arrays are memory-mapped.
+    Returns the output dictionary, the (N, 4, 4) poses and the focals
+    (None if not saved).
+    """
+    with open(os.path.join(dir, MANIFEST), "r") as f:
+        manifest = json.load(f)
+    if manifest["version"] != VERSION:
+        raise ValueError(f"Unsupported artifact version {manifest['version']}")
+
+    num_views = manifest["num_views"]
+    output_dict = {
+        "preds": _load_dicts(manifest["preds"], dir, "preds", num_views),
+        "views": _load_dicts(manifest["views"], dir, "views", num_views),
+    }
+    camera_poses = focals = None
+    if manifest["poses"]:
+        camera_poses = np.load(os.path.join(dir, "poses.npy"))
+        focals = np.load(os.path.join(dir, "focals.npy"))
+    return output_dict, camera_poses, focals
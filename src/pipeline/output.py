@@ -0,0 +1,93 @@
+"""
+Asynchronous output stage
+"""
+
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import BoundedSemaphore
+from typing import Callable, Dict, Optional
+
+from src.utils.tracing import Tracer
+
+
+class OutputStage:
+    """
+    Run writers concurrently on a thread pool.
+    At most max_pending writers (2 * max_workers by default) are queued or
+    running at a time; submit blocks until one finishes. Every writer needs
+    a unique name.
+    wait() blocks until every writer is done, reports per-writer completion
+    and re-raises the first failure; later calls return at once. Every
+    writer is traced as a stage.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 4,
+        tracer: Optional[Tracer] = None,
+        max_pending: Optional[int] = None,
+    ):
+        self.tracer = tracer if tracer is not None else Tracer()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.pending = BoundedSemaphore(max_pending or 2 * max_workers)
+        self.futures: Dict[str, Future] = {}
+        self.timings: Dict[str, float] = {}
+        self._done = False
+
+    def submit(self, name: str, writer: Callable, *args, **kwargs) -> Future:
+        """
+        Schedule writer(*args, **kwargs) under the given name, waiting for
+        a free slot if max_pending writers are pending.
+        Raises ValueError if a writer of that name was already submitted.
+        """
+        if name in self.futures:
+            raise ValueError(f"A writer named {name} was already submitted")
+
+        def run():
+            start = time.perf_counter()
+            with self.tracer.stage(name):
+                result = writer(*args, **kwargs)
+            self.timings[name] = time.perf_counter() - start
+            print(f"[INFO] {name} written in {self.timings[name]:.2f} seconds")
+            return result
+
+        self.pending.acquire()
+        try:
+            future = self.executor.submit(run)
+        except BaseException:
+            self.pending.release()
+            raise
+        future.add_done_callback(lambda _: self.pending.release())
+        self.futures[name] = future
+        return future
+
+    def wait(self) -> Dict[str, float]:
+        """
+        Wait for all writers and return their durations in seconds.
+        """
+        if self._done:
+            return self.timings
+        self._done = True
+        error = None
+        for name, future in self.futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"[ERROR] Writing {name} failed: {e}")
+                error = error or e
+        self.executor.shutdown()
+        if error is not None:
+            raise error
+        return self.timings
+
+    def __enter__(self) -> "OutputStage":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.wait()
+        elif not self._done:
+            # the exception in flight wins, pending writers are dropped
+            self._done = True
+            self.executor.shutdown(cancel_futures=True)
@@ -0,0 +1,104 @@
+"""
+Reduced-precision and quantized inference
+
+fp32 is the reference. bf16 runs the model under bfloat16 autocast, int8
+dynamically quantizes the weights of the linear layers (CPU only); both
+return float32 predictions so the rest of the pipeline is unchanged.
+"""
+
+import contextlib
+
+import numpy as np
+import torch
+
+from typing import Dict
+
+PRECISIONS = ("fp32", "bf16", "int8")
+
+
+def quantize_model(model: torch.nn.Module, precision: str) -> torch.nn.Module:
+    """
+    Model to run at the given precision; a quantized copy for int8.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision}, expected one of {PRECISIONS}")
+    if precision != "int8":
+        return model
+    if next(model.parameters()).device.type != "cpu":
+        raise ValueError("int8 inference is only supported on the CPU")
+    return torch.ao.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def autocast(precision: str, device: torch.device):
+    """
+    Context to run inference in at the given precision.
+    """
+    if precision == "bf16":
+        return torch.autocast(device.type, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def to_float32(output_dict: dict) -> dict:
+    """
+    Cast the floating point tensors of the predictions back to float32, in place.
+    """
+    for pred in output_dict["preds"]:
+        for key, value in pred.items():
+            if torch.is_tensor(value) and value.is_floating_point():
+                pred[key] = value.float()
+    return output_dict
+
+
+def _rotation_error_deg(R_ref: np.ndarray, R: np.ndarray) -> np.ndarray:
+    cos = (np.trace(np.swapaxes(R_ref, 1, 2) @ R, axis1=1, axis2=2) - 1) / 2
+    return np.degrees(np.arccos(np.clip(cos, -1, 1)))
+
+
+def compare_results(
+    reference: dict,
+    candidate: dict,
+    reference_poses: np.ndarray,
+    candidate_poses: np.ndarray,
+) -> Dict[str, float]:
+    """
+    Errors of a candidate inference against the fp32 reference on the same
+    images: pose rotation errors in degrees, and camera center and per pixel
+    point errors relative to the extent of the reference points.
+    Both share the frame of the first view, so no alignment is needed.
+    """
+    reference_poses = np.asarray(reference_poses, dtype=np.float64)
+    candidate_poses = np.asarray(candidate_poses, dtype=np.float64)
+
+    key = "pts3d_local_aligned_to_global"
+    points = np.concatenate(
+        [ref[key].float().reshape(-1, 3).cpu().numpy() for ref in reference["preds"]]
+    )
+    extent = np.linalg.norm(points - np.median(points, axis=0), axis=1).max()
+    extent = max(extent, 1e-12)
+
+    rotation_errors = _rotation_error_deg(
+        reference_poses[:, :3, :3], candidate_poses[:, :3, :3]
+    )
+    center_errors = np.linalg.norm(
+        reference_poses[:, :3, 3] - candidate_poses[:, :3, 3], axis=1
+    )
+    point_errors = np.concatenate(
+        [
+            torch.linalg.norm(ref[key].float() - cand[key].float(), dim=-1)
+            .reshape(-1)
+            .cpu()
+            .numpy()
+            for ref, cand in zip(reference["preds"], candidate["preds"])
+        ]
+    )
+
+    return {
+        "rotation_error_deg_mean": float(rotation_errors.mean()),
+        "rotation_error_deg_max": float(rotation_errors.max()),
+        "center_error_rel_mean": float(center_errors.mean() / extent),
+        "center_error_rel_max": float(center_errors.max() / extent),
+        "point_error_rel_median": float(np.median(point_errors) / extent),
+        "point_error_rel_p95": float(np.percentile(point_errors, 95) / extent),
+    }
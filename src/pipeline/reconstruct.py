@@ -0,0 +1,359 @@
+"""
+Fast3R reconstruction pipeline
+"""
+
+import os
+
+import numpy as np
+import torch
+
+from typing import Dict, Optional
+
+from src.pipeline.artifact import load_inference, save_inference
+from src.pipeline.output import OutputStage
+from src.pipeline.precision import (
+    autocast,
+    compare_results,
+    quantize_model,
+    to_float32,
+)
+from src.pipeline.sfm.fast3r import Fast3RSfM
+from src.pipeline.sfm.windowed import windowed_inference, window_size_for_budget
+from src.utils.image_cache import ImageCache, list_images
+from src.utils.pointcloud import OutlierRemoval
+from src.utils.tracing import Tracer
+from src.utils.io import (
+    export_view_images,
+    write_cameras_txt,
+    write_images_txt,
+    write_points3D_ply,
+    write_points3D_txt,
+)
+
+
+def load_model(
+    device: Optional[torch.device] = None, precision: str = "fp32"
+) -> tuple:
+    """
+    Load Fast3R for inference, quantized for precision="int8" (see
+    src.pipeline.precision). Returns the model, its Lightning module and
+    the device it lives on.
+    """
+    from fast3r.models.fast3r import Fast3R
+    from fast3r.models.multiview_dust3r_module import MultiViewDUSt3RLitModule
+
+    try:
+        model = Fast3R.from_pretrained("models/fast3r")
+    except:
+        model = Fast3R.from_pretrained("jedyang97/Fast3R_ViT_Large_512")
+
+    if device is None:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = quantize_model(model.to(device), precision)
+    lit_module = MultiViewDUSt3RLitModule.load_for_inference(model)
+    model.eval()
+    lit_module.eval()
+    return model, lit_module, device
+
+
+def run_inference(
+    model,
+    lit_module,
+    device: torch.device,
+    input: str,
+    confidence: float = 0.1,
+    window: Optional[int] = None,
+    overlap: int = 4,
+    memory_budget: Optional[float] = None,
+    cache: Optional[ImageCache] = None,
+    precision: str = "fp32",
+    tracer: Optional[Tracer] = None,
+) -> dict:
+    """
+    Load the images in input and run Fast3R on them, see reconstruct.
+    precision="bf16" runs the model under bfloat16 autocast.
+    Returns the output dictionary with aligned predictions.
+    """
+    from fast3r.dust3r.utils.image import load_images
+    from fast3r.dust3r.inference_multiview import inference
+
+    tracer = tracer if tracer is not None else Tracer()
+
+    with tracer.stage("load_images"):
+        if cache is not None:
+            images = cache.load_images(input, size=512)
+        else:
+            images = load_images(input, size=512)
+
+    if window is None and memory_budget is not None:
+        window = window_size_for_budget(memory_budget * (1 << 30), overlap)
+
+    if window is not None and window < len(images):
+        with tracer.stage("inference", views=len(images), window=window):
+            output_dict, profiling_info = windowed_inference(
+                images,
+                model,
+                lit_module,
+                device,
+                window_size=window,
+                overlap=overlap,
+                dtype=torch.float32,
+                min_conf_thr_percentile=confidence,
+                precision=precision,
+            )
+    else:
+        with tracer.stage("inference", views=len(images), precision=precision):
+            with autocast(precision, device):
+                output_dict, profiling_info = inference(
+                    images,
+                    model,
+                    device,
+                    dtype=torch.float32,
+                    verbose=True,
+                    profiling=True,
+                )
+            to_float32(output_dict)
+
+        with tracer.stage("alignment"):
+            lit_module.align_local_pts3d_to_global(
+                preds=output_dict["preds"],
+                views=output_dict["views"],
+                min_conf_thr_percentile=confidence,
+            )
+    tracer.add_profiling("inference", profiling_info)
+
+    # input names travel with the views, e.g. to match a reference model
+    for view, path in zip(output_dict["views"], list_images(input)):
+        view["name"] = os.path.basename(path)
+
+    return output_dict
+
+
+def reconstruct(
+    model,
+    lit_module,
+    device: torch.device,
+    input: str,
+    output: str,
+    confidence: float = 0.1,
+    voxel_size: float = 0.01,
+    window: Optional[int] = None,
+    overlap: int = 4,
+    memory_budget: Optional[float] = None,
+    cache: Optional[ImageCache] = None,
+    image_format: Optional[str] = None,
+    image_quality: Optional[int] = None,
+    ply: bool = False,
+    compact: bool = False,
+    artifact: Optional[str] = None,
+    precision: str = "fp32",
+    pnp_workers: Optional[int] = None,
+    pnp_early_stop: bool = False,
+    tracer: Optional[Tracer] = None,
+    reference: Optional[str] = None,
+    outliers: Optional[OutlierRemoval] = None,
+) -> Dict[str, float]:
+    """
+    Reconstruct the images in input and save a COLMAP model to output.
+    memory_budget is in GB and picks the window size if window is not set.
+    If artifact is set, the aligned predictions and estimated poses are
+    also saved there for reconstruct_from_artifact.
+    If reference is set, the model is aligned to that COLMAP model, see
+    Fast3RSfM.estimate_alignment.
+    Stages are recorded by tracer, see src.utils.tracing.
+    Returns the duration of every stage in seconds.
+    """
+    tracer = tracer if tracer is not None else Tracer()
+    output_dict = run_inference(
+        model,
+        lit_module,
+        device,
+        input,
+        confidence=confidence,
+        window=window,
+        overlap=overlap,
+        memory_budget=memory_budget,
+        cache=cache,
+        precision=precision,
+        tracer=tracer,
+    )
+
+    sfm = Fast3RSfM(
+        output_dict,
+        pnp_workers=pnp_workers,
+        pnp_early_stop=pnp_early_stop,
+        tracer=tracer,
+        reference=reference,
+    )
+    if artifact is not None:
+        sfm.estimate_poses()
+        with tracer.stage("artifact"):
+            save_inference(output_dict, artifact, sfm.camera_poses, sfm.focals)
+
+    return export_reconstruction(
+        sfm,
+        output,
+        confidence=confidence,
+        voxel_size=voxel_size,
+        image_format=image_format,
+        image_quality=image_quality,
+        ply=ply,
+        compact=compact,
+        outliers=outliers,
+    )
+
+
+def check_precision(
+    model,
+    lit_module,
+    device: torch.device,
+    input: str,
+    precision: str,
+    confidence: float = 0.1,
+    cache: Optional[ImageCache] = None,
+) -> Dict[str, float]:
+    """
+    Run inference on input at fp32 and at precision and compare the poses
+    and points, see src.pipeline.precision.compare_results. model is the
+    fp32 model; it is quantized here for int8.
+    Returns the errors and the inference time of both runs in seconds.
+    """
+    results, seconds = {}, {}
+    for name, run_model in (
+        ("fp32", model),
+        (precision, quantize_model(model, precision)),
+    ):
+        tracer = Tracer()
+        output_dict = run_inference(
+            run_model,
+            lit_module,
+            device,
+            input,
+            confidence=confidence,
+            cache=cache,
+            precision=name,
+            tracer=tracer,
+        )
+        sfm = Fast3RSfM(output_dict, tracer=tracer)
+        sfm.estimate_poses()
+        results[name] = sfm
+        seconds[name] = tracer.timings()["inference"]
+
+    report = compare_results(
+        results["fp32"].output_dict,
+        results[precision].output_dict,
+        np.stack([np.asarray(pose) for pose in results["fp32"].camera_poses]),
+        np.stack([np.asarray(pose) for pose in results[precision].camera_poses]),
+    )
+    report["fp32_seconds"] = seconds["fp32"]
+    report[f"{precision}_seconds"] = seconds[precision]
+    report["speedup"] = seconds["fp32"] / seconds[precision]
+    return report
+
+
+def reconstruct_from_artifact(
+    artifact: str,
+    output: str,
+    confidence: float = 0.1,
+    voxel_size: float = 0.01,
+    image_format: Optional[str] = None,
+    image_quality: Optional[int] = None,
+    ply: bool = False,
+    compact: bool = False,
+    pnp_workers: Optional[int] = None,
+    pnp_early_stop: bool = False,
+    tracer: Optional[Tracer] = None,
+    reference: Optional[str] = None,
+    outliers: Optional[OutlierRemoval] = None,
+) -> Dict[str, float]:
+    """
+    Save a COLMAP model to output from an artifact saved by reconstruct,
+    without running the model, optionally aligned to reference.
+    Returns the duration of every stage in seconds.
+    """
+    tracer = tracer if tracer is not None else Tracer()
+    with tracer.stage("load_artifact"):
+        output_dict, camera_poses, focals = load_inference(artifact)
+
+    sfm = Fast3RSfM(
+        output_dict,
+        camera_poses,
+        focals,
+        pnp_workers=pnp_workers,
+        pnp_early_stop=pnp_early_stop,
+        tracer=tracer,
+        reference=reference,
+    )
+    return export_reconstruction(
+        sfm,
+        output,
+        confidence=confidence,
+        voxel_size=voxel_size,
+        image_format=image_format,
+        image_quality=image_quality,
+        ply=ply,
+        compact=compact,
+        outliers=outliers,
+    )
+
+
+def export_reconstruction(
+    sfm: Fast3RSfM,
+    output: str,
+    confidence: float = 0.1,
+    voxel_size: float = 0.01,
+    image_format: Optional[str] = None,
+    image_quality: Optional[int] = None,
+    ply: bool = False,
+    compact: bool = False,
+    outliers: Optional[OutlierRemoval] = None,
+) -> Dict[str, float]:
+    """
+    Run the SfM post-processing and write its results to output, traced
+    by the tracer of sfm. outliers configures outlier removal, if set.
+    Returns the duration of every stage traced so far in seconds.
+    """
+    tracer = sfm.tracer
+    os.makedirs(output, exist_ok=True)
+    with OutputStage(tracer=tracer) as output_stage:
+        # images do not depend on the final poses, start them right away
+        with tracer.stage("sfm"):
+            sfm(
+                conf_thr=confidence,
+                downsample=voxel_size > 0,
+                voxel_size=voxel_size,
+                on_views=lambda views: output_stage.submit(
+                    "images",
+                    export_view_images,
+                    views,
+                    output,
+                    conf_threshold=confidence,
+                    image_format=image_format,
+                    quality=image_quality,
+                ),
+                outliers=outliers,
+            )
+
+        with tracer.stage("output"):
+            output_stage.submit("cameras.txt", write_cameras_txt, sfm.cameras, output)
+            output_stage.submit(
+                "images.txt",
+                write_images_txt,
+                sfm.views,
+                output,
+                conf_threshold=confidence,
+                image_format=image_format,
+                save_images=False,
+            )
+            output_stage.submit("points3D.txt", write_points3D_txt, sfm.pcd, output)
+            if ply:
+                output_stage.submit(
+                    "points3D.ply", write_points3D_ply, sfm.pcd, output
+                )
+            if compact:
+                output_stage.submit(
+                    "points3D.gspc",
+                    lambda: sfm.to_compact().save(f"{output}/points3D.gspc"),
+                )
+            output_stage.wait()
+    return tracer.timings()
@@ -2,52 +2,171 @@
 Sparse SfM from Fast3R
 """
 
+import time
+
 import open3d as o3d
 import numpy as np
+import torch
 
-from fast3r.models.multiview_dust3r_module import MultiViewDUSt3RLitModule
+from typing import Callable, List, Optional
 
 from src.camera.camera import Camera
+from src.pipeline.sfm.pnp import estimate_camera_poses
 from src.view.camera_view import CameraView
-from src.utils.pointcloud import scale_pointcloud
+from src.view.image import TensorImage
+from src.view.poses import Poses
+from src.utils.alignment import Sim3, align_to_reference
+from src.utils.compact import CompactPointCloud
+from src.utils.io import image_name, pcd_arrays
+from src.utils.pointcloud import OutlierRemoval, VoxelGrid, transform_pointcloud
+from src.utils.tracing import Tracer
 
 SCALING_FACTOR = 29.4
 
 
 class Fast3RSfM:
-    def __init__(self, output_dict: dict):
+    def __init__(
+        self,
+        output_dict: dict,
+        camera_poses: Optional[list] = None,
+        focals: Optional[list] = None,
+        pnp_workers: Optional[int] = None,
+        pnp_early_stop: bool = False,
+        tracer: Optional[Tracer] = None,
+        reference: Optional[str] = None,
+    ):
+        """
+        camera_poses and focals may be given if already estimated, e.g.
+        loaded from an inference artifact, to skip the PnP.
+        pnp_workers and pnp_early_stop configure the pose estimation, see
+        src.pipeline.sfm.pnp.estimate_camera_poses.
+        Stages are recorded by tracer, see src.utils.tracing.
+        reference is a COLMAP model to align the result to, see
+        estimate_alignment; without it the result is scaled by SCALING_FACTOR.
+        """
         self.output_dict = output_dict
+        self.camera_poses = camera_poses
+        self.focals = focals
+        self.pnp_workers = pnp_workers
+        self.pnp_early_stop = pnp_early_stop
+        self.tracer = tracer if tracer is not None else Tracer()
+        self.reference = reference
+        self.alignment = None
         self.cameras = []
         self.views = []
+        self.poses = None
         self.pcd = None
+        self.confidence = None
         self.resolution_scaling = 1.0
 
     def __call__(
-        self, conf_thr: float = 0.0, downsample: bool = False, voxel_size: float = 0.01
+        self,
+        conf_thr: float = 0.0,
+        downsample: bool = False,
+        voxel_size: float = 0.01,
+        on_views: Optional[Callable[[List[CameraView]], None]] = None,
+        outliers: Optional[OutlierRemoval] = None,
     ) -> None:
         """
         Preprocess the output dictionary to filter views based on confidence.
+        on_views is called with the views as soon as they are built, before
+        the point cloud is processed and the poses are aligned.
+        If outliers is set, outlier points are removed after downsampling.
         """
-        poses_c2w_batch, estimated_focals = (
-            MultiViewDUSt3RLitModule.estimate_camera_poses(
-                self.output_dict["preds"],
-                niter_PnP=100,
-                focal_length_estimation_method="first_view_from_global_head",
-            )
-        )
-        camera_poses = poses_c2w_batch[0]
-        self._save_cameras(estimated_focals)
-        self._save_views(camera_poses)
-        self._inference_to_pcds(conf_thr)
-
-        if downsample:
-            self.pcd = self.pcd.voxel_down_sample(voxel_size=voxel_size)
+        self.build_views(on_views)
+        # downsampling folds in the kept points of each batch of views
+        with self.tracer.stage("inference_to_pcds", conf_thr=conf_thr):
+            self._inference_to_pcds(conf_thr, voxel_size if downsample else None)
+        if outliers is not None:
+            self.remove_outliers(outliers)
 
         # self.cameras[0] *= SCALING_FACTOR * self.resolution_scaling
-        self.views = [
-            view * SCALING_FACTOR * self.resolution_scaling for view in self.views
+        self.alignment = self.estimate_alignment(np.asarray(self.pcd.points))
+        # view extrinsics are rows of self.poses, transformed together in place
+        self.poses.c2w[:] = self.alignment.apply_poses(self.poses.c2w)
+        transform_pointcloud(self.pcd, self.alignment)
+
+    def remove_outliers(self, outliers: OutlierRemoval) -> int:
+        """
+        Remove outlier points (and their confidences) from the point cloud.
+        Returns the number of removed points.
+        """
+        start = time.perf_counter()
+        with self.tracer.stage("outlier_removal", method=outliers.method):
+            points, colors = np.asarray(self.pcd.points), np.asarray(self.pcd.colors)
+            keep = outliers.inliers(points)
+            pcd = o3d.geometry.PointCloud()
+            pcd.points = o3d.utility.Vector3dVector(points[keep])
+            pcd.colors = o3d.utility.Vector3dVector(colors[keep])
+            self.pcd = pcd
+            if self.confidence is not None:
+                self.confidence = self.confidence[keep]
+        removed = int(len(keep) - keep.sum())
+        print(
+            f"[INFO] Removed {removed} of {len(keep)} points as {outliers.method} "
+            f"outliers in {time.perf_counter() - start:.2f} seconds"
+        )
+        return removed
+
+    def image_names(self) -> List[str]:
+        """
+        Names of the input images, as recorded in the views by inference,
+        or the names the images are exported under.
+        """
+        return [
+            view.get("name") or image_name(camera_view, id)
+            for id, (view, camera_view) in enumerate(
+                zip(self.output_dict["views"], self.views), start=1
+            )
         ]
-        scale_pointcloud(self.pcd, SCALING_FACTOR * self.resolution_scaling)
+
+    def estimate_alignment(self, points: Optional[np.ndarray] = None) -> Sim3:
+        """
+        Transform from the Fast3R frame to the frame of the reference model:
+        camera centers are matched by image name, or points (if given) by
+        nearest neighbours when too few names match, see
+        src.utils.alignment.align_to_reference.
+        Without a reference, the fixed SCALING_FACTOR scale.
+        """
+        if self.reference is None:
+            return Sim3(
+                scale=SCALING_FACTOR * self.resolution_scaling,
+                rotation=np.eye(3),
+                translation=np.zeros(3),
+            )
+        with self.tracer.stage("reference_alignment", reference=self.reference):
+            return align_to_reference(
+                self.image_names(), self.poses.c2w, self.reference, points
+            )
+
+    def build_views(
+        self, on_views: Optional[Callable[[List[CameraView]], None]] = None
+    ) -> None:
+        """
+        Build the camera and the views, estimating poses if not given.
+        """
+        if self.camera_poses is None:
+            self.estimate_poses()
+        self._save_cameras(self.focals)
+        with self.tracer.stage("save_views"):
+            self._save_views(self.camera_poses)
+        if on_views is not None:
+            on_views(self.views)
+
+    def estimate_poses(self) -> None:
+        """
+        Estimate camera-to-world poses and focals from the predictions.
+        """
+        views = len(self.output_dict["preds"])
+        with self.tracer.stage("pose_estimation", views=views):
+            poses_c2w_batch, estimated_focals = estimate_camera_poses(
+                self.output_dict["preds"],
+                niter_PnP=100,
+                workers=self.pnp_workers,
+                early_stop=self.pnp_early_stop,
+            )
+        self.camera_poses = poses_c2w_batch[0]
+        self.focals = estimated_focals
 
     def _save_cameras(self, focals: list) -> None:
         width, height = (
@@ -65,63 +184,183 @@ class Fast3RSfM:
         ]
 
     def _save_views(self, camera_poses):
-
-        for img_id, (view, pred, pose) in enumerate(
-            zip(self.output_dict["views"], self.output_dict["preds"], camera_poses),
+        self.poses = Poses(np.stack([np.asarray(pose) for pose in camera_poses]))
+        # reduce on device, transfer one value per view
+        with torch.no_grad():
+            max_confs = (
+                torch.stack([pred["conf"].amax() for pred in self.output_dict["preds"]])
+                .float()
+                .cpu()
+                .numpy()
+            )
+        for img_id, (view, max_conf, pose) in enumerate(
+            zip(self.output_dict["views"], max_confs, self.poses),
             start=1,
         ):
-            img = np.transpose(view["img"][0].cpu().numpy(), (1, 2, 0))
-            img = ((img + 1) * 127.5).clip(0, 255).astype(np.uint8)
             self.views.append(
                 CameraView(
                     img_path=None,
                     camera_id=1,
-                    confidence=np.max(pred["conf"].cpu().numpy()),
+                    confidence=max_conf,
                     extrinsics=pose,
-                    img=img,
+                    img=TensorImage(view["img"][0]),
                 )
             )
 
-    def _inference_to_pcds(self, conf_thr=0.0):
-        """ """
+    def _view_batches(self, batch_size: int):
+        """
+        Split view indices into runs of at most batch_size views of equal size.
+        """
+        preds = self.output_dict["preds"]
+        start = 0
+        while start < len(preds):
+            stop = start + 1
+            while (
+                stop < len(preds)
+                and stop - start < batch_size
+                and preds[stop]["conf"].shape == preds[start]["conf"].shape
+            ):
+                stop += 1
+            yield start, stop
+            start = stop
+
+    def _inference_to_pcds(
+        self,
+        conf_thr=0.0,
+        voxel_size: Optional[float] = None,
+        batch_size: int = 16,
+    ):
+        """
+        Keep the (1 - conf_thr) most confident points of every view.
+        Top-k selection runs batched on the device of the predictions; only
+        the kept points are transferred, into one preallocated buffer, or
+        into a confidence-weighted voxel grid if voxel_size is set.
+        """
         keep_frac = 1.0 - conf_thr
 
         preds = self.output_dict["preds"]
         views = self.output_dict["views"]
 
-        cl_points = np.ndarray([])
-        cl_colors = np.ndarray([])
-        for i in range(len(preds)):
-            pts3d = preds[i]["pts3d_local_aligned_to_global"].cpu().numpy()
-            confidences = preds[i]["conf"].cpu().numpy()
-            colors = views[i]["img"].cpu().numpy()
+        ks = [max(1, int(pred["conf"].numel() * keep_frac)) for pred in preds]
+        offsets = np.concatenate([[0], np.cumsum(ks)])
+        if voxel_size is not None:
+            grid = VoxelGrid(voxel_size)
+        else:
+            cl_points = np.empty((offsets[-1], 3), dtype=np.float32)
+            cl_colors = np.empty((offsets[-1], 3), dtype=np.uint8)
+            cl_confidences = np.empty(offsets[-1], dtype=np.float32)
 
-            pts3d_flat = pts3d.reshape(-1, 3)
-            confidences_flat = confidences.reshape(-1)
-            colors_flat = colors.transpose(0, 2, 3, 1).reshape(-1, 3)
+        with torch.no_grad():
+            for start, stop in self._view_batches(batch_size):
+                confidences = torch.stack(
+                    [preds[i]["conf"].reshape(-1) for i in range(start, stop)]
+                )
+                confidences_filtered, idx = torch.topk(
+                    confidences, ks[start], dim=1, sorted=False
+                )
 
-            k = max(1, int(len(confidences_flat) * keep_frac))
-            idx = np.argpartition(-confidences_flat, k - 1)[:k]
-            pts3d_filtered = pts3d_flat[idx]
+                pts3d = torch.stack(
+                    [
+                        preds[i]["pts3d_local_aligned_to_global"].reshape(-1, 3)
+                        for i in range(start, stop)
+                    ]
+                )
+                pts3d_filtered = torch.gather(
+                    pts3d, 1, idx[:, :, None].expand(-1, -1, 3)
+                )
 
-            colors_filtered = colors_flat[idx]
-            colors_filtered = (
-                ((colors_filtered + 1) * 127.5).clip(0, 255).astype(np.uint8)
-            )
+                colors = torch.stack(
+                    [views[i]["img"][0].reshape(3, -1) for i in range(start, stop)]
+                )
+                colors_filtered = torch.gather(
+                    colors, 2, idx[:, None, :].expand(-1, 3, -1)
+                ).transpose(1, 2)
+                colors_filtered = (
+                    ((colors_filtered + 1) * 127.5).clamp(0, 255).to(torch.uint8)
+                )
 
-            cl_points = (
-                np.concatenate((cl_points, pts3d_filtered), axis=0)
-                if cl_points.shape
-                else pts3d_filtered
-            )
-            cl_colors = (
-                np.concatenate((cl_colors, colors_filtered), axis=0)
-                if cl_colors.shape
-                else colors_filtered
-            )
+                pts3d_filtered = pts3d_filtered.reshape(-1, 3).float().cpu().numpy()
+                colors_filtered = colors_filtered.reshape(-1, 3).cpu().numpy()
+                confidences_filtered = (
+                    confidences_filtered.reshape(-1).float().cpu().numpy()
+                )
+                if voxel_size is not None:
+                    with self.tracer.stage("downsampling", voxel_size=voxel_size):
+                        grid.add(
+                            pts3d_filtered.astype(np.float64),
+                            colors_filtered,
+                            confidences_filtered,
+                        )
+                    continue
+
+                kept = slice(offsets[start], offsets[stop])
+                cl_points[kept] = pts3d_filtered
+                cl_colors[kept] = colors_filtered
+                cl_confidences[kept] = confidences_filtered
+
+        if voxel_size is not None:
+            with self.tracer.stage("downsampling", voxel_size=voxel_size):
+                cl_points, cl_colors, cl_confidences = grid.result()
 
         pcd = o3d.geometry.PointCloud()
-        pcd.points = o3d.utility.Vector3dVector(cl_points)
+        pcd.points = o3d.utility.Vector3dVector(cl_points.astype(np.float64))
         pcd.colors = o3d.utility.Vector3dVector(cl_colors / 255.0)
 
         self.pcd = pcd
+        self.confidence = cl_confidences
+
+    def rank_points(self, keep_frac: float = 1.0, batch_size: int = 16) -> tuple:
+        """
+        Sort the points of every view by decreasing confidence, once, so any
+        confidence threshold keeping at most keep_frac of the points is a
+        prefix of every view. Only those prefixes are transferred.
+        Returns per view lists of points, uint8 colors and confidences, and
+        the number of points of every view.
+        """
+        preds = self.output_dict["preds"]
+        views = self.output_dict["views"]
+        sizes = [pred["conf"].numel() for pred in preds]
+        points, colors, confidences = [], [], []
+
+        with torch.no_grad():
+            for start, stop in self._view_batches(batch_size):
+                k = max(1, int(sizes[start] * keep_frac))
+                batch_confidences = torch.stack(
+                    [preds[i]["conf"].reshape(-1) for i in range(start, stop)]
+                )
+                batch_confidences, idx = torch.sort(
+                    batch_confidences, dim=1, descending=True
+                )
+                idx = idx[:, :k]
+
+                pts3d = torch.stack(
+                    [
+                        preds[i]["pts3d_local_aligned_to_global"].reshape(-1, 3)
+                        for i in range(start, stop)
+                    ]
+                )
+                pts3d = torch.gather(pts3d, 1, idx[:, :, None].expand(-1, -1, 3))
+
+                batch_colors = torch.stack(
+                    [views[i]["img"][0].reshape(3, -1) for i in range(start, stop)]
+                )
+                batch_colors = torch.gather(
+                    batch_colors, 2, idx[:, None, :].expand(-1, 3, -1)
+                ).transpose(1, 2)
+                batch_colors = ((batch_colors + 1) * 127.5).clamp(0, 255).to(torch.uint8)
+
+                points.extend(pts3d.float().cpu().numpy())
+                colors.extend(batch_colors.cpu().numpy())
+                confidences.extend(batch_confidences[:, :k].float().cpu().numpy())
+
+        return points, colors, confidences, sizes
+
+    def to_compact(self, chunk_size: int = 1 << 16) -> CompactPointCloud:
+        """
+        Quantize the point cloud (and confidences, if still known) into the
+        compact container.
+        """
+        points, colors = pcd_arrays(self.pcd)
+        return CompactPointCloud.encode(
+            points, colors, self.confidence, chunk_size=chunk_size
+        )
@@ -0,0 +1,139 @@
+"""
+Parallel per-view PnP pose estimation
+
+Follows MultiViewDUSt3RLitModule.estimate_camera_poses with
+focal_length_estimation_method="first_view_from_global_head": the focal is
+estimated once from the global head points of the first view, then every
+view is solved on its own by OpenCV PnP RANSAC with that focal. RANSAC is
+seeded the same on every call and OpenCV releases the GIL while solving, so
+views can be solved on a thread pool with results identical to solving them
+one after another.
+"""
+
+import math
+import os
+
+import numpy as np
+import torch
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+# points of a minimal PnP sample
+PNP_SAMPLE_SIZE = 4
+# reprojection error of a RANSAC inlier in pixels
+PNP_REPROJECTION_ERROR = 5
+
+
+def ransac_iterations(
+    preds: List[dict],
+    max_iter: int = 100,
+    min_iter: int = 8,
+    success_prob: float = 0.999,
+) -> List[int]:
+    """
+    RANSAC iterations every view needs to find an all-inlier sample with
+    success_prob, taking 1 - 1 / conf (conf > 1) as the inlier probability
+    of a pixel. Rounded up to a power of two.
+    """
+    with torch.no_grad():
+        inlier_ratios = (
+            torch.stack([(1 - 1 / pred["conf"].float()).mean() for pred in preds])
+            .cpu()
+            .numpy()
+        )
+    iterations = []
+    for ratio in inlier_ratios:
+        p_good = float(np.clip(ratio, 1e-6, 1 - 1e-6)) ** PNP_SAMPLE_SIZE
+        n = math.log(1 - success_prob) / math.log(1 - p_good)
+        n = 2 ** math.ceil(math.log2(max(n, 1)))
+        iterations.append(int(np.clip(n, min_iter, max_iter)))
+    return iterations
+
+
+def first_view_focal(pred: dict) -> float:
+    """
+    Focal of the first view from its global head points, with the
+    principal point at the image center.
+    """
+    from fast3r.dust3r.post_process import estimate_focal_knowing_depth
+
+    pts3d = pred["pts3d_in_other_view"].float()
+    _, height, width, _ = pts3d.shape
+    pp = torch.tensor([[width / 2, height / 2]], device=pts3d.device)
+    with torch.no_grad():
+        focal = estimate_focal_knowing_depth(pts3d[:1], pp, focal_mode="weiszfeld")
+    return float(focal[0])
+
+
+def solve_view(pred: dict, focal: float, niter_PnP: int) -> np.ndarray:
+    """
+    Camera-to-world pose of one view from its (1, H, W, 3) points, by PnP
+    RANSAC against the pixel grid. Identity if PnP fails.
+    """
+    import cv2
+
+    pts3d = pred["pts3d_in_other_view"][0].float().cpu().numpy()
+    height, width, _ = pts3d.shape
+    pixels = np.mgrid[:width, :height].T.astype(np.float32)
+    K = np.float32([(focal, 0, width / 2), (0, focal, height / 2), (0, 0, 1)])
+    success, rvec, tvec, _ = cv2.solvePnPRansac(
+        pts3d.reshape(-1, 3),
+        pixels.reshape(-1, 2),
+        K,
+        None,
+        iterationsCount=niter_PnP,
+        reprojectionError=PNP_REPROJECTION_ERROR,
+        flags=cv2.SOLVEPNP_SQPNP,
+    )
+    if not success:
+        print("[WARNING] PnP failed for a view, using the identity pose")
+        return np.eye(4)
+    w2c = np.eye(4)
+    w2c[:3, :3] = cv2.Rodrigues(rvec)[0]
+    w2c[:3, 3] = tvec[:, 0]
+    return np.linalg.inv(w2c)
+
+
+def estimate_camera_poses(
+    preds: List[dict],
+    niter_PnP: int = 100,
+    workers: Optional[int] = None,
+    early_stop: bool = False,
+    focal: Optional[float] = None,
+) -> Tuple[list, list]:
+    """
+    Replacement of MultiViewDUSt3RLitModule.estimate_camera_poses with
+    first_view_from_global_head focals, solving views on workers threads
+    (all cores by default, at most one per view).
+    The focal is estimated from the first view unless given.
+    early_stop caps the RANSAC iterations of every view by ransac_iterations
+    instead of niter_PnP; this changes the results.
+    Returns camera-to-world poses and focals, with a batch dimension.
+    """
+    if focal is None:
+        focal = first_view_focal(preds[0])
+    niters = (
+        ransac_iterations(preds, niter_PnP)
+        if early_stop
+        else [niter_PnP] * len(preds)
+    )
+    workers = max(1, min(workers or os.cpu_count() or 1, len(preds)))
+
+    def solve(views):
+        return [solve_view(preds[i], focal, niters[i]) for i in views]
+
+    if workers == 1:
+        poses = solve(range(len(preds)))
+    else:
+        # a few chunks per worker, dealt from the costliest view on, balance
+        # views of different difficulty
+        order = sorted(range(len(preds)), key=lambda i: -niters[i])
+        num_chunks = min(len(preds), 2 * workers)
+        chunks = [order[k::num_chunks] for k in range(num_chunks)]
+        poses = [None] * len(preds)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for views, chunk_poses in zip(chunks, pool.map(solve, chunks)):
+                for i, pose in zip(views, chunk_poses):
+                    poses[i] = pose
+    return [poses], [[focal] * len(preds)]
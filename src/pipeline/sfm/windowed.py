@@ -0,0 +1,156 @@
+"""
+Windowed Fast3R inference for image sets larger than memory
+"""
+
+import numpy as np
+import torch
+
+from typing import List, Optional, Tuple
+
+from src.pipeline.precision import autocast, to_float32
+from src.utils.alignment import Sim3, umeyama
+
+# Rough peak inference memory per 512px view of Fast3R ViT-L, tune per host
+VIEW_MEMORY_BYTES = 256 << 20
+# Prediction keys holding points in the global frame of the window
+GLOBAL_POINT_KEYS = ("pts3d_in_other_view", "pts3d_local_aligned_to_global")
+
+
+def plan_windows(num_views: int, window_size: int, overlap: int) -> List[List[int]]:
+    """
+    Split view indices into windows of window_size views, consecutive
+    windows sharing overlap views.
+    """
+    if window_size <= overlap:
+        raise ValueError("Window size must be larger than the overlap")
+    if num_views <= window_size:
+        return [list(range(num_views))]
+    step = window_size - overlap
+    return [
+        list(range(start, min(start + window_size, num_views)))
+        for start in range(0, num_views - overlap, step)
+    ]
+
+
+def window_size_for_budget(
+    memory_budget: int, overlap: int, view_memory: int = VIEW_MEMORY_BYTES
+) -> int:
+    """
+    Largest window that fits into memory_budget bytes.
+    """
+    return max(overlap + 1, int(memory_budget // view_memory))
+
+
+def _to_cpu(d: dict) -> dict:
+    return {k: v.cpu() if torch.is_tensor(v) else v for k, v in d.items()}
+
+
+def _transform_pred(pred: dict, sim3: Sim3) -> dict:
+    """
+    Move the global points of a prediction into another frame.
+    """
+    pred = dict(pred)
+    for key in GLOBAL_POINT_KEYS:
+        if key not in pred:
+            continue
+        pts = pred[key]
+        rotation = torch.as_tensor(sim3.rotation, dtype=pts.dtype, device=pts.device)
+        translation = torch.as_tensor(
+            sim3.translation, dtype=pts.dtype, device=pts.device
+        )
+        pred[key] = sim3.scale * pts @ rotation.T + translation
+    return pred
+
+
+def _register(
+    window_preds: List[dict], global_preds: List[dict], keep_frac: float = 0.5
+) -> Sim3:
+    """
+    Similarity transform taking the window frame to the global frame,
+    fitted on the aligned points of the shared views, weighted by confidence.
+    """
+    src, dst, weights = [], [], []
+    for window_pred, global_pred in zip(window_preds, global_preds):
+        conf = torch.minimum(window_pred["conf"], global_pred["conf"]).reshape(-1)
+        k = max(3, int(len(conf) * keep_frac))
+        conf, idx = torch.topk(conf.float(), k)
+        key = "pts3d_local_aligned_to_global"
+        src.append(window_pred[key].reshape(-1, 3)[idx].float().numpy())
+        dst.append(global_pred[key].reshape(-1, 3)[idx].float().numpy())
+        weights.append(conf.numpy())
+    return umeyama(np.concatenate(src), np.concatenate(dst), np.concatenate(weights))
+
+
+def windowed_inference(
+    images: List[dict],
+    model,
+    lit_module,
+    device: torch.device,
+    window_size: int,
+    overlap: int = 4,
+    dtype: torch.dtype = torch.float32,
+    min_conf_thr_percentile: float = 0.1,
+    verbose: bool = True,
+    precision: str = "fp32",
+) -> Tuple[dict, List[Optional[dict]]]:
+    """
+    Run Fast3R on overlapping windows of the images and register every
+    window into the frame of the first one using the views they share.
+    Returns an output dictionary with aligned predictions for every image,
+    as inference followed by align_local_pts3d_to_global would, and the
+    profiling info of every window. precision is applied to every window,
+    see src.pipeline.precision.
+    """
+    from fast3r.dust3r.inference_multiview import inference
+
+    windows = plan_windows(len(images), window_size, overlap)
+    preds: List[Optional[dict]] = [None] * len(images)
+    views: List[Optional[dict]] = [None] * len(images)
+    profiling_infos = []
+
+    for i, window in enumerate(windows):
+        if verbose:
+            print(
+                f"[INFO] Window {i + 1}/{len(windows)}: views {window[0]}-{window[-1]}"
+            )
+        with autocast(precision, device):
+            output_dict, profiling_info = inference(
+                [images[j] for j in window],
+                model,
+                device,
+                dtype=dtype,
+                verbose=verbose,
+                profiling=True,
+            )
+        to_float32(output_dict)
+        lit_module.align_local_pts3d_to_global(
+            preds=output_dict["preds"],
+            views=output_dict["views"],
+            min_conf_thr_percentile=min_conf_thr_percentile,
+        )
+        profiling_infos.append(profiling_info)
+
+        # keep finished windows on the host, the device only holds one window
+        window_preds = [_to_cpu(pred) for pred in output_dict["preds"]]
+        window_views = [_to_cpu(view) for view in output_dict["views"]]
+        del output_dict
+
+        shared = [k for k, j in enumerate(window) if preds[j] is not None]
+        if shared:
+            sim3 = _register(
+                [window_preds[k] for k in shared],
+                [preds[window[k]] for k in shared],
+            )
+            if verbose:
+                print(f"[INFO] Window {i + 1} registered with scale {sim3.scale:.4f}")
+            window_preds = [_transform_pred(pred, sim3) for pred in window_preds]
+
+        for k, j in enumerate(window):
+            if preds[j] is None:
+                preds[j] = window_preds[k]
+                views[j] = window_views[k]
+
+        if device.type == "cuda":
+            torch.cuda.empty_cache()
+
+    return {"preds": preds, "views": views}, profiling_infos
@@ -0,0 +1,208 @@
+"""
+Parameter sweep over confidence thresholds and voxel sizes
+
+Points of every view are ranked by confidence once, so every threshold is
+a prefix of every view. For each voxel size the thresholds are visited from
+the strictest to the loosest and only the points a threshold adds are
+folded into one incremental voxel grid.
+"""
+
+import csv
+import dataclasses
+import os
+import time
+
+import open3d as o3d
+import numpy as np
+
+from typing import Dict, List, Optional
+
+from src.pipeline.output import OutputStage
+from src.pipeline.sfm.fast3r import Fast3RSfM
+from src.utils.compact import CompactPointCloud
+from src.utils.io import (
+    export_view_images,
+    image_name,
+    pcd_arrays,
+    write_cameras_txt,
+    write_images_txt,
+    write_points3D_ply,
+    write_points3D_txt,
+)
+from src.utils.pointcloud import OutlierRemoval, VoxelGrid, transform_pointcloud
+
+
+def grid_dir(output: str, conf_thr: float, voxel_size: float) -> str:
+    return os.path.join(output, f"conf{conf_thr:g}_voxel{voxel_size:g}")
+
+
+def _prefix_lengths(sizes: List[int], conf_thr: float) -> np.ndarray:
+    # same rounding as Fast3RSfM._inference_to_pcds
+    return np.array([max(1, int(size * (1.0 - conf_thr))) for size in sizes])
+
+
+def _gather(arrays: List[np.ndarray], starts: np.ndarray, stops: np.ndarray):
+    return np.concatenate([a[i:j] for a, i, j in zip(arrays, starts, stops)])
+
+
+def _write_grid_point(
+    sfm: Fast3RSfM,
+    views: list,
+    dir: str,
+    points: np.ndarray,
+    colors: np.ndarray,
+    confidences: np.ndarray,
+    conf_thr: float,
+    image_format: Optional[str],
+    ply: bool,
+    compact: bool,
+) -> None:
+    pcd = o3d.geometry.PointCloud()
+    pcd.points = o3d.utility.Vector3dVector(points.astype(np.float64))
+    pcd.colors = o3d.utility.Vector3dVector(colors / 255.0)
+    transform_pointcloud(pcd, sfm.alignment)
+
+    os.makedirs(dir, exist_ok=True)
+    with OutputStage(tracer=sfm.tracer) as output_stage:
+        output_stage.submit("cameras.txt", write_cameras_txt, sfm.cameras, dir)
+        # the views point at the shared images, which are linked, not re-encoded
+        output_stage.submit(
+            "images.txt",
+            write_images_txt,
+            views,
+            dir,
+            save_new_images=False,
+            conf_threshold=conf_thr,
+            image_format=image_format,
+        )
+        output_stage.submit("points3D.txt", write_points3D_txt, pcd, dir)
+        if ply:
+            output_stage.submit("points3D.ply", write_points3D_ply, pcd, dir)
+        if compact:
+            output_stage.submit(
+                "points3D.gspc",
+                lambda: CompactPointCloud.encode(*pcd_arrays(pcd), confidences).save(
+                    f"{dir}/points3D.gspc"
+                ),
+            )
+
+
+def sweep(
+    sfm: Fast3RSfM,
+    output: str,
+    conf_thrs: List[float],
+    voxel_sizes: List[float],
+    image_format: Optional[str] = None,
+    image_quality: Optional[int] = None,
+    ply: bool = False,
+    outliers: Optional[OutlierRemoval] = None,
+    compact: bool = False,
+) -> List[Dict[str, float]]:
+    """
+    Export a COLMAP model to output/conf{c}_voxel{v} for every pair of
+    confidence threshold and voxel size (0 disables downsampling), and a
+    summary.csv of point counts and timings.
+    If outliers is set, outliers are removed from every model. With compact,
+    every model also gets a points3D.gspc, see CompactPointCloud.
+    Images are exported once to output/images and linked into every model.
+    Returns the summary rows.
+    """
+    conf_thrs = sorted(set(conf_thrs), reverse=True)
+    voxel_sizes = sorted(set(voxel_sizes))
+    os.makedirs(output, exist_ok=True)
+
+    start = time.perf_counter()
+    sfm.build_views()
+    with sfm.tracer.stage("rank_points"):
+        points, colors, confidences, sizes = sfm.rank_points(1.0 - min(conf_thrs))
+    print(f"[INFO] Views built and points ranked in {time.perf_counter() - start:.2f} seconds")
+
+    start = time.perf_counter()
+    firsts = np.zeros(len(sizes), dtype=int)
+    # the points of the strictest threshold are enough to align them
+    sfm.alignment = sfm.estimate_alignment(
+        _gather(points, firsts, _prefix_lengths(sizes, conf_thrs[0]))
+    )
+    sfm.poses.c2w[:] = sfm.alignment.apply_poses(sfm.poses.c2w)
+    export_view_images(
+        sfm.views, output, image_format=image_format, quality=image_quality
+    )
+    views = [
+        dataclasses.replace(
+            view,
+            img_path=f"{output}/images/{image_name(view, id, image_format)}",
+            img=None,
+        )
+        for id, view in enumerate(sfm.views, start=1)
+    ]
+    print(f"[INFO] Alignment and images in {time.perf_counter() - start:.2f} seconds")
+
+    rows = []
+    for voxel_size in voxel_sizes:
+        grid = VoxelGrid(voxel_size) if voxel_size > 0 else None
+        previous = firsts
+        for conf_thr in conf_thrs:
+            start = time.perf_counter()
+            lengths = _prefix_lengths(sizes, conf_thr)
+            if grid is None:
+                kept_points = _gather(points, firsts, lengths)
+                kept_colors = _gather(colors, firsts, lengths)
+                kept_confidences = _gather(confidences, firsts, lengths)
+            else:
+                # only the points this threshold adds to the previous one
+                grid.add(
+                    _gather(points, previous, lengths).astype(np.float64),
+                    _gather(colors, previous, lengths),
+                    _gather(confidences, previous, lengths),
+                )
+                kept_points, kept_colors, kept_confidences = grid.result()
+            previous = lengths
+            removed = 0
+            if outliers is not None:
+                with sfm.tracer.stage("outlier_removal", method=outliers.method):
+                    keep = outliers.inliers(kept_points)
+                kept_points, kept_colors = kept_points[keep], kept_colors[keep]
+                kept_confidences = kept_confidences[keep]
+                removed = int(len(keep) - keep.sum())
+            select_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            _write_grid_point(
+                sfm,
+                views,
+                grid_dir(output, conf_thr, voxel_size),
+                kept_points,
+                kept_colors,
+                kept_confidences,
+                conf_thr,
+                image_format,
+                ply,
+                compact,
+            )
+            rows.append(
+                {
+                    "conf_thr": conf_thr,
+                    "voxel_size": voxel_size,
+                    "points": len(kept_points),
+                    "outliers": removed,
+                    "select_seconds": select_seconds,
+                    "output_seconds": time.perf_counter() - start,
+                }
+            )
+
+    with open(os.path.join(output, "summary.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(
+        f"{'conf_thr':>10} {'voxel_size':>10} {'points':>10} {'outliers':>10} "
+        f"{'select':>8} {'output':>8}"
+    )
+    for row in rows:
+        print(
+            f"{row['conf_thr']:>10g} {row['voxel_size']:>10g} {row['points']:>10d} "
+            f"{row['outliers']:>10d} "
+            f"{row['select_seconds']:>7.2f}s {row['output_seconds']:>7.2f}s"
+        )
+    return rows
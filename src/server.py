@@ -0,0 +1,173 @@
+"""
+Resident reconstruction server keeping Fast3R loaded between jobs
+
+    POST /jobs       {"input": ..., "output": ..., "confidence": 0.1, "voxel_size": 0.01}
+    GET  /jobs       all jobs
+    GET  /jobs/<id>  status and stage timings of one job
+
+Only the most recent finished jobs are kept, see --max-finished.
+"""
+
+import argparse
+import json
+import queue
+import threading
+import time
+import traceback
+import uuid
+
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from src.pipeline.reconstruct import load_model, reconstruct
+
+
+@dataclass
+class Job:
+    id: str
+    input: str
+    output: str
+    confidence: float = 0.1
+    voxel_size: float = 0.01
+    status: str = "queued"
+    submitted: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+class ReconstructionServer:
+    """
+    Job queue served by one worker thread owning the model.
+    Finished jobs beyond the max_finished most recent ones are forgotten.
+    """
+
+    def __init__(self, device=None, max_finished: int = 1000):
+        self.model, self.lit_module, self.device = load_model(device)
+        self.max_finished = max_finished
+        # guards jobs, which handler threads read while the worker evicts
+        self.lock = threading.Lock()
+        self.jobs: Dict[str, Job] = {}
+        self.finished: "deque[str]" = deque()
+        self.queue: "queue.Queue[Job]" = queue.Queue()
+        self.worker = threading.Thread(target=self._work, daemon=True)
+        self.worker.start()
+
+    def submit(self, request: dict) -> Job:
+        """
+        Queue a job. Raises ValueError if the request is not a JSON object
+        with string input and output paths and numeric settings.
+        """
+        if not isinstance(request, dict):
+            raise ValueError(f"expected a JSON object, got {type(request).__name__}")
+        for key in ("input", "output"):
+            if not isinstance(request.get(key), str):
+                raise ValueError(f"{key} must be a string path")
+        job = Job(
+            id=uuid.uuid4().hex[:12],
+            input=request["input"],
+            output=request["output"],
+            confidence=float(request.get("confidence", 0.1)),
+            voxel_size=float(request.get("voxel_size", 0.01)),
+        )
+        with self.lock:
+            self.jobs[job.id] = job
+        self.queue.put(job)
+        return job
+
+    def get_job(self, id: str) -> Optional[dict]:
+        with self.lock:
+            job = self.jobs.get(id)
+            return asdict(job) if job is not None else None
+
+    def list_jobs(self) -> list:
+        with self.lock:
+            return [asdict(job) for job in self.jobs.values()]
+
+    def _finish(self, job: Job) -> None:
+        with self.lock:
+            job.finished = time.time()
+            self.finished.append(job.id)
+            while len(self.finished) > self.max_finished:
+                del self.jobs[self.finished.popleft()]
+
+    def _work(self) -> None:
+        while True:
+            job = self.queue.get()
+            job.status = "running"
+            job.started = time.time()
+            try:
+                job.timings = reconstruct(
+                    self.model,
+                    self.lit_module,
+                    self.device,
+                    job.input,
+                    job.output,
+                    confidence=job.confidence,
+                    voxel_size=job.voxel_size,
+                )
+                job.status = "done"
+            except Exception as e:
+                traceback.print_exc()
+                job.status = "failed"
+                job.error = f"{type(e).__name__}: {e}"
+            self._finish(job)
+            print(f"[INFO] Job {job.id} {job.status}: {job.timings}")
+
+
+def make_handler(server: ReconstructionServer):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code: int, body) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            job = server.get_job(parts[1]) if len(parts) == 2 and parts[0] == "jobs" else None
+            if parts == ["jobs"]:
+                self._reply(200, server.list_jobs())
+            elif job is not None:
+                self._reply(200, job)
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path.strip("/") != "jobs":
+                self._reply(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                job = server.submit(json.loads(self.rfile.read(length)))
+            except (KeyError, TypeError, ValueError) as e:
+                self._reply(400, {"error": f"bad request: {e}"})
+                return
+            self._reply(202, asdict(job))
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve Fast3R reconstructions with the model kept loaded."
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--max-finished",
+        type=int,
+        default=1000,
+        help="Number of finished jobs kept for GET /jobs, older ones are forgotten.",
+    )
+    args = parser.parse_args()
+
+    server = ReconstructionServer(max_finished=args.max_finished)
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(server))
+    print(f"[INFO] Listening on http://{args.host}:{args.port}")
+    httpd.serve_forever()
@@ -0,0 +1,315 @@
+"""
+Similarity transforms between reconstructions
+"""
+
+import itertools
+import math
+import os
+
+import numpy as np
+
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+
+@dataclass
+class Sim3:
+    """
+    Similarity transform x -> scale * rotation @ x + translation.
+    """
+
+    scale: float
+    rotation: np.ndarray
+    translation: np.ndarray
+
+    @classmethod
+    def identity(cls) -> "Sim3":
+        return cls(scale=1.0, rotation=np.eye(3), translation=np.zeros(3))
+
+    def apply(self, points: np.ndarray) -> np.ndarray:
+        """
+        Transform (N, 3) points.
+        """
+        return self.scale * points @ self.rotation.T + self.translation
+
+    def apply_poses(self, c2w: np.ndarray) -> np.ndarray:
+        """
+        Transform (N, 4, 4) camera-to-world poses; rotations stay orthonormal.
+        """
+        out = np.array(c2w, dtype=np.float64)
+        out[:, :3, :3] = self.rotation @ out[:, :3, :3]
+        out[:, :3, 3] = self.apply(out[:, :3, 3])
+        return out
+
+    def __matmul__(self, other: "Sim3") -> "Sim3":
+        """
+        Composition, (self @ other).apply(x) == self.apply(other.apply(x)).
+        """
+        return Sim3(
+            scale=self.scale * other.scale,
+            rotation=self.rotation @ other.rotation,
+            translation=self.apply(other.translation),
+        )
+
+
+def umeyama_batch(
+    src: np.ndarray,
+    dst: np.ndarray,
+    weights: Optional[np.ndarray] = None,
+    with_scale: bool = True,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    umeyama for B problems at once: (B, N, 3) src and dst, optional (B, N)
+    weights. Returns (B,) scales, (B, 3, 3) rotations and (B, 3) translations.
+    """
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    w = np.ones(src.shape[:2]) if weights is None else np.asarray(weights, np.float64)
+    w = w / w.sum(axis=1, keepdims=True)
+
+    mu_src = np.einsum("bn,bnk->bk", w, src)
+    mu_dst = np.einsum("bn,bnk->bk", w, dst)
+    src_c = src - mu_src[:, None]
+    dst_c = dst - mu_dst[:, None]
+
+    cov = np.einsum("bn,bni,bnj->bij", w, dst_c, src_c)
+    U, D, Vt = np.linalg.svd(cov)
+    S = np.ones((len(src), 3))
+    S[np.linalg.det(U) * np.linalg.det(Vt) < 0, 2] = -1
+    rotations = U @ (S[:, :, None] * Vt)
+
+    scales = np.ones(len(src))
+    if with_scale:
+        var_src = np.einsum("bn,bn->b", w, (src_c**2).sum(axis=2))
+        scales = (D * S).sum(axis=1) / var_src
+
+    translations = mu_dst - scales[:, None] * np.einsum("bij,bj->bi", rotations, mu_src)
+    return scales, rotations, translations
+
+
+def umeyama(
+    src: np.ndarray,
+    dst: np.ndarray,
+    weights: Optional[np.ndarray] = None,
+    with_scale: bool = True,
+) -> Sim3:
+    """
+    Least squares similarity transform mapping (N, 3) src onto dst,
+    optionally weighting every correspondence.
+    see: Umeyama, "Least-squares estimation of transformation parameters
+    between two point patterns", TPAMI 1991.
+    """
+    scales, rotations, translations = umeyama_batch(
+        np.asarray(src)[None],
+        np.asarray(dst)[None],
+        None if weights is None else np.asarray(weights)[None],
+        with_scale,
+    )
+    return Sim3(
+        scale=float(scales[0]), rotation=rotations[0], translation=translations[0]
+    )
+
+
+def _spread(points: np.ndarray) -> float:
+    """
+    RMS distance of the points to their centroid.
+    """
+    return float(np.sqrt(((points - points.mean(axis=0)) ** 2).sum(axis=1).mean()))
+
+
+def ransac_umeyama(
+    src: np.ndarray,
+    dst: np.ndarray,
+    iterations: int = 512,
+    threshold: Optional[float] = None,
+    seed: int = 0,
+) -> Tuple[Sim3, np.ndarray]:
+    """
+    Robust similarity transform mapping (N, 3) src onto matched dst, N >= 3.
+    All minimal samples of three correspondences (every triplet if there
+    are at most iterations of them) are solved in one batch and scored by
+    MSAC; the best one is refit on its inliers. threshold is the inlier
+    distance in dst units, 5% of the spread of dst by default.
+    Returns the transform and the inlier mask.
+    """
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    n = len(src)
+    if n < 3:
+        raise ValueError(f"At least 3 correspondences are needed, got {n}")
+    if threshold is None:
+        threshold = 0.05 * _spread(dst)
+
+    if math.comb(n, 3) <= iterations:
+        samples = np.array(list(itertools.combinations(range(n), 3)))
+    else:
+        rng = np.random.default_rng(seed)
+        samples = np.argsort(rng.random((iterations, n)), axis=1)[:, :3]
+
+    # degenerate (collinear) samples give nan or huge residuals, never inliers
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scales, rotations, translations = umeyama_batch(src[samples], dst[samples])
+        moved = (
+            scales[:, None, None] * np.einsum("bij,nj->bni", rotations, src)
+            + translations[:, None]
+        )
+        residuals = np.linalg.norm(moved - dst[None], axis=2)
+    costs = np.minimum(np.nan_to_num(residuals, nan=np.inf), threshold) ** 2
+    inliers = residuals[np.argmin(costs.sum(axis=1))] < threshold
+    if inliers.sum() < 3:
+        inliers = np.ones(n, dtype=bool)
+
+    sim3 = umeyama(src[inliers], dst[inliers])
+    inliers = np.linalg.norm(sim3.apply(src) - dst, axis=1) < threshold
+    if inliers.sum() >= 3:
+        sim3 = umeyama(src[inliers], dst[inliers])
+    return sim3, inliers
+
+
+def _initial_alignments(src: np.ndarray, dst: np.ndarray) -> List[Sim3]:
+    """
+    Matching centroids and spreads, with no rotation and with the four
+    proper rotations mapping the principal axes of src onto those of dst.
+    """
+    mu_src, mu_dst = src.mean(axis=0), dst.mean(axis=0)
+    axes_src = np.linalg.eigh(np.cov((src - mu_src).T))[1]
+    axes_dst = np.linalg.eigh(np.cov((dst - mu_dst).T))[1]
+    scale = _spread(dst) / _spread(src)
+    inits = [Sim3(scale, np.eye(3), mu_dst - scale * mu_src)]
+    for signs in itertools.product([1, -1], repeat=2):
+        flips = np.array([*signs, 1.0])
+        rotation = axes_dst @ np.diag(flips) @ axes_src.T
+        if np.linalg.det(rotation) < 0:
+            rotation = axes_dst @ np.diag(flips * [1, 1, -1]) @ axes_src.T
+        inits.append(Sim3(scale, rotation, mu_dst - scale * rotation @ mu_src))
+    return inits
+
+
+def icp_sim3(
+    src: np.ndarray,
+    dst: np.ndarray,
+    init: Optional[Sim3] = None,
+    iterations: int = 30,
+    max_points: int = 50_000,
+    trim: float = 0.8,
+    tolerance: float = 1e-5,
+    seed: int = 0,
+) -> Tuple[Sim3, float]:
+    """
+    Similarity transform mapping unmatched (N, 3) src onto (M, 3) dst by
+    iterating nearest neighbour correspondences (KD-tree) and umeyama on
+    the trim closest fraction of them. Both sets are subsampled to
+    max_points. Without init, ICP starts from the unrotated and from every
+    principal axes alignment and the best result is kept, so the clouds
+    need distinct principal axes or roughly the same orientation.
+    Returns the transform and the mean distance of the kept correspondences.
+    """
+    from scipy.spatial import cKDTree
+
+    rng = np.random.default_rng(seed)
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    if len(src) > max_points:
+        src = src[rng.choice(len(src), max_points, replace=False)]
+    if len(dst) > max_points:
+        dst = dst[rng.choice(len(dst), max_points, replace=False)]
+    tree = cKDTree(dst)
+
+    best, best_error = None, np.inf
+    for sim3 in [init] if init is not None else _initial_alignments(src, dst):
+        previous = np.inf
+        for _ in range(iterations):
+            moved = sim3.apply(src)
+            distances, idx = tree.query(moved, workers=-1)
+            keep = distances <= np.quantile(distances, trim)
+            sim3 = umeyama(moved[keep], dst[idx[keep]]) @ sim3
+            error = float(distances[keep].mean())
+            if previous - error <= tolerance * error:
+                break
+            previous = error
+        if error < best_error:
+            best, best_error = sim3, error
+    return best, best_error
+
+
+def qvec_to_rotation(qvecs: np.ndarray) -> np.ndarray:
+    """
+    (N, 4) [w, x, y, z] quaternions -> (N, 3, 3) rotation matrices.
+    """
+    w, x, y, z = (np.asarray(qvecs, np.float64) / np.linalg.norm(qvecs, axis=1, keepdims=True)).T
+    return np.stack(
+        [
+            np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)], -1),
+            np.stack([2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)], -1),
+            np.stack([2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)], -1),
+        ],
+        axis=1,
+    )
+
+
+def camera_centers(qvecs: np.ndarray, tvecs: np.ndarray) -> np.ndarray:
+    """
+    (N, 3) camera centers of COLMAP world-to-camera poses, -R^T t.
+    """
+    R = qvec_to_rotation(qvecs)
+    return -np.einsum("nji,nj->ni", R, np.asarray(tvecs, np.float64))
+
+
+def align_to_reference(
+    names: List[str],
+    c2w: np.ndarray,
+    reference: str,
+    points: Optional[np.ndarray] = None,
+    min_matches: int = 3,
+) -> Sim3:
+    """
+    Similarity transform from the frame of the (N, 4, 4) camera-to-world
+    poses of the images names to the frame of the COLMAP model in reference.
+    Camera centers of images with the same name are aligned by
+    ransac_umeyama; with fewer than min_matches of them, points are aligned
+    to the reference points by icp_sim3 instead.
+    """
+    from src.utils.io import (
+        read_images_binary,
+        read_images_txt,
+        read_points3D_binary,
+        read_points3D_txt,
+    )
+
+    binary = os.path.exists(f"{reference}/images.bin")
+    images = (
+        read_images_binary(f"{reference}/images.bin")
+        if binary
+        else read_images_txt(f"{reference}/images.txt")
+    )
+    index = {name: i for i, name in enumerate(images.names)}
+    matched = [(i, index[name]) for i, name in enumerate(names) if name in index]
+
+    if len(matched) >= min_matches:
+        src_ids, dst_ids = np.array(matched).T
+        centers = camera_centers(images.qvecs[dst_ids], images.tvecs[dst_ids])
+        sim3, inliers = ransac_umeyama(np.asarray(c2w)[src_ids, :3, 3], centers)
+        print(
+            f"[INFO] Aligned to {reference} on {inliers.sum()}/{len(matched)} "
+            f"matched cameras, scale {sim3.scale:.4g}"
+        )
+        return sim3
+
+    if points is None:
+        raise ValueError(
+            f"Only {len(matched)} images match {reference} and no points were given"
+        )
+    points3D = (
+        read_points3D_binary(f"{reference}/points3D.bin")
+        if binary
+        else read_points3D_txt(f"{reference}/points3D.txt")
+    )
+    if len(points3D.xyz) == 0:
+        raise ValueError(f"Only {len(matched)} images match {reference}, which has no points")
+    print(
+        f"[WARNING] Only {len(matched)} images match {reference}, "
+        "aligning points by nearest neighbours"
+    )
+    sim3, error = icp_sim3(points, points3D.xyz)
+    print(f"[INFO] Aligned to {reference} points, scale {sim3.scale:.4g}, mean distance {error:.4g}")
+    return sim3
@@ -0,0 +1,235 @@
+"""
+Compact quantized point cloud container
+"""
+
+import mmap
+import struct
+
+import numpy as np
+
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+MAGIC = b"GSPC"
+VERSION = 1
+# magic, version, number of points, number of chunks, flags
+HEADER = struct.Struct("<4sIQQI4x")
+HAS_CONFIDENCE = 1
+QUANT_MAX = np.iinfo(np.uint16).max
+
+
+def _spread_bits(v: np.ndarray) -> np.ndarray:
+    """
+    Insert two zero bits between each of the lower 10 bits of v.
+    """
+    v = v.astype(np.uint32) & 0x3FF
+    v = (v | (v << 16)) & 0x030000FF
+    v = (v | (v << 8)) & 0x0300F00F
+    v = (v | (v << 4)) & 0x030C30C3
+    v = (v | (v << 2)) & 0x09249249
+    return v
+
+
+def morton_order(points: np.ndarray) -> np.ndarray:
+    """
+    Indices sorting the points along a 30-bit Z-order curve over their bounds.
+    """
+    lo = points.min(axis=0)
+    extent = np.maximum(points.max(axis=0) - lo, np.finfo(np.float64).tiny)
+    grid = ((points - lo) / extent * 1023).astype(np.uint32)
+    codes = (
+        _spread_bits(grid[:, 0])
+        | (_spread_bits(grid[:, 1]) << 1)
+        | (_spread_bits(grid[:, 2]) << 2)
+    )
+    return np.argsort(codes, kind="stable")
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+@dataclass
+class CompactPointCloud:
+    """
+    Point cloud split into spatially coherent chunks.
+    Positions are quantized to 16 bits per axis within the bounds of their
+    chunk, colors are uint8 and confidences float16. Points of chunk i are
+    rows chunk_offsets[i]:chunk_offsets[i + 1].
+    """
+
+    positions: np.ndarray
+    colors: np.ndarray
+    chunk_offsets: np.ndarray
+    chunk_min: np.ndarray
+    chunk_max: np.ndarray
+    confidence: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    @property
+    def num_chunks(self) -> int:
+        return len(self.chunk_min)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [
+            self.positions,
+            self.colors,
+            self.chunk_offsets,
+            self.chunk_min,
+            self.chunk_max,
+        ]
+        if self.confidence is not None:
+            arrays.append(self.confidence)
+        return sum(a.nbytes for a in arrays)
+
+    @classmethod
+    def encode(
+        cls,
+        points: np.ndarray,
+        colors: np.ndarray,
+        confidence: Optional[np.ndarray] = None,
+        chunk_size: int = 1 << 16,
+    ) -> "CompactPointCloud":
+        """
+        Quantize (N, 3) points with (N, 3) uint8 colors and optional (N,)
+        confidences. Points are reordered along a Z-order curve so that
+        chunks are compact in space.
+        """
+        if len(points) == 0:
+            return cls(
+                positions=np.empty((0, 3), np.uint16),
+                colors=np.empty((0, 3), np.uint8),
+                chunk_offsets=np.zeros(1, np.int64),
+                chunk_min=np.empty((0, 3), np.float32),
+                chunk_max=np.empty((0, 3), np.float32),
+                confidence=None if confidence is None else np.empty(0, np.float16),
+            )
+
+        order = morton_order(points)
+        points = np.asarray(points, dtype=np.float64)[order]
+        chunk_offsets = np.append(
+            np.arange(0, len(points), chunk_size, dtype=np.int64), len(points)
+        )
+        starts = chunk_offsets[:-1]
+        # bounds are stored as float32, round them outwards
+        chunk_min = np.nextafter(
+            np.minimum.reduceat(points, starts).astype(np.float32), -np.inf
+        )
+        chunk_max = np.nextafter(
+            np.maximum.reduceat(points, starts).astype(np.float32), np.inf
+        )
+
+        chunk_ids = np.repeat(np.arange(len(starts)), np.diff(chunk_offsets))
+        lo = chunk_min.astype(np.float64)
+        scale = QUANT_MAX / (chunk_max.astype(np.float64) - lo)
+        positions = np.rint((points - lo[chunk_ids]) * scale[chunk_ids])
+        positions = np.clip(positions, 0, QUANT_MAX).astype(np.uint16)
+
+        return cls(
+            positions=positions,
+            colors=np.asarray(colors, dtype=np.uint8)[order],
+            chunk_offsets=chunk_offsets,
+            chunk_min=chunk_min,
+            chunk_max=chunk_max,
+            confidence=(
+                None
+                if confidence is None
+                else np.asarray(confidence, dtype=np.float16)[order]
+            ),
+        )
+
+    def decode(
+        self, chunks: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """
+        Dequantize all chunks, or only the given chunk indices.
+        Returns float32 points, uint8 colors and float16 confidences.
+        """
+        if chunks is None:
+            chunks = np.arange(self.num_chunks)
+        chunks = np.asarray(chunks, dtype=np.int64)
+        counts = self.chunk_offsets[chunks + 1] - self.chunk_offsets[chunks]
+        starts = self.chunk_offsets[chunks]
+        rows = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(
+            counts.sum()
+        )
+        chunk_ids = np.repeat(chunks, counts)
+
+        lo = self.chunk_min[chunk_ids]
+        step = (self.chunk_max[chunk_ids] - lo) / np.float32(QUANT_MAX)
+        points = lo + self.positions[rows].astype(np.float32) * step
+        confidence = None if self.confidence is None else self.confidence[rows]
+        return points, self.colors[rows], confidence
+
+    def query(self, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+        """
+        Indices of the chunks whose bounds intersect the box [lo, hi].
+        """
+        overlap = np.all(self.chunk_max >= lo, axis=1) & np.all(
+            self.chunk_min <= hi, axis=1
+        )
+        return np.flatnonzero(overlap)
+
+    def _arrays(self) -> list:
+        arrays = [
+            self.chunk_offsets.astype("<i8"),
+            self.chunk_min.astype("<f4"),
+            self.chunk_max.astype("<f4"),
+            self.positions.astype("<u2"),
+            self.colors.astype("u1"),
+        ]
+        if self.confidence is not None:
+            arrays.append(self.confidence.astype("<f2"))
+        return arrays
+
+    def save(self, path: str) -> None:
+        """
+        Save as a header followed by the 8-byte aligned arrays.
+        """
+        flags = HAS_CONFIDENCE if self.confidence is not None else 0
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self), self.num_chunks, flags))
+            for array in self._arrays():
+                f.write(b"\x00" * (_align(f.tell()) - f.tell()))
+                f.write(np.ascontiguousarray(array).tobytes())
+
+    @classmethod
+    def load(cls, path: str) -> "CompactPointCloud":
+        """
+        Memory-map a file written by save; arrays are read-only views.
+        """
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, num_points, num_chunks, flags = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a compact point cloud (v{VERSION})")
+
+        layout = [
+            ("<i8", (num_chunks + 1,)),
+            ("<f4", (num_chunks, 3)),
+            ("<f4", (num_chunks, 3)),
+            ("<u2", (num_points, 3)),
+            ("u1", (num_points, 3)),
+        ]
+        if flags & HAS_CONFIDENCE:
+            layout.append(("<f2", (num_points,)))
+
+        arrays = []
+        offset = HEADER.size
+        for dtype, shape in layout:
+            offset = _align(offset)
+            count = int(np.prod(shape))
+            arrays.append(np.frombuffer(buf, dtype, count, offset).reshape(shape))
+            offset += count * np.dtype(dtype).itemsize
+
+        return cls(
+            chunk_offsets=arrays[0],
+            chunk_min=arrays[1],
+            chunk_max=arrays[2],
+            positions=arrays[3],
+            colors=arrays[4],
+            confidence=arrays[5] if len(arrays) > 5 else None,
+        )
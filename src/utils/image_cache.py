@@ -0,0 +1,172 @@
+"""
+On-disk cache of decoded and resized input images
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import torch
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Union
+
+# same as fast3r.dust3r.utils.image.load_images
+SUPPORTED_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def list_images(folder_or_list: Union[str, List[str]]) -> List[str]:
+    """
+    Image paths in the order load_images reads them.
+    """
+    if isinstance(folder_or_list, str):
+        return [
+            os.path.join(folder_or_list, name)
+            for name in sorted(os.listdir(folder_or_list))
+            if name.lower().endswith(SUPPORTED_EXTENSIONS)
+        ]
+    return list(folder_or_list)
+
+
+def _to_uint8(img: torch.Tensor) -> np.ndarray:
+    """
+    (1, 3, H, W) image normalized to [-1, 1] -> (H, W, 3) uint8, lossless.
+    """
+    img = ((img[0] + 1) * 127.5).round().clamp(0, 255).to(torch.uint8)
+    return img.permute(1, 2, 0).contiguous().numpy()
+
+
+def _from_uint8(img: np.ndarray) -> torch.Tensor:
+    """
+    Inverse of _to_uint8, same operations as the ToTensor and Normalize of
+    load_images so the result is bit-identical.
+    """
+    img = torch.from_numpy(img).permute(2, 0, 1)[None]
+    return (img.float().div(255) - 0.5) / 0.5
+
+
+def _encode_meta(value):
+    if isinstance(value, np.ndarray):
+        return {"array": value.tolist(), "dtype": str(value.dtype)}
+    return value
+
+
+def _decode_meta(value):
+    if isinstance(value, dict) and "array" in value:
+        return np.array(value["array"], dtype=value["dtype"])
+    return value
+
+
+class ImageCache:
+    """
+    Cache of load_images results keyed by file content and target size.
+    Pixels are stored as memory-mappable uint8 .npy files next to a JSON file
+    with the other fields. Least recently used entries are evicted once the
+    cache grows over max_bytes.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: Optional[int] = None,
+        workers: Optional[int] = None,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.workers = workers
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, path: str, size: int, **kwargs) -> str:
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        digest.update(json.dumps({"size": size, **kwargs}, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def _paths(self, key: str) -> tuple:
+        base = os.path.join(self.cache_dir, key)
+        return f"{base}.npy", f"{base}.json"
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Cached entry without idx/instance, or None.
+        """
+        pixels_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            # copy-on-write keeps the mapping writable for torch.from_numpy
+            pixels = np.load(pixels_path, mmap_mode="c")
+        except (OSError, ValueError):
+            return None
+        os.utime(pixels_path)
+        entry = {k: _decode_meta(v) for k, v in meta.items()}
+        entry["img"] = _from_uint8(pixels)
+        return entry
+
+    def put(self, key: str, entry: dict) -> None:
+        pixels_path, meta_path = self._paths(key)
+        meta = {
+            k: _encode_meta(v)
+            for k, v in entry.items()
+            if k not in ("img", "idx", "instance")
+        }
+        # write to temporary files first, readers never see partial entries
+        tmp = f".{os.getpid()}.{id(entry)}.tmp"
+        with open(pixels_path + tmp, "wb") as f:
+            np.save(f, _to_uint8(entry["img"]))
+        with open(meta_path + tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + tmp, meta_path)
+        os.replace(pixels_path + tmp, pixels_path)
+
+    def evict(self) -> None:
+        """
+        Remove least recently used entries until the cache fits in max_bytes.
+        """
+        if self.max_bytes is None:
+            return
+        entries = []
+        for path in Path(self.cache_dir).glob("*.npy"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            path.with_suffix(".json").unlink(missing_ok=True)
+            total -= size
+
+    def _load(self, path: str, size: int, **kwargs) -> dict:
+        from fast3r.dust3r.utils.image import load_images
+
+        key = self.key(path, size, **kwargs)
+        entry = self.get(key)
+        if entry is None:
+            entry = load_images([path], size=size, verbose=False, **kwargs)[0]
+            self.put(key, entry)
+        return entry
+
+    def load_images(
+        self, folder_or_list: Union[str, List[str]], size: int, **kwargs
+    ) -> List[dict]:
+        """
+        Drop-in replacement of fast3r load_images; images missing from the
+        cache are decoded on a thread pool and stored.
+        """
+        paths = list_images(folder_or_list)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            entries = list(pool.map(lambda p: self._load(p, size, **kwargs), paths))
+        self.evict()
+
+        for i, entry in enumerate(entries):
+            entry["idx"] = i
+            entry["instance"] = str(i)
+        return entries
@@ -2,29 +2,182 @@
 I/O utils
 """
 
+import mmap
 import os
+import shutil
 import struct
 
-import cv2
-import open3d as o3d
+import numpy as np
 
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
+from dataclasses import dataclass
+from io import BytesIO
 from pathlib import Path
-from typing import List
+from typing import TYPE_CHECKING, List, Optional, Tuple
 
 from src.camera.camera import Camera
 from src.view.camera_view import CameraView
+from src.view.poses import Poses
+
+# cv2 and open3d are imported where needed, text and binary I/O works without them
+if TYPE_CHECKING:
+    import open3d as o3d
+
+# output extension -> name of the OpenCV quality / compression flag
+IMAGE_QUALITY_FLAGS = {
+    ".jpg": "IMWRITE_JPEG_QUALITY",
+    ".jpeg": "IMWRITE_JPEG_QUALITY",
+    ".png": "IMWRITE_PNG_COMPRESSION",
+    ".webp": "IMWRITE_WEBP_QUALITY",
+}
+
+
+def image_name(view: CameraView, id: int, image_format: Optional[str] = None) -> str:
+    """
+    Name of the exported image, with the extension replaced by image_format
+    (e.g. ".png") if given.
+    """
+    img_name = Path(view.img_path).name if view.img_path else f"IMG{id}.jpg"
+    if image_format:
+        img_name = Path(img_name).with_suffix(image_format).name
+    return img_name
+
+
+def _write_durable(path: str, data) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    """
+    Hardlink (or copy) src to dst through a temporary name in the directory
+    of dst, so dst is replaced atomically and never removed first; a no-op
+    if both are the same file.
+    """
+    if os.path.lexists(dst) and os.path.samefile(src, dst):
+        return
+    tmp = os.path.join(
+        os.path.dirname(dst) or ".", f".{os.path.basename(dst)}.{os.getpid()}.tmp"
+    )
+    try:
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)
+            with open(tmp, "rb") as f:
+                os.fsync(f.fileno())
+        os.replace(tmp, dst)
+    finally:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+
+
+def _fsync_dir(dir: str) -> None:
+    try:
+        fd = os.open(dir, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
 
 
 def save_image(
-    view: CameraView, dir: str, img_name: str, save_new_images: bool = True
+    view: CameraView,
+    dir: str,
+    img_name: str,
+    save_new_images: bool = True,
+    quality: Optional[int] = None,
 ) -> None:
+    """
+    Save the view image to {dir}/images/{img_name}.
+    The format follows the extension of img_name; quality is the JPEG/WebP
+    quality or the PNG compression level. Source files that need no
+    re-encoding are hardlinked (or copied) instead of decoded.
+    """
+    import cv2
+
+    path = f"{dir}/images/{img_name}"
+    ext = Path(img_name).suffix.lower()
     if view.img is not None and save_new_images:
-        img = cv2.cvtColor(view.img, cv2.COLOR_RGB2BGR)
-        cv2.imwrite(f"{dir}/images/{img_name}", img)
+        img = cv2.cvtColor(view.load_img(), cv2.COLOR_RGB2BGR)
     elif view.img_path:
-        cv2.imwrite(f"{dir}/images/{img_name}", cv2.imread(view.img_path))
+        if Path(view.img_path).suffix.lower() == ext and quality is None:
+            _link_or_copy(view.img_path, path)
+            return
+        img = cv2.imread(view.img_path)
     else:
-        print(f"[WARNING] Image for view {id + 1} is None, skipping saving image.")
+        print(f"[WARNING] Image for view {img_name} is None, skipping saving image.")
+        return
+
+    params = []
+    if quality is not None and ext in IMAGE_QUALITY_FLAGS:
+        params = [getattr(cv2, IMAGE_QUALITY_FLAGS[ext]), int(quality)]
+    ok, data = cv2.imencode(ext, img, params)
+    if not ok:
+        raise IOError(f"Could not encode image {path}")
+    _write_durable(path, data)
+
+
+def export_images(
+    views: List[CameraView],
+    img_names: List[str],
+    dir: str,
+    save_new_images: bool = True,
+    quality: Optional[int] = None,
+    workers: Optional[int] = None,
+    max_pending: Optional[int] = None,
+) -> None:
+    """
+    Save images of the views on a thread pool.
+    At most max_pending images are queued at a time. Returns once every
+    image is written and synced to disk; the first failed write is re-raised.
+    """
+    os.makedirs(f"{dir}/images", exist_ok=True)
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+    pending = BoundedSemaphore(max_pending or 2 * workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for view, img_name in zip(views, img_names):
+            pending.acquire()
+            future = pool.submit(
+                save_image, view, dir, img_name, save_new_images, quality
+            )
+            future.add_done_callback(lambda _: pending.release())
+            futures.append(future)
+        for future in futures:
+            future.result()
+    _fsync_dir(f"{dir}/images")
+
+
+def export_view_images(
+    views: List[CameraView],
+    dir: str,
+    conf_threshold: float = 0.0,
+    save_new_images: bool = True,
+    image_format: Optional[str] = None,
+    quality: Optional[int] = None,
+    workers: Optional[int] = None,
+) -> None:
+    """
+    Save the images write_images_txt lists for the views, under the same
+    names. Lets images be written before the poses are final.
+    """
+    ids = [id for id, view in enumerate(views) if view.confidence >= conf_threshold]
+    export_images(
+        [views[id] for id in ids],
+        [image_name(views[id], id + 1, image_format) for id in ids],
+        dir,
+        save_new_images,
+        quality,
+        workers,
+    )
 
 
 def write_cameras_txt(cameras: List[Camera], dir: str) -> None:
@@ -47,14 +200,22 @@ def write_images_txt(
     dir: str,
     save_new_images: bool = True,
     conf_threshold: float = 0.0,
+    image_format: Optional[str] = None,
+    quality: Optional[int] = None,
+    workers: Optional[int] = None,
+    save_images: bool = True,
 ) -> None:
     """
     Save camera views to a text file.
+    Images are exported in parallel, see export_images; save_images=False
+    skips them, e.g. when they were written by export_view_images.
     """
     os.makedirs(dir, exist_ok=True)
     os.makedirs(f"{dir}/images", exist_ok=True)
-    qvecs = [view.qvec() for view in views]
-    tvecs = [view.tvec() for view in views]
+    poses = Poses.from_views(views)
+    qvecs = poses.qvecs()
+    tvecs = poses.tvecs()
+    kept, img_names = [], []
     with open(f"{dir}/images.txt", "w") as f:
         f.write("# Image list with two lines of data per image:\n")
         f.write("#   IMAGE_ID, QW, QX, QY, QZ, TX, TY, TZ, CAMERA_ID, IMAGE_NAME\n")
@@ -66,25 +227,47 @@ def write_images_txt(
                 )
                 continue
 
-            img_name = Path(view.img_path).name if view.img_path else f"IMG{id + 1}.jpg"
+            img_name = image_name(view, id + 1, image_format)
             f.write(
                 f"{id + 1} {' '.join(map(str, qvecs[id]))} {' '.join(map(str, tvecs[id]))} {view.camera_id} {img_name}\n"
             )
             f.write("\n")
+            kept.append(view)
+            img_names.append(img_name)
 
-            save_image(view, dir, img_name, save_new_images)
+    if save_images:
+        export_images(kept, img_names, dir, save_new_images, quality, workers)
 
 
-def write_points3D_txt(pcd: o3d.geometry.PointCloud, dir: str) -> None:
+def write_points3D_txt(
+    pcd: "o3d.geometry.PointCloud",
+    dir: str,
+    precision: Optional[int] = None,
+    chunk_size: int = 1 << 16,
+) -> None:
+    """
+    Save the point cloud to points3D.txt, chunk_size points at a time.
+    Coordinates are written with the shortest round-trip repr by default,
+    or with a fixed number of decimals if precision is set.
+    """
+    coord = "%s" if precision is None else f"%.{precision}f"
+    row = f"%d {coord} {coord} {coord} %d %d %d 0\n"
+    points = np.asarray(pcd.points)
+    colors = np.asarray(pcd.colors)
+
+    block = np.empty((min(chunk_size, len(points)), 7), dtype=np.float64)
     with open(f"{dir}/points3D.txt", "w") as f:
         f.write("# 3D point list with one line of data per point:\n")
         f.write(
             "#   POINT3D_ID, X, Y, Z, R, G, B, ERROR, TRACK[] as (IMAGE_ID, POINT2D_IDX)\n"
         )
-        for i in range(len(pcd.points)):
-            x, y, z = pcd.points[i]
-            r, g, b = pcd.colors[i] * 255
-            f.write(f"{i} {x} {y} {z} {int(r)} {int(g)} {int(b)} {0}\n")
+        for start in range(0, len(points), chunk_size):
+            stop = min(start + chunk_size, len(points))
+            rows = block[: stop - start]
+            rows[:, 0] = np.arange(start, stop)
+            rows[:, 1:4] = points[start:stop]
+            np.trunc(colors[start:stop] * 255, out=rows[:, 4:7])
+            f.write((row * len(rows)) % tuple(rows.ravel().tolist()))
 
 
 def write_next_bytes(
@@ -105,65 +288,798 @@ def write_next_bytes(
     fid.write(bytes)
 
 
+# COLMAP binary records, see src/colmap/scene/reconstruction.cc
+CAMERA_BIN_DTYPE = np.dtype(
+    [
+        ("id", "<i4"),
+        ("model_id", "<i4"),
+        ("width", "<u8"),
+        ("height", "<u8"),
+        ("params", "<f8", (4,)),
+    ]
+)
+IMAGE_BIN_DTYPE = np.dtype(
+    [
+        ("id", "<i4"),
+        ("qvec", "<f8", (4,)),
+        ("tvec", "<f8", (3,)),
+        ("camera_id", "<i4"),
+    ]
+)
+POINT3D_BIN_DTYPE = np.dtype(
+    [
+        ("id", "<u8"),
+        ("xyz", "<f8", (3,)),
+        ("rgb", "u1", (3,)),
+        ("error", "<f8"),
+        ("track_length", "<u8"),
+    ]
+)
+
+POINT2D_BIN_DTYPE = np.dtype([("xy", "<f8", (2,)), ("point3D_id", "<i8")])
+TRACK_BIN_DTYPE = np.dtype([("image_id", "<i4"), ("point2D_idx", "<i4")])
+
+PINHOLE_MODEL_ID = 1
+
+# model id -> (model name, number of params), see src/colmap/sensor/models.h
+CAMERA_MODELS = {
+    0: ("SIMPLE_PINHOLE", 3),
+    1: ("PINHOLE", 4),
+    2: ("SIMPLE_RADIAL", 4),
+    3: ("RADIAL", 5),
+    4: ("OPENCV", 8),
+    5: ("OPENCV_FISHEYE", 8),
+    6: ("FULL_OPENCV", 12),
+    7: ("FOV", 5),
+    8: ("SIMPLE_RADIAL_FISHEYE", 4),
+    9: ("RADIAL_FISHEYE", 5),
+    10: ("THIN_PRISM_FISHEYE", 12),
+    11: ("RAD_TAN_THIN_PRISM_FISHEYE", 16),
+}
+
+
+def pcd_arrays(pcd: "o3d.geometry.PointCloud") -> tuple:
+    """
+    Get (N, 3) float64 points and uint8 colors of the point cloud.
+    Points are a zero-copy view of the Open3D buffer.
+    """
+    points = np.asarray(pcd.points)
+    colors = np.clip(np.asarray(pcd.colors) * 255, 0, 255).astype(np.uint8)
+    return points, colors
+
+
 def write_cameras_binary(cameras: List[Camera], dir: str) -> None:
     """
     see: src/colmap/scene/reconstruction.cc
         void Reconstruction::WriteCamerasBinary(const std::string& path)
         void Reconstruction::ReadCamerasBinary(const std::string& path)
     """
+    records = np.zeros(len(cameras), dtype=CAMERA_BIN_DTYPE)
+    for i, cam in enumerate(cameras):
+        records[i] = (
+            cam.id,
+            PINHOLE_MODEL_ID,
+            cam.width,
+            cam.height,
+            [cam.focal_length, cam.focal_length, cam.width / 2, cam.height / 2],
+        )
     with open(f"{dir}/cameras.bin", "wb") as fid:
         write_next_bytes(fid, len(cameras), "Q")
-        for cam in cameras:
-            camera_properties = [cam.id, 1, cam.width, cam.height]
-            write_next_bytes(fid, camera_properties, "iiQQ")
-            params = [cam.focal_length, cam.focal_length, cam.width / 2, cam.height / 2]
-            for p in params:
-                write_next_bytes(fid, float(p), "d")
+        fid.write(records.tobytes())
     return cameras
 
 
 def write_images_binary(
-    views: List[CameraView], dir: str, conf_threshold: float = 0.0
+    views: List[CameraView],
+    dir: str,
+    conf_threshold: float = 0.0,
+    save_new_images: bool = True,
+    image_format: Optional[str] = None,
+    quality: Optional[int] = None,
+    workers: Optional[int] = None,
 ) -> None:
     """
     see: src/colmap/scene/reconstruction.cc
         void Reconstruction::ReadImagesBinary(const std::string& path)
         void Reconstruction::WriteImagesBinary(const std::string& path)
+    Images are exported in parallel, see export_images.
     """
-    with open(f"{dir}/images.bin", "wb") as fid:
-        write_next_bytes(
-            fid, len([v for v in views if v.confidence >= conf_threshold]), "Q"
-        )
-        for id, view in enumerate(views):
-            if view.confidence < conf_threshold:
-                print(
-                    f"[WARNING] View {id + 1} has confidence {view.confidence}, which is below the threshold {conf_threshold}. Skipping this view."
-                )
-                continue
+    kept = []
+    for id, view in enumerate(views):
+        if view.confidence < conf_threshold:
+            print(
+                f"[WARNING] View {id + 1} has confidence {view.confidence}, which is below the threshold {conf_threshold}. Skipping this view."
+            )
+            continue
+        kept.append(id)
+
+    records = np.zeros(len(kept), dtype=IMAGE_BIN_DTYPE)
+    records["id"] = kept
+    records["camera_id"] = [views[id].camera_id for id in kept]
+    poses = Poses.from_views([views[id] for id in kept])
+    records["qvec"] = poses.qvecs()
+    records["tvec"] = poses.tvecs()
 
-            write_next_bytes(fid, id, "i")
-            write_next_bytes(fid, list(view.qvec()), "dddd")
-            write_next_bytes(fid, list(view.tvec()), "ddd")
-            write_next_bytes(fid, view.camera_id, "i")
+    # Image names are variable length, so records are joined in memory
+    # and written at once: header, name, \0, number of 2D points (always 0).
+    img_names = [image_name(views[id], id, image_format) for id in kept]
+    no_points2D = struct.pack("<Q", 0)
+    chunks = [struct.pack("<Q", len(kept))]
+    for record, img_name in zip(records, img_names):
+        chunks.append(record.tobytes())
+        chunks.append(img_name.encode("utf-8") + b"\x00")
+        chunks.append(no_points2D)
 
-            img_name = Path(view.img_path).name if view.img_path else f"IMG{id}.jpg"
-            fid.write(img_name.encode("utf-8") + b"\x00")
+    with open(f"{dir}/images.bin", "wb") as fid:
+        fid.write(b"".join(chunks))
 
-            write_next_bytes(fid, 0, "Q")
-            save_image(view, dir, img_name, save_new_images=True)
+    export_images(
+        [views[id] for id in kept],
+        img_names,
+        dir,
+        save_new_images,
+        quality,
+        workers,
+    )
 
 
-def write_points3D_binary(pcd: o3d.geometry.PointCloud, dir: str) -> None:
+def write_points3D_binary(pcd: "o3d.geometry.PointCloud", dir: str) -> None:
     """
     see: src/colmap/scene/reconstruction.cc
         void Reconstruction::ReadPoints3DBinary(const std::string& path)
         void Reconstruction::WritePoints3DBinary(const std::string& path)
     """
+    points, colors = pcd_arrays(pcd)
+    records = np.zeros(len(points), dtype=POINT3D_BIN_DTYPE)
+    records["id"] = np.arange(len(points))
+    records["xyz"] = points
+    records["rgb"] = colors
+
     with open(f"{dir}/points3D.bin", "wb") as fid:
-        write_next_bytes(fid, len(pcd.points), "Q")
-        for i in range(len(pcd.points)):
-            write_next_bytes(fid, i, "Q")
-            write_next_bytes(fid, list(pcd.points[i]), "ddd")
-            write_next_bytes(fid, [int(i) for i in pcd.colors[i] * 255], "BBB")
-            write_next_bytes(fid, 0, "d")
-            write_next_bytes(fid, 0, "Q")
+        write_next_bytes(fid, len(points), "Q")
+        records.tofile(fid)
+
+
+@dataclass
+class ColmapCameras:
+    """
+    Columnar view of a COLMAP cameras file.
+    """
+
+    ids: np.ndarray
+    models: List[str]
+    widths: np.ndarray
+    heights: np.ndarray
+    params: List[np.ndarray]
+
+
+@dataclass
+class ColmapImages:
+    """
+    Columnar view of a COLMAP images file.
+    2D points of image i are rows points2D_offsets[i]:points2D_offsets[i + 1].
+    """
+
+    ids: np.ndarray
+    qvecs: np.ndarray
+    tvecs: np.ndarray
+    camera_ids: np.ndarray
+    names: List[str]
+    points2D_offsets: np.ndarray
+    points2D_xy: np.ndarray
+    points2D_point3D_ids: np.ndarray
+
+
+@dataclass
+class ColmapPoints3D:
+    """
+    Columnar view of a COLMAP points3D file.
+    Track of point i is rows track_offsets[i]:track_offsets[i + 1] of
+    track, an (M, 2) array of (IMAGE_ID, POINT2D_IDX).
+    """
+
+    ids: np.ndarray
+    xyz: np.ndarray
+    rgb: np.ndarray
+    error: np.ndarray
+    track_offsets: np.ndarray
+    track: np.ndarray
+
+
+def _map_file(path: str) -> mmap.mmap:
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _csr_offsets(lengths: np.ndarray) -> np.ndarray:
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def _gather_ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Concatenation of arange(start, start + length) for every range.
+    """
+    offsets = _csr_offsets(lengths)
+    return np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+
+
+def _word_views(buf: np.ndarray) -> List[np.ndarray]:
+    """
+    The 8 uint64 views of a uint8 array starting at bytes 0..7, so the
+    8-byte word at any byte offset o is element o // 8 of view o % 8.
+    """
+    return [buf[k : k + (len(buf) - k) // 8 * 8].view("<u8") for k in range(8)]
+
+
+def _gather_words(views: List[np.ndarray], offsets: np.ndarray) -> np.ndarray:
+    """
+    8-byte words at the byte offsets, see _word_views; one index per word
+    instead of one per byte.
+    """
+    words = np.empty(len(offsets), dtype="<u8")
+    residues = offsets & 7
+    for k, view in enumerate(views):
+        sel = np.flatnonzero(residues == k)
+        words[sel] = view[offsets[sel] >> 3]
+    return words
+
+
+def _scatter_words(
+    views: List[np.ndarray], offsets: np.ndarray, words: np.ndarray
+) -> None:
+    """
+    Write 8-byte words at the byte offsets, see _gather_words.
+    """
+    residues = offsets & 7
+    for k, view in enumerate(views):
+        sel = np.flatnonzero(residues == k)
+        view[offsets[sel] >> 3] = words[sel]
+
+
+# byte offsets of the 8-byte fields of a points3D record
+POINT3D_WORD_FIELDS = [("id", 0), ("x", 8), ("y", 16), ("z", 24), ("error", 35)]
+POINT3D_RGB_OFFSET = 32
+POINT3D_LENGTH_OFFSET = 43
+
+
+def read_cameras_binary(path: str) -> ColmapCameras:
+    """
+    see: src/colmap/scene/reconstruction.cc
+        void Reconstruction::ReadCamerasBinary(const std::string& path)
+    """
+    buf = _map_file(path)
+    (num_cameras,) = struct.unpack_from("<Q", buf, 0)
+    offset = 8
+    ids, models, widths, heights, params = [], [], [], [], []
+    for _ in range(num_cameras):
+        cam_id, model_id, width, height = struct.unpack_from("<iiQQ", buf, offset)
+        offset += 24
+        model, num_params = CAMERA_MODELS[model_id]
+        params.append(np.frombuffer(buf, "<f8", num_params, offset))
+        offset += 8 * num_params
+        ids.append(cam_id)
+        models.append(model)
+        widths.append(width)
+        heights.append(height)
+    return ColmapCameras(
+        ids=np.array(ids, dtype=np.int32),
+        models=models,
+        widths=np.array(widths, dtype=np.uint64),
+        heights=np.array(heights, dtype=np.uint64),
+        params=params,
+    )
+
+
+def read_images_binary(path: str) -> ColmapImages:
+    """
+    see: src/colmap/scene/reconstruction.cc
+        void Reconstruction::ReadImagesBinary(const std::string& path)
+    Image records are variable length, so headers are located with one pass
+    over the images; 2D points are gathered into flat columns.
+    """
+    buf = _map_file(path)
+    (num_images,) = struct.unpack_from("<Q", buf, 0)
+    offset = 8
+    header_offsets = np.empty(num_images, dtype=np.int64)
+    points2D_starts = np.empty(num_images, dtype=np.int64)
+    points2D_lengths = np.empty(num_images, dtype=np.int64)
+    names = []
+    for i in range(num_images):
+        header_offsets[i] = offset
+        name_end = buf.find(b"\x00", int(offset) + IMAGE_BIN_DTYPE.itemsize)
+        names.append(buf[offset + IMAGE_BIN_DTYPE.itemsize : name_end].decode("utf-8"))
+        (points2D_lengths[i],) = struct.unpack_from("<Q", buf, name_end + 1)
+        points2D_starts[i] = name_end + 9
+        offset = name_end + 9 + int(points2D_lengths[i]) * POINT2D_BIN_DTYPE.itemsize
+
+    raw = np.frombuffer(buf, np.uint8)
+    headers = raw[
+        header_offsets[:, None] + np.arange(IMAGE_BIN_DTYPE.itemsize)
+    ].view(IMAGE_BIN_DTYPE)[:, 0]
+    points2D = raw[
+        _gather_ranges(points2D_starts, points2D_lengths * POINT2D_BIN_DTYPE.itemsize)
+    ].view(POINT2D_BIN_DTYPE)
+    return ColmapImages(
+        ids=headers["id"],
+        qvecs=headers["qvec"],
+        tvecs=headers["tvec"],
+        camera_ids=headers["camera_id"],
+        names=names,
+        points2D_offsets=_csr_offsets(points2D_lengths),
+        points2D_xy=points2D["xy"],
+        points2D_point3D_ids=points2D["point3D_id"],
+    )
+
+
+def read_points3D_binary(path: str) -> ColmapPoints3D:
+    """
+    see: src/colmap/scene/reconstruction.cc
+        void Reconstruction::ReadPoints3DBinary(const std::string& path)
+    Points without tracks (as written by write_points3D_binary) are returned
+    as zero-copy views of the memory-mapped file. With tracks, records are
+    variable length: one Python pass over the track lengths locates them
+    (about 0.3 s per million points), then fields and tracks are gathered
+    as 8-byte words, with memory linear in the number of points.
+    """
+    buf = _map_file(path)
+    (num_points,) = struct.unpack_from("<Q", buf, 0)
+    record_size = POINT3D_BIN_DTYPE.itemsize
+
+    if len(buf) == 8 + num_points * record_size:
+        records = np.frombuffer(buf, POINT3D_BIN_DTYPE, num_points, 8)
+        return ColmapPoints3D(
+            ids=records["id"],
+            xyz=records["xyz"],
+            rgb=records["rgb"],
+            error=records["error"],
+            track_offsets=np.zeros(num_points + 1, dtype=np.int64),
+            track=np.empty((0, 2), dtype=np.int32),
+        )
+
+    unpack_length = struct.Struct("<Q").unpack_from
+    track_size = TRACK_BIN_DTYPE.itemsize
+    lengths = []
+    offset = 8 + POINT3D_LENGTH_OFFSET
+    for _ in range(num_points):
+        (length,) = unpack_length(buf, offset)
+        lengths.append(length)
+        offset += record_size + length * track_size
+    track_lengths = np.array(lengths, dtype=np.int64)
+    record_offsets = 8 + _csr_offsets(record_size + track_lengths * track_size)[:-1]
+
+    raw = np.frombuffer(buf, np.uint8)
+    views = _word_views(raw)
+    fields = {
+        name: _gather_words(views, record_offsets + field_offset)
+        for name, field_offset in POINT3D_WORD_FIELDS
+    }
+    rgb = np.empty((num_points, 3), dtype=np.uint8)
+    for i in range(3):
+        rgb[:, i] = raw[record_offsets + POINT3D_RGB_OFFSET + i]
+
+    track_offsets = _csr_offsets(track_lengths)
+    # byte offset of every track element
+    element_offsets = np.repeat(
+        record_offsets + record_size - track_offsets[:-1] * track_size, track_lengths
+    ) + np.arange(track_offsets[-1]) * track_size
+    track = _gather_words(views, element_offsets).view(TRACK_BIN_DTYPE)
+    return ColmapPoints3D(
+        ids=fields["id"],
+        xyz=np.stack([fields[axis].view("<f8") for axis in "xyz"], axis=1),
+        rgb=rgb,
+        error=fields["error"].view("<f8"),
+        track_offsets=track_offsets,
+        track=np.stack([track["image_id"], track["point2D_idx"]], axis=1),
+    )
+
+
+def _data_lines(path: str) -> List[str]:
+    with open(path, "r") as f:
+        return [line.rstrip("\n") for line in f if not line.startswith("#")]
+
+
+def read_cameras_txt(path: str) -> ColmapCameras:
+    lines = [line.split() for line in _data_lines(path) if line.strip()]
+    return ColmapCameras(
+        ids=np.array([int(line[0]) for line in lines], dtype=np.int32),
+        models=[line[1] for line in lines],
+        widths=np.array([int(line[2]) for line in lines], dtype=np.uint64),
+        heights=np.array([int(line[3]) for line in lines], dtype=np.uint64),
+        params=[np.array(line[4:], dtype=np.float64) for line in lines],
+    )
+
+
+def read_images_txt(path: str) -> ColmapImages:
+    lines = _data_lines(path)
+    headers = [line.split() for line in lines[0::2]]
+    points2D = [
+        np.fromstring(line, sep=" ").reshape(-1, 3) for line in lines[1::2]
+    ]
+    points2D += [np.empty((0, 3))] * (len(headers) - len(points2D))
+    points2D_flat = (
+        np.concatenate(points2D) if points2D else np.empty((0, 3), dtype=np.float64)
+    )
+    return ColmapImages(
+        ids=np.array([int(h[0]) for h in headers], dtype=np.int32),
+        qvecs=np.array([h[1:5] for h in headers], dtype=np.float64).reshape(-1, 4),
+        tvecs=np.array([h[5:8] for h in headers], dtype=np.float64).reshape(-1, 3),
+        camera_ids=np.array([int(h[8]) for h in headers], dtype=np.int32),
+        names=[" ".join(h[9:]) for h in headers],
+        points2D_offsets=_csr_offsets(np.array([len(p) for p in points2D])),
+        points2D_xy=points2D_flat[:, :2],
+        points2D_point3D_ids=points2D_flat[:, 2].astype(np.int64),
+    )
+
+
+def _parse_points3D_chunk(
+    chunk: bytes,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Parse whole lines of points3D.txt into an (N, 8) array of
+    POINT3D_ID, X, Y, Z, R, G, B, ERROR, track lengths and (M, 2) tracks.
+    """
+    try:
+        fields = np.loadtxt(BytesIO(chunk), dtype=np.float64, ndmin=2)
+    except ValueError:
+        fields = None
+    if fields is not None and fields.shape[1] == 8:
+        return fields, np.zeros(len(fields), np.int64), np.empty((0, 2))
+
+    # Lines with tracks of different lengths
+    raw = np.frombuffer(chunk, np.uint8)
+    is_space = (raw == ord(" ")) | (raw == ord("\n")) | (raw == ord("\t"))
+    is_space |= raw == ord("\r")
+    token_starts = np.flatnonzero(~is_space & np.r_[True, is_space[:-1]])
+    token_lines = np.searchsorted(np.flatnonzero(raw == ord("\n")), token_starts)
+    _, tokens_per_line = np.unique(token_lines, return_counts=True)
+
+    values = np.fromstring(chunk.decode("ascii"), sep=" ")
+    if len(values) != len(token_starts):
+        raise ValueError("Malformed points3D.txt chunk")
+
+    line_offsets = _csr_offsets(tokens_per_line)
+    fields = values[line_offsets[:-1, None] + np.arange(8)]
+    track_lengths = tokens_per_line - 8
+    track = values[_gather_ranges(line_offsets[:-1] + 8, track_lengths)]
+    return fields, track_lengths // 2, track.reshape(-1, 2)
+
+
+def read_points3D_txt(path: str, chunk_size: int = 1 << 24) -> ColmapPoints3D:
+    """
+    Parse points3D.txt in chunks of about chunk_size bytes.
+    Every chunk is tokenized and converted to floats in bulk.
+    """
+    fields, track_lengths, tracks = [], [], []
+    with open(path, "rb") as f:
+        header_end = 0
+        while f.readline().startswith(b"#"):
+            header_end = f.tell()
+        f.seek(header_end)
+
+        rest = b""
+        while True:
+            data = f.read(chunk_size)
+            if data:
+                data = rest + data
+                cut = data.rfind(b"\n") + 1
+                chunk, rest = data[:cut], data[cut:]
+            else:
+                chunk, rest = rest, b""
+            if chunk.strip():
+                chunk_fields, chunk_lengths, chunk_track = _parse_points3D_chunk(chunk)
+                fields.append(chunk_fields)
+                track_lengths.append(chunk_lengths)
+                tracks.append(chunk_track)
+            if not data:
+                break
+
+    fields = np.concatenate(fields) if fields else np.empty((0, 8))
+    track_lengths = (
+        np.concatenate(track_lengths) if track_lengths else np.empty(0, np.int64)
+    )
+    tracks = np.concatenate(tracks) if tracks else np.empty((0, 2))
+    return ColmapPoints3D(
+        ids=fields[:, 0].astype(np.uint64),
+        xyz=fields[:, 1:4],
+        rgb=fields[:, 4:7].astype(np.uint8),
+        error=fields[:, 7],
+        track_offsets=_csr_offsets(track_lengths),
+        track=tracks.astype(np.int32),
+    )
+
+
+def read_model(
+    dir: str, ext: Optional[str] = None
+) -> Tuple[ColmapCameras, ColmapImages, ColmapPoints3D]:
+    """
+    Read cameras, images and points3D of a COLMAP model.
+    ext is ".bin" or ".txt"; detected from the files present if not given.
+    """
+    if ext is None:
+        ext = ".bin" if os.path.exists(f"{dir}/points3D.bin") else ".txt"
+    if ext == ".bin":
+        return (
+            read_cameras_binary(f"{dir}/cameras.bin"),
+            read_images_binary(f"{dir}/images.bin"),
+            read_points3D_binary(f"{dir}/points3D.bin"),
+        )
+    return (
+        read_cameras_txt(f"{dir}/cameras.txt"),
+        read_images_txt(f"{dir}/images.txt"),
+        read_points3D_txt(f"{dir}/points3D.txt"),
+    )
+
+
+def _write_model_txt(
+    cameras: ColmapCameras, images: ColmapImages, points3D: ColmapPoints3D, dir: str
+) -> None:
+    with open(f"{dir}/cameras.txt", "w") as f:
+        f.write("# Camera list with one line of data per camera:\n")
+        f.write("#   CAMERA_ID, MODEL, WIDTH, HEIGHT, PARAMS[]\n")
+        for id, model, width, height, params in zip(
+            cameras.ids, cameras.models, cameras.widths, cameras.heights, cameras.params
+        ):
+            f.write(f"{id} {model} {width} {height} {' '.join(map(str, params))}\n")
+
+    with open(f"{dir}/images.txt", "w") as f:
+        f.write("# Image list with two lines of data per image:\n")
+        f.write("#   IMAGE_ID, QW, QX, QY, QZ, TX, TY, TZ, CAMERA_ID, IMAGE_NAME\n")
+        f.write("#   POINTS2D[] as (X, Y, POINT3D_ID)\n")
+        offsets = images.points2D_offsets
+        for i, name in enumerate(images.names):
+            f.write(
+                f"{images.ids[i]} {' '.join(map(str, images.qvecs[i]))} "
+                f"{' '.join(map(str, images.tvecs[i]))} {images.camera_ids[i]} {name}\n"
+            )
+            rows = slice(offsets[i], offsets[i + 1])
+            f.write(
+                " ".join(
+                    f"{x} {y} {point3D_id}"
+                    for (x, y), point3D_id in zip(
+                        images.points2D_xy[rows].tolist(),
+                        images.points2D_point3D_ids[rows].tolist(),
+                    )
+                )
+                + "\n"
+            )
+
+    with open(f"{dir}/points3D.txt", "w") as f:
+        f.write("# 3D point list with one line of data per point:\n")
+        f.write(
+            "#   POINT3D_ID, X, Y, Z, R, G, B, ERROR, TRACK[] as (IMAGE_ID, POINT2D_IDX)\n"
+        )
+        offsets = points3D.track_offsets
+        track = points3D.track.tolist()
+        for i, (id, xyz, rgb, error) in enumerate(
+            zip(
+                points3D.ids.tolist(),
+                points3D.xyz.tolist(),
+                points3D.rgb.tolist(),
+                points3D.error.tolist(),
+            )
+        ):
+            line = f"{id} {xyz[0]} {xyz[1]} {xyz[2]} {rgb[0]} {rgb[1]} {rgb[2]} {error}"
+            for image_id, point2D_idx in track[offsets[i] : offsets[i + 1]]:
+                line += f" {image_id} {point2D_idx}"
+            f.write(line + "\n")
+
+
+def _write_model_binary(
+    cameras: ColmapCameras, images: ColmapImages, points3D: ColmapPoints3D, dir: str
+) -> None:
+    model_ids = {name: id for id, (name, _) in CAMERA_MODELS.items()}
+    with open(f"{dir}/cameras.bin", "wb") as fid:
+        write_next_bytes(fid, len(cameras.ids), "Q")
+        for id, model, width, height, params in zip(
+            cameras.ids, cameras.models, cameras.widths, cameras.heights, cameras.params
+        ):
+            write_next_bytes(fid, [id, model_ids[model], width, height], "iiQQ")
+            fid.write(np.asarray(params, dtype="<f8").tobytes())
+
+    headers = np.zeros(len(images.ids), dtype=IMAGE_BIN_DTYPE)
+    headers["id"] = images.ids
+    headers["qvec"] = images.qvecs
+    headers["tvec"] = images.tvecs
+    headers["camera_id"] = images.camera_ids
+    points2D = np.zeros(len(images.points2D_xy), dtype=POINT2D_BIN_DTYPE)
+    points2D["xy"] = images.points2D_xy
+    points2D["point3D_id"] = images.points2D_point3D_ids
+    offsets = images.points2D_offsets
+    chunks = [struct.pack("<Q", len(images.ids))]
+    for i, name in enumerate(images.names):
+        chunks.append(headers[i].tobytes())
+        chunks.append(name.encode("utf-8") + b"\x00")
+        chunks.append(struct.pack("<Q", offsets[i + 1] - offsets[i]))
+        chunks.append(points2D[offsets[i] : offsets[i + 1]].tobytes())
+    with open(f"{dir}/images.bin", "wb") as fid:
+        fid.write(b"".join(chunks))
+
+    # records and tracks are scattered into one buffer as 8-byte words
+    num_points = len(points3D.ids)
+    track_lengths = np.diff(points3D.track_offsets)
+    record_size = POINT3D_BIN_DTYPE.itemsize
+    track_size = TRACK_BIN_DTYPE.itemsize
+    record_offsets = _csr_offsets(record_size + track_lengths * track_size)
+    buf = np.empty(record_offsets[-1], dtype=np.uint8)
+    record_offsets = record_offsets[:-1]
+    views = _word_views(buf)
+
+    xyz = np.asarray(points3D.xyz, dtype="<f8")
+    fields = {
+        "id": np.asarray(points3D.ids, dtype="<u8"),
+        "x": xyz[:, 0],
+        "y": xyz[:, 1],
+        "z": xyz[:, 2],
+        "error": np.asarray(points3D.error, dtype="<f8"),
+    }
+    for name, field_offset in POINT3D_WORD_FIELDS:
+        _scatter_words(views, record_offsets + field_offset, fields[name].view("<u8"))
+    _scatter_words(
+        views, record_offsets + POINT3D_LENGTH_OFFSET, track_lengths.astype("<u8")
+    )
+    rgb = np.asarray(points3D.rgb, dtype=np.uint8)
+    for i in range(3):
+        buf[record_offsets + POINT3D_RGB_OFFSET + i] = rgb[:, i]
+
+    track = np.zeros(len(points3D.track), dtype=TRACK_BIN_DTYPE)
+    track["image_id"] = points3D.track[:, 0]
+    track["point2D_idx"] = points3D.track[:, 1]
+    track_offsets = np.asarray(points3D.track_offsets, dtype=np.int64)
+    element_offsets = np.repeat(
+        record_offsets + record_size - track_offsets[:-1] * track_size, track_lengths
+    ) + np.arange(len(track)) * track_size
+    _scatter_words(views, element_offsets, track.view("<u8"))
+    with open(f"{dir}/points3D.bin", "wb") as fid:
+        write_next_bytes(fid, num_points, "Q")
+        buf.tofile(fid)
+
+
+def write_model(
+    cameras: ColmapCameras,
+    images: ColmapImages,
+    points3D: ColmapPoints3D,
+    dir: str,
+    ext: str = ".bin",
+) -> None:
+    """
+    Write a model read by read_model, as ".bin" or ".txt".
+    """
+    os.makedirs(dir, exist_ok=True)
+    if ext == ".bin":
+        _write_model_binary(cameras, images, points3D, dir)
+    elif ext == ".txt":
+        _write_model_txt(cameras, images, points3D, dir)
+    else:
+        raise ValueError(f"Unknown model format {ext}, expected .bin or .txt")
+
+
+# PLY property type -> NumPy type
+PLY_TYPES = {
+    "char": "i1",
+    "uchar": "u1",
+    "short": "i2",
+    "ushort": "u2",
+    "int": "i4",
+    "uint": "u4",
+    "float": "f4",
+    "double": "f8",
+    "int8": "i1",
+    "uint8": "u1",
+    "int16": "i2",
+    "uint16": "u2",
+    "int32": "i4",
+    "uint32": "u4",
+    "float32": "f4",
+    "float64": "f8",
+}
+PLY_FORMATS = {"binary_little_endian": "<", "binary_big_endian": ">"}
+
+
+def write_vertices_ply(
+    path: str,
+    points: np.ndarray,
+    colors: np.ndarray,
+    normals: Optional[np.ndarray] = None,
+    confidence: Optional[np.ndarray] = None,
+) -> None:
+    """
+    Save (N, 3) points and uint8 colors to a binary little endian PLY with
+    x, y, z, [nx, ny, nz,] red, green, blue[, confidence] vertices.
+    """
+    fields = [("x", "<f4"), ("y", "<f4"), ("z", "<f4")]
+    if normals is not None:
+        fields += [("nx", "<f4"), ("ny", "<f4"), ("nz", "<f4")]
+    fields += [("red", "u1"), ("green", "u1"), ("blue", "u1")]
+    if confidence is not None:
+        fields += [("confidence", "<f4")]
+
+    vertices = np.zeros(len(points), dtype=np.dtype(fields))
+    for i, axis in enumerate("xyz"):
+        vertices[axis] = points[:, i]
+    if normals is not None:
+        for i, axis in enumerate(("nx", "ny", "nz")):
+            vertices[axis] = normals[:, i]
+    for i, channel in enumerate(("red", "green", "blue")):
+        vertices[channel] = colors[:, i]
+    if confidence is not None:
+        vertices["confidence"] = confidence
+
+    ply_type = {np.dtype("<f4"): "float", np.dtype("u1"): "uchar"}
+    header = ["ply", "format binary_little_endian 1.0", f"element vertex {len(points)}"]
+    header += [f"property {ply_type[np.dtype(t)]} {name}" for name, t in fields]
+    header += ["end_header"]
+
+    with open(path, "wb") as fid:
+        fid.write(("\n".join(header) + "\n").encode("ascii"))
+        vertices.tofile(fid)
+
+
+def write_points3D_ply(
+    pcd: "o3d.geometry.PointCloud",
+    dir: str,
+    normals: bool = True,
+    confidence: Optional[np.ndarray] = None,
+) -> None:
+    """
+    Save the point cloud to a binary little endian points3D.ply, the layout
+    3DGS trainers read for initialization, see write_vertices_ply.
+    Normals are zero if the point cloud has none.
+    """
+    points, colors = pcd_arrays(pcd)
+    pcd_normals = None
+    if normals:
+        pcd_normals = (
+            np.asarray(pcd.normals)
+            if pcd.has_normals()
+            else np.zeros((len(points), 3), dtype=np.float32)
+        )
+    os.makedirs(dir, exist_ok=True)
+    write_vertices_ply(
+        f"{dir}/points3D.ply", points, colors, pcd_normals, confidence
+    )
+
+
+def read_ply(path: str) -> np.ndarray:
+    """
+    Memory-map the vertex block of a binary PLY file.
+    Returns a read-only structured array with one field per vertex property.
+    Raises ValueError for ASCII PLY files or a header without a format.
+    """
+    elements = []
+    endian = None
+    with open(path, "rb") as f:
+        if f.readline().strip() != b"ply":
+            raise ValueError(f"{path} is not a PLY file")
+        for line in f:
+            words = line.decode("ascii").split()
+            if not words or words[0] in ("comment", "obj_info"):
+                continue
+            if words[0] == "format":
+                if words[1] not in PLY_FORMATS:
+                    raise ValueError(f"Unsupported PLY format {words[1]} in {path}")
+                endian = PLY_FORMATS[words[1]]
+            elif words[0] == "element":
+                elements.append((words[1], int(words[2]), []))
+            elif words[0] == "property":
+                if endian is None:
+                    raise ValueError(f"Missing PLY format before the properties in {path}")
+                if words[1] == "list":
+                    elements[-1][2].append(None)
+                else:
+                    elements[-1][2].append((words[2], endian + PLY_TYPES[words[1]]))
+            elif words[0] == "end_header":
+                break
+        if endian is None:
+            raise ValueError(f"Missing PLY format in {path}")
+        offset = f.tell()
+
+    for name, count, properties in elements:
+        if None in properties:
+            raise ValueError(f"Variable length PLY element {name} in {path}")
+        dtype = np.dtype(properties)
+        if name == "vertex":
+            return np.frombuffer(_map_file(path), dtype, count, offset)
+        offset += count * dtype.itemsize
+    raise ValueError(f"No vertex element in {path}")
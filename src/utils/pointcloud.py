@@ -1,14 +1,292 @@
 """ """
 
-import open3d as o3d
 import numpy as np
 
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from src.utils.compact import morton_order
+
+if TYPE_CHECKING:
+    import open3d as o3d
+
+    from src.utils.alignment import Sim3
+
 
 def scale_pointcloud(
-    pointcloud: o3d.geometry.PointCloud, scaling_factor: float
+    pointcloud: "o3d.geometry.PointCloud", scaling_factor: float
 ) -> None:
     """
     Scale the point cloud by a given factor (in place).
     """
+    import open3d as o3d
+
     points = pointcloud.points
     pointcloud.points = o3d.utility.Vector3dVector(np.asarray(points) * scaling_factor)
+
+
+def transform_pointcloud(pointcloud: "o3d.geometry.PointCloud", sim3: "Sim3") -> None:
+    """
+    Apply a similarity transform to the point cloud (in place).
+    """
+    import open3d as o3d
+
+    points = pointcloud.points
+    pointcloud.points = o3d.utility.Vector3dVector(sim3.apply(np.asarray(points)))
+
+
+# voxel coordinates are packed into one int64 key, 21 bits per axis
+KEY_BITS = 21
+KEY_BIAS = 1 << (KEY_BITS - 1)
+
+
+def voxel_keys(points: np.ndarray, voxel_size: float) -> np.ndarray:
+    """
+    Pack the integer voxel coordinates of (N, 3) points into int64 keys.
+    """
+    if not voxel_size > 0:
+        raise ValueError(f"Voxel size must be positive, got {voxel_size}")
+    keys = np.zeros(len(points), dtype=np.int64)
+    for axis in range(3):
+        coords = np.floor(points[:, axis] / voxel_size).astype(np.int64) + KEY_BIAS
+        if len(coords) and (coords.min() < 0 or coords.max() >= 1 << KEY_BITS):
+            raise ValueError(
+                f"Point cloud spans more than 2^{KEY_BITS} voxels of size {voxel_size} per axis"
+            )
+        keys |= coords << (2 - axis) * KEY_BITS
+    return keys
+
+
+def _voxel_groups(keys: np.ndarray) -> tuple:
+    """
+    Sorted unique keys and the index of every key among them.
+    """
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+    is_first = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+    groups = np.empty(len(keys), dtype=np.int64)
+    groups[order] = np.cumsum(is_first) - 1
+    return sorted_keys[is_first], groups
+
+
+class VoxelGrid:
+    """
+    Voxel grid accumulating confidence-weighted point and color sums.
+    Points can be added in batches (e.g. per view); the result only depends
+    on the points added and the order of the batches.
+    Every batch is reduced on its own; reduced batches are merged into the
+    grid once they hold as many voxels as it does, so adding many batches
+    costs O(N log N) overall rather than re-merging the grid on every add.
+    """
+
+    def __init__(self, voxel_size: float):
+        if not voxel_size > 0:
+            raise ValueError(f"Voxel size must be positive, got {voxel_size}")
+        self.voxel_size = voxel_size
+        self._keys = np.empty(0, dtype=np.int64)
+        # weighted xyz, weighted rgb, sum of weights, number of points
+        self._sums = np.empty((0, 8), dtype=np.float64)
+        # reduced batches not merged yet, in the order they were added
+        self._pending = []
+        self._pending_voxels = 0
+
+    @property
+    def keys(self) -> np.ndarray:
+        """
+        Sorted unique voxel keys.
+        """
+        self._merge()
+        return self._keys
+
+    @property
+    def sums(self) -> np.ndarray:
+        """
+        (len(keys), 8) weighted xyz, weighted rgb, sum of weights and number
+        of points of every voxel.
+        """
+        self._merge()
+        return self._sums
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(
+        self,
+        points: np.ndarray,
+        colors: np.ndarray,
+        confidence: np.ndarray = None,
+    ) -> None:
+        """
+        Fold (N, 3) points and colors, weighted by (N,) confidences, into the grid.
+        """
+        if len(points) == 0:
+            return
+        weights = (
+            np.ones(len(points))
+            if confidence is None
+            else np.asarray(confidence, dtype=np.float64)
+        )
+        keys, groups = _voxel_groups(voxel_keys(points, self.voxel_size))
+        # bincount adds points in input order, independent of the sort
+        sums = np.empty((len(keys), 8), dtype=np.float64)
+        for i in range(3):
+            sums[:, i] = np.bincount(groups, points[:, i] * weights, len(keys))
+            sums[:, 3 + i] = np.bincount(groups, colors[:, i] * weights, len(keys))
+        sums[:, 6] = np.bincount(groups, weights, len(keys))
+        sums[:, 7] = np.bincount(groups, minlength=len(keys))
+        del groups
+
+        self._pending.append((keys, sums))
+        self._pending_voxels += len(keys)
+        if self._pending_voxels >= len(self._keys):
+            self._merge()
+
+    def _merge(self) -> None:
+        """
+        Merge the pending batches into the grid. Sums are added in the order
+        of the batches, as if every batch had been merged when it was added.
+        """
+        if not self._pending:
+            return
+        if len(self._pending) == 1 and not len(self._keys):
+            # a single reduced batch already is the grid
+            (self._keys, self._sums), self._pending = self._pending[0], []
+            self._pending_voxels = 0
+            return
+        parts = [(self._keys, self._sums)] + self._pending
+        keys, groups = _voxel_groups(np.concatenate([k for k, _ in parts]))
+        sums = np.empty((len(keys), 8), dtype=np.float64)
+        # one column at a time, the sums are not copied all at once
+        for i in range(8):
+            column = np.concatenate([s[:, i] for _, s in parts])
+            sums[:, i] = np.bincount(groups, column, len(keys))
+        self._keys, self._sums = keys, sums
+        self._pending, self._pending_voxels = [], 0
+
+    def result(self) -> tuple:
+        """
+        Get one point per voxel: weighted mean position and color (in the
+        scale of the input colors) and mean confidence, ordered by voxel key.
+        """
+        weights = self.sums[:, 6:7]
+        return (
+            self.sums[:, 0:3] / weights,
+            self.sums[:, 3:6] / weights,
+            self.sums[:, 6] / self.sums[:, 7],
+        )
+
+
+def voxel_downsample(
+    points: np.ndarray,
+    colors: np.ndarray,
+    voxel_size: float,
+    confidence: np.ndarray = None,
+) -> tuple:
+    """
+    Merge points falling into the same voxel into their confidence-weighted
+    mean. Returns points, colors and mean confidences, see VoxelGrid.result.
+    """
+    grid = VoxelGrid(voxel_size)
+    grid.add(points, colors, confidence)
+    return grid.result()
+
+
+OUTLIER_METHODS = ("statistical", "radius")
+
+
+def _sorted_kdtree(points: np.ndarray) -> tuple:
+    """
+    KD-tree over a copy of the points in Z-order, so neighbouring queries
+    walk neighbouring memory (about twice as fast on large clouds).
+    Returns the tree, whose data holds the sorted points, and the order.
+    """
+    from scipy.spatial import cKDTree
+
+    order = morton_order(points)
+    # sliding midpoint splits build much faster than median splits
+    tree = cKDTree(points[order], balanced_tree=False, compact_nodes=False)
+    return tree, order
+
+
+def statistical_inliers(
+    points: np.ndarray,
+    nb_neighbors: int = 20,
+    std_ratio: float = 2.0,
+    chunk_size: int = 1 << 16,
+    workers: int = -1,
+) -> np.ndarray:
+    """
+    Mask of the (N, 3) points whose mean distance to their nb_neighbors
+    nearest neighbours is at most std_ratio standard deviations above the
+    mean of all points, like Open3D remove_statistical_outlier.
+    Neighbours are queried chunk_size points at a time on workers threads
+    (all cores by default), so memory stays O(N + chunk_size * nb_neighbors).
+    """
+    if len(points) <= nb_neighbors:
+        return np.ones(len(points), dtype=bool)
+    tree, order = _sorted_kdtree(points)
+    mean_distances = np.empty(len(points), dtype=np.float64)
+    for start in range(0, len(points), chunk_size):
+        stop = min(start + chunk_size, len(points))
+        # the nearest neighbour of every point is itself
+        distances, _ = tree.query(
+            tree.data[start:stop], k=nb_neighbors + 1, workers=workers
+        )
+        mean_distances[order[start:stop]] = distances[:, 1:].mean(axis=1)
+    threshold = mean_distances.mean() + std_ratio * mean_distances.std()
+    return mean_distances <= threshold
+
+
+def radius_inliers(
+    points: np.ndarray,
+    radius: float = 0.05,
+    min_neighbors: int = 8,
+    chunk_size: int = 1 << 16,
+    workers: int = -1,
+) -> np.ndarray:
+    """
+    Mask of the (N, 3) points with at least min_neighbors other points
+    within radius, like Open3D remove_radius_outlier; chunked and threaded
+    as statistical_inliers.
+    """
+    tree, order = _sorted_kdtree(points)
+    counts = np.empty(len(points), dtype=np.int64)
+    for start in range(0, len(points), chunk_size):
+        stop = min(start + chunk_size, len(points))
+        counts[order[start:stop]] = tree.query_ball_point(
+            tree.data[start:stop], r=radius, workers=workers, return_length=True
+        )
+    # counts include the point itself
+    return counts > min_neighbors
+
+
+@dataclass
+class OutlierRemoval:
+    """
+    Outlier removal settings, see statistical_inliers and radius_inliers.
+    Distances are in the units of the point cloud.
+    """
+
+    method: str = "statistical"
+    nb_neighbors: int = 20
+    std_ratio: float = 2.0
+    radius: float = 0.05
+    min_neighbors: int = 8
+    chunk_size: int = 1 << 16
+    workers: int = -1
+
+    def inliers(self, points: np.ndarray) -> np.ndarray:
+        """
+        Mask of the (N, 3) points to keep.
+        """
+        if self.method == "statistical":
+            return statistical_inliers(
+                points, self.nb_neighbors, self.std_ratio, self.chunk_size, self.workers
+            )
+        if self.method == "radius":
+            return radius_inliers(
+                points, self.radius, self.min_neighbors, self.chunk_size, self.workers
+            )
+        raise ValueError(
+            f"Unknown outlier removal method {self.method}, expected one of {OUTLIER_METHODS}"
+        )
@@ -0,0 +1,119 @@
+"""
+Synthetic Fast3R outputs with known camera poses
+
+Lets Fast3RSfM and the writers run without the model or images, e.g. for
+benchmarks: pass the ground truth poses and focals to Fast3RSfM so no PnP
+(and no fast3r import) is needed.
+"""
+
+import numpy as np
+import torch
+
+from dataclasses import dataclass
+from typing import List
+
+CONFIDENCE_DISTRIBUTIONS = ("exponential", "uniform", "lognormal")
+
+
+@dataclass
+class SyntheticScene:
+    """
+    Output dictionary as returned by inference and aligned, with the
+    camera-to-world poses and focals it was rendered from.
+    """
+
+    output_dict: dict
+    camera_poses: np.ndarray
+    focals: List[List[float]]
+
+
+def look_at(center: np.ndarray, target: np.ndarray) -> np.ndarray:
+    """
+    OpenCV camera-to-world pose at center looking at target, y down.
+    """
+    forward = target - center
+    forward /= np.linalg.norm(forward)
+    right = np.cross(forward, [0.0, -1.0, 0.0])
+    right /= np.linalg.norm(right)
+    down = np.cross(forward, right)
+    c2w = np.eye(4)
+    c2w[:3, :3] = np.stack([right, down, forward], axis=1)
+    c2w[:3, 3] = center
+    return c2w
+
+
+def _confidence(
+    rng: np.random.Generator, distribution: str, scale: float, shape: tuple
+) -> np.ndarray:
+    # Fast3R confidences are 1 + exp(x) > 1
+    if distribution == "exponential":
+        return 1 + rng.exponential(scale, shape)
+    if distribution == "uniform":
+        return 1 + rng.uniform(0, scale, shape)
+    if distribution == "lognormal":
+        return 1 + rng.lognormal(np.log(scale), 1.0, shape)
+    raise ValueError(
+        f"Unknown confidence distribution {distribution}, "
+        f"expected one of {CONFIDENCE_DISTRIBUTIONS}"
+    )
+
+
+def synthetic_scene(
+    num_views: int = 16,
+    height: int = 384,
+    width: int = 512,
+    focal: float = None,
+    confidence: str = "exponential",
+    confidence_scale: float = 3.0,
+    noise: float = 0.01,
+    radius: float = 3.0,
+    seed: int = 0,
+) -> SyntheticScene:
+    """
+    Cameras on a circle around the origin looking at a wavy surface.
+    Point maps hold the surface seen through every pixel plus Gaussian noise
+    of std noise, in the world frame; colors follow the world position.
+    """
+    rng = np.random.default_rng(seed)
+    focal = focal or 0.9 * width
+    v, u = np.mgrid[:height, :width].astype(np.float64)
+    rays = np.stack(
+        [(u - width / 2) / focal, (v - height / 2) / focal, np.ones_like(u)], axis=-1
+    )
+
+    camera_poses = []
+    preds, views = [], []
+    for i in range(num_views):
+        angle = 2 * np.pi * i / num_views
+        center = np.array([radius * np.sin(angle), -0.5, -radius * np.cos(angle)])
+        c2w = look_at(center, np.zeros(3))
+        camera_poses.append(c2w)
+
+        depth = radius * (1 + 0.1 * np.sin(u / width * 6 + angle) * np.cos(v / height * 4))
+        points = (rays * depth[..., None]) @ c2w[:3, :3].T + c2w[:3, 3]
+        points += rng.normal(scale=noise, size=points.shape)
+        colors = np.clip(np.sin(points * 2) * 0.9, -1, 1)
+
+        preds.append(
+            {
+                "conf": torch.from_numpy(
+                    _confidence(rng, confidence, confidence_scale, (1, height, width))
+                ).float(),
+                "pts3d_in_other_view": torch.from_numpy(points[None]).float(),
+                "pts3d_local_aligned_to_global": torch.from_numpy(points[None]).float(),
+            }
+        )
+        views.append(
+            {
+                "img": torch.from_numpy(colors.transpose(2, 0, 1)[None]).float(),
+                "true_shape": np.array([[height, width]], dtype=np.int32),
+                "idx": i,
+                "instance": str(i),
+            }
+        )
+
+    return SyntheticScene(
+        output_dict={"preds": preds, "views": views},
+        camera_poses=np.stack(camera_poses),
+        focals=[[focal] * num_views],
+    )
@@ -0,0 +1,172 @@
+"""
+Per-stage tracing of wall time, CPU time, memory and bytes written
+"""
+
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+def _peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _bytes_written() -> Optional[int]:
+    """
+    Bytes the process passed to write calls so far (Linux only).
+    """
+    try:
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class Tracer:
+    """
+    Record pipeline stages as complete events.
+    Every stage records its wall time, the CPU time of the whole process,
+    the peak RSS at its end and how much it raised it, and the bytes the
+    process wrote meanwhile. CPU time and bytes are process-wide, so
+    concurrent stages (e.g. writers) count each other's work.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.profiling = {}
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, **args):
+        """
+        Trace the enclosed block as stage name; args are stored with it.
+        """
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        peak_start = _peak_rss_bytes()
+        written_start = _bytes_written()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start
+            peak = _peak_rss_bytes()
+            written = _bytes_written()
+            event = {
+                "name": name,
+                "start": start - self._origin,
+                "wall_seconds": wall,
+                "cpu_seconds": time.process_time() - cpu_start,
+                "peak_rss_bytes": peak,
+                "peak_rss_growth_bytes": peak - peak_start,
+                "bytes_written": (
+                    written - written_start if written is not None else None
+                ),
+                "thread": threading.get_ident(),
+                "args": args,
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def add_profiling(self, name: str, info) -> None:
+        """
+        Attach profiling info reported by a stage, e.g. by Fast3R inference.
+        """
+        self.profiling[name] = info
+
+    def timings(self) -> Dict[str, float]:
+        """
+        Wall time of every stage in seconds, summed over repeated stages.
+        """
+        timings = {}
+        for event in sorted(self.events, key=lambda e: e["start"]):
+            timings[event["name"]] = (
+                timings.get(event["name"], 0.0) + event["wall_seconds"]
+            )
+        return timings
+
+    def summary(self) -> dict:
+        """
+        Per stage totals: calls, wall and CPU time, peak RSS and bytes written.
+        """
+        stages = {}
+        for event in sorted(self.events, key=lambda e: e["start"]):
+            stage = stages.setdefault(
+                event["name"],
+                {
+                    "calls": 0,
+                    "wall_seconds": 0.0,
+                    "cpu_seconds": 0.0,
+                    "peak_rss_bytes": 0,
+                    "peak_rss_growth_bytes": 0,
+                    "bytes_written": 0,
+                },
+            )
+            stage["calls"] += 1
+            stage["wall_seconds"] += event["wall_seconds"]
+            stage["cpu_seconds"] += event["cpu_seconds"]
+            stage["peak_rss_bytes"] = max(
+                stage["peak_rss_bytes"], event["peak_rss_bytes"]
+            )
+            stage["peak_rss_growth_bytes"] += event["peak_rss_growth_bytes"]
+            if event["bytes_written"] is None or stage["bytes_written"] is None:
+                stage["bytes_written"] = None
+            else:
+                stage["bytes_written"] += event["bytes_written"]
+        return {
+            "stages": stages,
+            "peak_rss_bytes": _peak_rss_bytes(),
+            "profiling": self.profiling,
+        }
+
+    def chrome_trace(self) -> dict:
+        """
+        Events in the Chrome trace event format (chrome://tracing, Perfetto).
+        """
+        pid = os.getpid()
+        threads = {}
+        trace_events = []
+        for event in self.events:
+            tid = threads.setdefault(event["thread"], len(threads))
+            trace_events.append(
+                {
+                    "name": event["name"],
+                    "ph": "X",
+                    "ts": event["start"] * 1e6,
+                    "dur": event["wall_seconds"] * 1e6,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {
+                        key: value
+                        for key, value in event.items()
+                        if key not in ("name", "start", "wall_seconds", "thread")
+                    },
+                }
+            )
+        return {
+            "traceEvents": trace_events,
+            "displayTimeUnit": "ms",
+            "otherData": {"profiling": self.profiling},
+        }
+
+    def save(self, dir: str) -> None:
+        """
+        Save trace.json (Chrome trace) and summary.json to dir.
+        """
+        os.makedirs(dir, exist_ok=True)
+        # profiling info may hold arbitrary objects, keep their repr
+        with open(f"{dir}/trace.json", "w") as f:
+            json.dump(self.chrome_trace(), f, default=str)
+        with open(f"{dir}/summary.json", "w") as f:
+            json.dump(self.summary(), f, indent=1, default=str)
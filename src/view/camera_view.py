@@ -8,10 +8,11 @@ from typing import Optional
 import numpy as np
 
 
-@dataclass
+@dataclass(slots=True)
 class CameraView:
     """
     Camera view class to hold image and camera parameters.
+    img is either decoded RGB pixels or a lazy handle from src.view.image.
     """
 
     img_path: str
@@ -20,6 +21,15 @@ class CameraView:
     camera_id: int = 1
     extrinsics: np.ndarray = None
 
+    def load_img(self) -> Optional[np.ndarray]:
+        """
+        Get the image as an (H, W, 3) uint8 RGB array.
+        Lazy images are decoded on every call and not kept.
+        """
+        if self.img is None or isinstance(self.img, np.ndarray):
+            return self.img
+        return self.img.load()
+
     def qvec(self) -> np.ndarray:
         """
         Get the rotation vector from the extrinsics matrix.
@@ -0,0 +1,26 @@
+"""
+Lazy image handle for camera views
+"""
+
+import numpy as np
+
+
+class TensorImage:
+    """
+    Handle to a (3, H, W) image tensor normalized to [-1, 1], e.g. a slice
+    of the Fast3R input views. Shares memory with the tensor; pixels are
+    converted only when loaded.
+    """
+
+    __slots__ = ("tensor",)
+
+    def __init__(self, tensor):
+        self.tensor = tensor
+
+    def load(self) -> np.ndarray:
+        """
+        Get the image as an (H, W, 3) uint8 RGB array.
+        """
+        img = np.transpose(self.tensor.detach().cpu().numpy(), (1, 2, 0))
+        return ((img + 1) * 127.5).clip(0, 255).astype(np.uint8)
+
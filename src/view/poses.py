@@ -0,0 +1,94 @@
+"""
+Batched camera poses
+"""
+
+from typing import List
+
+import numpy as np
+
+from src.view.camera_view import CameraView
+
+
+class Poses:
+    """
+    N camera-to-world poses stored as one (N, 4, 4) array.
+    """
+
+    def __init__(self, c2w: np.ndarray):
+        self.c2w = np.asarray(c2w, dtype=np.float64).reshape(-1, 4, 4)
+
+    @classmethod
+    def from_views(cls, views: List[CameraView]) -> "Poses":
+        """
+        Stack the extrinsics of the views; views without extrinsics get
+        an identity pose.
+        """
+        c2w = np.tile(np.eye(4), (len(views), 1, 1))
+        for i, view in enumerate(views):
+            if view.extrinsics is not None:
+                c2w[i, : view.extrinsics.shape[0]] = view.extrinsics
+        return cls(c2w)
+
+    def __len__(self) -> int:
+        return len(self.c2w)
+
+    def __iter__(self):
+        return iter(self.c2w)
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        """
+        View of the i-th pose, changes to it are reflected in the batch.
+        """
+        return self.c2w[i]
+
+    def qvecs(self) -> np.ndarray:
+        """
+        (N, 4) world-to-camera rotations as [w, x, y, z] quaternions,
+        batched version of CameraView.qvec.
+        """
+        R = self.c2w[:, :3, :3]
+        Rxx, Rxy, Rxz = R[:, 0, 0], R[:, 0, 1], R[:, 0, 2]
+        Ryx, Ryy, Ryz = R[:, 1, 0], R[:, 1, 1], R[:, 1, 2]
+        Rzx, Rzy, Rzz = R[:, 2, 0], R[:, 2, 1], R[:, 2, 2]
+
+        K = (
+            np.stack(
+                [
+                    np.stack([Rxx - Ryy - Rzz, Ryx + Rxy, Rzx + Rxz, Ryz - Rzy], -1),
+                    np.stack([Ryx + Rxy, Ryy - Rxx - Rzz, Rzy + Ryz, Rzx - Rxz], -1),
+                    np.stack([Rzx + Rxz, Rzy + Ryz, Rzz - Rxx - Ryy, Rxy - Ryx], -1),
+                    np.stack([Ryz - Rzy, Rzx - Rxz, Rxy - Ryx, Rxx + Ryy + Rzz], -1),
+                ],
+                axis=1,
+            )
+            / 3.0
+        )
+
+        eigvals, eigvecs = np.linalg.eigh(K)
+        largest = np.argmax(eigvals, axis=1)
+        qvecs = eigvecs[np.arange(len(K)), :, largest][:, [3, 0, 1, 2]]
+        qvecs[qvecs[:, 0] < 0] *= -1
+        return qvecs
+
+    def tvecs(self) -> np.ndarray:
+        """
+        (N, 3) world-to-camera translations, batched version of CameraView.tvec.
+        """
+        R_w2c = np.transpose(self.c2w[:, :3, :3], (0, 2, 1))
+        t_c2w = self.c2w[:, :3, 3:]
+        return (-R_w2c @ t_c2w)[:, :, 0]
+
+    def __imul__(self, num: float) -> "Poses":
+        """
+        Scale the translations of all poses in place by a given factor.
+        """
+        self.c2w[:, :3, 3] *= num
+        return self
+
+    def __mul__(self, num: float) -> "Poses":
+        """
+        Scale the translations of all poses by a given factor.
+        """
+        new_poses = Poses(np.copy(self.c2w))
+        new_poses *= num
+        return new_poses
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# tests import the package as src.*, like the scripts do
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
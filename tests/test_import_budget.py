@@ -0,0 +1,115 @@
+"""
+Lightweight src.main commands stay lightweight: every command runs in a
+fresh interpreter, must not import a heavy module and must finish within
+the time budget.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+
+from src.utils.io import ColmapCameras, ColmapImages, ColmapPoints3D, write_model
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["torch", "open3d", "cv2", "fast3r"]
+BUDGET = 1.0
+
+# runs a command and reports the heavy modules it imported
+PROBE = """
+import json, sys
+from src.main import main
+try:
+    main(sys.argv[1:])
+except SystemExit as e:
+    if e.code:
+        raise
+heavy = [m for m in {heavy} if m in sys.modules]
+print(json.dumps(heavy))
+"""
+
+
+def make_model(dir, n_points=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    cameras = ColmapCameras(
+        ids=np.array([1], dtype=np.int32),
+        models=["PINHOLE"],
+        widths=np.array([512], dtype=np.uint64),
+        heights=np.array([384], dtype=np.uint64),
+        params=[np.array([400.0, 400.0, 256.0, 192.0])],
+    )
+    images = ColmapImages(
+        ids=np.arange(1, 4, dtype=np.int32),
+        qvecs=np.tile([1.0, 0.0, 0.0, 0.0], (3, 1)),
+        tvecs=rng.normal(size=(3, 3)),
+        camera_ids=np.ones(3, dtype=np.int32),
+        names=[f"IMG{i}.jpg" for i in range(1, 4)],
+        points2D_offsets=np.zeros(4, dtype=np.int64),
+        points2D_xy=np.empty((0, 2)),
+        points2D_point3D_ids=np.empty(0, dtype=np.int64),
+    )
+    points3D = ColmapPoints3D(
+        ids=np.arange(n_points, dtype=np.uint64),
+        xyz=rng.normal(size=(n_points, 3)),
+        rgb=rng.integers(0, 256, size=(n_points, 3)).astype(np.uint8),
+        error=np.zeros(n_points),
+        track_offsets=np.zeros(n_points + 1, dtype=np.int64),
+        track=np.empty((0, 2), dtype=np.int32),
+    )
+    write_model(cameras, images, points3D, dir, ext=".txt")
+
+
+def run_command(command):
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(heavy=HEAVY_MODULES), *command],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    assert result.returncode == 0, result.stderr
+    heavy = json.loads(result.stdout.strip().splitlines()[-1])
+    assert not heavy, f"{' '.join(command)} imported {', '.join(heavy)}"
+    assert elapsed <= BUDGET, f"{' '.join(command)} took {elapsed:.2f} s, budget {BUDGET:.2f} s"
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        ["--help"],
+        ["reconstruct", "--help"],
+        ["export", "--help"],
+        ["convert", "--help"],
+        ["inspect", "--help"],
+    ],
+    ids=" ".join,
+)
+def test_help(command):
+    run_command(command)
+
+
+@pytest.fixture(scope="module")
+def model(tmp_path_factory):
+    dir = tmp_path_factory.mktemp("budget")
+    make_model(str(dir / "model"))
+    return dir
+
+
+# every step uses the output of the one before
+CONVERSIONS = [
+    ["inspect", "{dir}/model"],
+    ["convert", "{dir}/model", "{dir}/bin", "--to", "bin"],
+    ["convert", "{dir}/bin", "{dir}/txt", "--to", "txt"],
+    ["convert", "{dir}/model", "{dir}/ply", "--to", "ply"],
+    ["inspect", "{dir}/ply/points3D.ply"],
+]
+
+
+@pytest.mark.parametrize("command", CONVERSIONS, ids=lambda c: " ".join(c).replace("{dir}/", ""))
+def test_model_commands(model, command):
+    run_command([arg.format(dir=model) for arg in command])
@@ -0,0 +1,210 @@
+"""
+Round trips of the COLMAP model and PLY readers and writers.
+"""
+
+import struct
+
+import numpy as np
+import pytest
+
+from src.utils.io import (
+    ColmapCameras,
+    ColmapImages,
+    ColmapPoints3D,
+    read_model,
+    read_ply,
+    write_model,
+    write_vertices_ply,
+)
+
+
+def make_model(track_lengths=(2, 0, 5, 1, 3)):
+    rng = np.random.default_rng(0)
+    cameras = ColmapCameras(
+        ids=np.array([1, 2], dtype=np.int32),
+        models=["PINHOLE", "SIMPLE_RADIAL"],
+        widths=np.array([640, 320], dtype=np.uint64),
+        heights=np.array([480, 240], dtype=np.uint64),
+        params=[np.array([500.0, 501.0, 320.0, 240.0]), np.array([250.0, 160.0, 120.0, 0.01])],
+    )
+    points2D_lengths = np.array([3, 0, 2])
+    points2D_offsets = np.concatenate([[0], np.cumsum(points2D_lengths)])
+    images = ColmapImages(
+        ids=np.array([1, 2, 3], dtype=np.int32),
+        qvecs=rng.normal(size=(3, 4)),
+        tvecs=rng.normal(size=(3, 3)),
+        camera_ids=np.array([1, 2, 1], dtype=np.int32),
+        names=["a.jpg", "b.png", "c.jpg"],
+        points2D_offsets=points2D_offsets,
+        points2D_xy=rng.uniform(0, 640, size=(points2D_offsets[-1], 2)),
+        points2D_point3D_ids=np.array([1, -1, 3, 4, -1], dtype=np.int64),
+    )
+    track_lengths = np.array(track_lengths, dtype=np.int64)
+    track_offsets = np.concatenate([[0], np.cumsum(track_lengths)])
+    num_points = len(track_lengths)
+    points3D = ColmapPoints3D(
+        ids=np.arange(1, num_points + 1, dtype=np.uint64),
+        xyz=rng.normal(size=(num_points, 3)),
+        rgb=rng.integers(0, 256, size=(num_points, 3)).astype(np.uint8),
+        error=rng.random(num_points),
+        track_offsets=track_offsets,
+        track=rng.integers(0, 100, size=(track_offsets[-1], 2)).astype(np.int32),
+    )
+    return cameras, images, points3D
+
+
+def empty_model():
+    return (
+        ColmapCameras(
+            ids=np.empty(0, np.int32),
+            models=[],
+            widths=np.empty(0, np.uint64),
+            heights=np.empty(0, np.uint64),
+            params=[],
+        ),
+        ColmapImages(
+            ids=np.empty(0, np.int32),
+            qvecs=np.empty((0, 4)),
+            tvecs=np.empty((0, 3)),
+            camera_ids=np.empty(0, np.int32),
+            names=[],
+            points2D_offsets=np.zeros(1, np.int64),
+            points2D_xy=np.empty((0, 2)),
+            points2D_point3D_ids=np.empty(0, np.int64),
+        ),
+        ColmapPoints3D(
+            ids=np.empty(0, np.uint64),
+            xyz=np.empty((0, 3)),
+            rgb=np.empty((0, 3), np.uint8),
+            error=np.empty(0),
+            track_offsets=np.zeros(1, np.int64),
+            track=np.empty((0, 2), np.int32),
+        ),
+    )
+
+
+def assert_models_equal(expected, actual):
+    for a, b in zip(expected, actual):
+        for field in a.__dataclass_fields__:
+            x, y = getattr(a, field), getattr(b, field)
+            if field == "params":
+                assert len(x) == len(y)
+                for p, q in zip(x, y):
+                    np.testing.assert_array_equal(p, q)
+            elif isinstance(x, list):
+                assert x == y
+            else:
+                np.testing.assert_array_equal(np.asarray(x), np.asarray(y), err_msg=field)
+
+
+@pytest.mark.parametrize("ext", [".bin", ".txt"])
+@pytest.mark.parametrize(
+    "model",
+    [make_model(), make_model((0, 0, 0)), make_model((1,)), empty_model()],
+    ids=["tracks", "no_tracks", "one_point", "empty"],
+)
+def test_model_round_trip(tmp_path, model, ext):
+    write_model(*model, str(tmp_path), ext=ext)
+    assert_models_equal(model, read_model(str(tmp_path)))
+    assert_models_equal(model, read_model(str(tmp_path), ext=ext))
+
+
+def test_write_model_rejects_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        write_model(*empty_model(), str(tmp_path), ext=".json")
+
+
+def reference_model_bytes(cameras, images, points3D):
+    """
+    COLMAP binary files of the model, packed field by field.
+    """
+    model_ids = {"PINHOLE": 1, "SIMPLE_RADIAL": 2}
+    cameras_bin = struct.pack("<Q", len(cameras.ids))
+    for id, model, width, height, params in zip(
+        cameras.ids, cameras.models, cameras.widths, cameras.heights, cameras.params
+    ):
+        cameras_bin += struct.pack("<iiQQ", id, model_ids[model], width, height)
+        cameras_bin += struct.pack(f"<{len(params)}d", *params)
+
+    images_bin = struct.pack("<Q", len(images.ids))
+    offsets = images.points2D_offsets
+    for i, name in enumerate(images.names):
+        images_bin += struct.pack(
+            "<i4d3di", images.ids[i], *images.qvecs[i], *images.tvecs[i], images.camera_ids[i]
+        )
+        images_bin += name.encode("utf-8") + b"\x00"
+        images_bin += struct.pack("<Q", offsets[i + 1] - offsets[i])
+        for j in range(offsets[i], offsets[i + 1]):
+            images_bin += struct.pack(
+                "<ddq", *images.points2D_xy[j], images.points2D_point3D_ids[j]
+            )
+
+    points3D_bin = struct.pack("<Q", len(points3D.ids))
+    offsets = points3D.track_offsets
+    for i in range(len(points3D.ids)):
+        points3D_bin += struct.pack(
+            "<Q3d3BdQ",
+            points3D.ids[i],
+            *points3D.xyz[i],
+            *points3D.rgb[i],
+            points3D.error[i],
+            offsets[i + 1] - offsets[i],
+        )
+        for image_id, point2D_idx in points3D.track[offsets[i] : offsets[i + 1]]:
+            points3D_bin += struct.pack("<ii", image_id, point2D_idx)
+
+    return {"cameras.bin": cameras_bin, "images.bin": images_bin, "points3D.bin": points3D_bin}
+
+
+@pytest.mark.parametrize("track_lengths", [(2, 0, 5, 1, 3), (0, 0)])
+def test_binary_writer_matches_struct_reference(tmp_path, track_lengths):
+    model = make_model(track_lengths)
+    write_model(*model, str(tmp_path), ext=".bin")
+    for name, expected in reference_model_bytes(*model).items():
+        assert (tmp_path / name).read_bytes() == expected, name
+
+
+@pytest.mark.parametrize("with_extras", [False, True])
+def test_ply_round_trip(tmp_path, with_extras):
+    rng = np.random.default_rng(0)
+    points = rng.normal(size=(100, 3))
+    colors = rng.integers(0, 256, size=(100, 3)).astype(np.uint8)
+    normals = rng.normal(size=(100, 3)) if with_extras else None
+    confidence = rng.random(100) if with_extras else None
+    path = str(tmp_path / "points3D.ply")
+    write_vertices_ply(path, points, colors, normals, confidence)
+
+    vertices = read_ply(path)
+    assert len(vertices) == 100
+    np.testing.assert_array_equal(
+        np.stack([vertices[axis] for axis in "xyz"], axis=1), points.astype(np.float32)
+    )
+    np.testing.assert_array_equal(
+        np.stack([vertices[channel] for channel in ("red", "green", "blue")], axis=1),
+        colors,
+    )
+    if with_extras:
+        np.testing.assert_array_equal(
+            np.stack([vertices[axis] for axis in ("nx", "ny", "nz")], axis=1),
+            normals.astype(np.float32),
+        )
+        np.testing.assert_array_equal(vertices["confidence"], confidence.astype(np.float32))
+    else:
+        assert vertices.dtype.names == ("x", "y", "z", "red", "green", "blue")
+
+
+@pytest.mark.parametrize(
+    "header, message",
+    [
+        (b"ply\nelement vertex 1\nproperty float x\nend_header\n", "Missing PLY format"),
+        (b"ply\nelement vertex 0\nend_header\n", "Missing PLY format"),
+        (b"ply\nformat ascii 1.0\nelement vertex 1\nproperty float x\nend_header\n", "Unsupported PLY format ascii"),
+        (b"not a ply\n", "not a PLY file"),
+    ],
+    ids=["no_format_with_properties", "no_format", "ascii", "not_ply"],
+)
+def test_read_ply_rejects_bad_headers(tmp_path, header, message):
+    path = tmp_path / "bad.ply"
+    path.write_bytes(header + b"1.0\n")
+    with pytest.raises(ValueError, match=message):
+        read_ply(str(path))
@@ -0,0 +1,64 @@
+"""
+Output stage error handling.
+"""
+
+import threading
+
+import pytest
+
+from src.pipeline.output import OutputStage
+
+
+def fail():
+    raise OSError("disk full")
+
+
+def test_wait_is_idempotent():
+    with OutputStage(max_workers=2) as stage:
+        stage.submit("a", lambda: None)
+        timings = stage.wait()
+        assert set(timings) == {"a"}
+        assert stage.wait() is timings
+
+
+def test_writer_failure_is_raised_once():
+    with pytest.raises(OSError, match="disk full"):
+        with OutputStage() as stage:
+            stage.submit("a", fail)
+            stage.wait()
+    # the context exit does not wait again
+    assert stage.wait() == {}
+
+
+def test_error_in_flight_is_not_hidden():
+    release = threading.Event()
+    with pytest.raises(KeyError):
+        with OutputStage(max_workers=1) as stage:
+            stage.submit("a", fail)
+            stage.submit("b", release.wait)
+            release.set()
+            raise KeyError("original")
+
+
+def test_duplicate_name_is_rejected():
+    with OutputStage() as stage:
+        stage.submit("a", lambda: None)
+        with pytest.raises(ValueError, match="already submitted"):
+            stage.submit("a", fail)
+    assert set(stage.timings) == {"a"}
+
+
+def test_submit_blocks_when_full():
+    release = threading.Event()
+    with OutputStage(max_workers=1, max_pending=2) as stage:
+        stage.submit("a", release.wait)
+        stage.submit("b", lambda: None)
+        third = threading.Thread(target=stage.submit, args=("c", lambda: None))
+        third.start()
+        third.join(0.2)
+        # a is running and b is queued, c waits for a slot
+        assert third.is_alive() and "c" not in stage.futures
+        release.set()
+        third.join(5)
+        assert not third.is_alive()
+    assert set(stage.timings) == {"a", "b", "c"}
@@ -0,0 +1,76 @@
+"""
+Chunked PnP pose estimation against the serial path.
+"""
+
+import numpy as np
+import pytest
+
+from src.pipeline.sfm.pnp import (
+    estimate_camera_poses,
+    first_view_focal,
+    ransac_iterations,
+)
+from src.utils.synthetic import synthetic_scene
+
+
+def first_view_scene(num_views=8):
+    """
+    Synthetic scene with the points in the camera frame of the first view,
+    like the global head of Fast3R, and the poses in that frame.
+    """
+    scene = synthetic_scene(num_views=num_views, height=48, width=64, noise=0.001)
+    w2c = np.linalg.inv(scene.camera_poses[0])
+    for pred in scene.output_dict["preds"]:
+        points = pred["pts3d_in_other_view"]
+        pred["pts3d_in_other_view"] = points @ points.new_tensor(
+            w2c[:3, :3].T
+        ) + points.new_tensor(w2c[:3, 3])
+    scene.camera_poses = w2c @ scene.camera_poses
+    return scene
+
+
+@pytest.mark.parametrize("early_stop", [False, True])
+@pytest.mark.parametrize("workers", [2, 3, 8, 64])
+def test_chunked_matches_serial(workers, early_stop):
+    scene = first_view_scene()
+    preds, focal = scene.output_dict["preds"], scene.focals[0][0]
+    serial_poses, serial_focals = estimate_camera_poses(
+        preds, niter_PnP=32, workers=1, early_stop=early_stop, focal=focal
+    )
+    poses, focals = estimate_camera_poses(
+        preds, niter_PnP=32, workers=workers, early_stop=early_stop, focal=focal
+    )
+
+    assert len(poses[0]) == len(serial_poses[0]) == len(preds)
+    for pose, serial_pose in zip(poses[0], serial_poses[0]):
+        np.testing.assert_array_equal(pose, serial_pose)
+    assert focals == serial_focals == [[focal] * len(preds)]
+
+
+def test_poses_match_ground_truth():
+    scene = first_view_scene()
+    poses, _ = estimate_camera_poses(
+        scene.output_dict["preds"], niter_PnP=32, workers=2, focal=scene.focals[0][0]
+    )
+    np.testing.assert_allclose(np.stack(poses[0]), scene.camera_poses, atol=1e-2)
+
+
+def test_first_view_focal():
+    pytest.importorskip("fast3r", exc_type=ImportError)
+    scene = first_view_scene()
+    focal = first_view_focal(scene.output_dict["preds"][0])
+    assert focal == pytest.approx(scene.focals[0][0], rel=0.01)
+
+
+def test_ransac_iterations():
+    preds = first_view_scene(4).output_dict["preds"]
+    for pred, scale in zip(preds, [0.1, 1.0, 10.0, 100.0]):
+        pred["conf"] = 1 + scale * pred["conf"].new_ones(pred["conf"].shape)
+    iterations = ransac_iterations(preds, max_iter=100, min_iter=8)
+
+    for n in iterations:
+        assert 8 <= n <= 100
+        assert n in (8, 100) or n & (n - 1) == 0
+    # more confident views need fewer iterations
+    assert iterations == sorted(iterations, reverse=True)
+    assert iterations[0] == 100 and iterations[-1] == 8
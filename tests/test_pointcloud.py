@@ -0,0 +1,77 @@
+"""
+Voxel grid accumulation in batches.
+"""
+
+import numpy as np
+import pytest
+
+from src.utils.pointcloud import VoxelGrid, voxel_downsample
+
+
+def make_points(n_points=20_000, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.normal(scale=0.2, size=(n_points, 3))
+    colors = rng.integers(0, 256, size=(n_points, 3)).astype(np.uint8)
+    confidence = 1 + rng.exponential(size=n_points)
+    return points, colors, confidence
+
+
+def brute_force(points, colors, confidence, voxel_size):
+    voxels = {}
+    for p, c, w in zip(points, colors, confidence):
+        key = tuple(np.floor(p / voxel_size).astype(np.int64))
+        sums = voxels.setdefault(key, np.zeros(8))
+        sums += np.r_[p * w, c * w, w, 1]
+    keys = sorted(voxels)
+    sums = np.array([voxels[key] for key in keys])
+    return sums[:, :3] / sums[:, 6:7], sums[:, 3:6] / sums[:, 6:7], sums[:, 6] / sums[:, 7]
+
+
+def test_voxel_downsample_matches_brute_force():
+    points, colors, confidence = make_points(2_000)
+    expected = brute_force(points, colors, confidence, 0.05)
+    for actual, wanted in zip(voxel_downsample(points, colors, 0.05, confidence), expected):
+        np.testing.assert_allclose(actual, wanted)
+
+
+@pytest.mark.parametrize("batches", [2, 7, 100])
+def test_batches_match_single_add(batches):
+    points, colors, confidence = make_points()
+    expected = voxel_downsample(points, colors, 0.02, confidence)
+
+    grid = VoxelGrid(0.02)
+    for idx in np.array_split(np.arange(len(points)), batches):
+        grid.add(points[idx], colors[idx], confidence[idx])
+    assert np.all(np.diff(grid.keys) > 0)
+    assert len(grid) == len(expected[0])
+    for actual, wanted in zip(grid.result(), expected):
+        np.testing.assert_allclose(actual, wanted, rtol=1e-12)
+
+
+def test_result_is_reproducible():
+    points, colors, confidence = make_points()
+    results = []
+    for _ in range(2):
+        grid = VoxelGrid(0.02)
+        for idx in np.array_split(np.arange(len(points)), 13):
+            grid.add(points[idx], colors[idx], confidence[idx])
+        results.append(grid.result())
+    for a, b in zip(*results):
+        np.testing.assert_array_equal(a, b)
+
+
+def test_empty_grid():
+    grid = VoxelGrid(0.1)
+    grid.add(np.empty((0, 3)), np.empty((0, 3)))
+    assert len(grid) == 0
+    points, colors, confidence = grid.result()
+    assert points.shape == (0, 3) and colors.shape == (0, 3) and confidence.shape == (0,)
+
+
+@pytest.mark.parametrize("voxel_size", [0.0, -0.1])
+def test_non_positive_voxel_size_is_rejected(voxel_size):
+    points, colors, _ = make_points(10)
+    with pytest.raises(ValueError, match="must be positive"):
+        VoxelGrid(voxel_size)
+    with pytest.raises(ValueError, match="must be positive"):
+        voxel_downsample(points, colors, voxel_size)
@@ -0,0 +1,28 @@
+"""
+Export of a reconstruction from a synthetic scene.
+"""
+
+import pytest
+
+pytest.importorskip("open3d", exc_type=ImportError)
+
+from src.pipeline.reconstruct import export_reconstruction
+from src.pipeline.sfm.fast3r import Fast3RSfM
+from src.utils.io import read_model
+from src.utils.synthetic import synthetic_scene
+
+
+@pytest.mark.parametrize("voxel_size", [0.0, 0.05])
+def test_export_reconstruction(tmp_path, voxel_size):
+    scene = synthetic_scene(num_views=4, height=48, width=64)
+    sfm = Fast3RSfM(scene.output_dict, scene.camera_poses, scene.focals)
+    export_reconstruction(sfm, str(tmp_path), confidence=0.5, voxel_size=voxel_size)
+
+    cameras, images, points3D = read_model(str(tmp_path), ext=".txt")
+    assert len(images.ids) == 4
+    # every pixel above the threshold is kept without downsampling
+    kept = 4 * int(48 * 64 * 0.5)
+    if voxel_size > 0:
+        assert 0 < len(points3D.ids) < kept
+    else:
+        assert len(points3D.ids) == kept
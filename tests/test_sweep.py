@@ -0,0 +1,35 @@
+"""
+Parameter sweep on a small synthetic scene.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("open3d", exc_type=ImportError)
+
+from src.pipeline.sfm.fast3r import Fast3RSfM
+from src.pipeline.sweep import grid_dir, sweep
+from src.utils.compact import CompactPointCloud
+from src.utils.io import read_points3D_txt
+from src.utils.synthetic import synthetic_scene
+
+
+def test_sweep_writes_compact_models(tmp_path):
+    scene = synthetic_scene(num_views=4, height=48, width=64)
+    sfm = Fast3RSfM(scene.output_dict, scene.camera_poses, scene.focals)
+    rows = sweep(sfm, str(tmp_path), [0.2, 0.5], [0.0, 0.05], compact=True)
+
+    assert len(rows) == 4
+    for row in rows:
+        dir = grid_dir(str(tmp_path), row["conf_thr"], row["voxel_size"])
+        points3D = read_points3D_txt(os.path.join(dir, "points3D.txt"))
+        pcd = CompactPointCloud.load(os.path.join(dir, "points3D.gspc"))
+        assert len(pcd) == len(points3D.ids) == row["points"]
+        points, _, confidence = pcd.decode()
+        assert confidence is not None and np.all(confidence >= 1)
+        # quantized, so only close to the text model, which keeps full precision
+        np.testing.assert_allclose(
+            np.sort(points, axis=0), np.sort(points3D.xyz, axis=0), atol=1e-3
+        )